@@ -0,0 +1,108 @@
+"""
+Minimal stand-in for the Telegram Bot API, for load tests.
+
+Answers every method the bot uses with a plausible result, counts calls per
+method (GET /calls returns the counts as JSON) and can add a fixed latency
+to every response. Point the bot at it with
+TELEGRAM_API_URL=http://127.0.0.1:<port>.
+
+    python bench/fake_bot_api.py --port 8081 --latency 0.05
+"""
+import asyncio
+import argparse
+import itertools
+import json
+import time
+from collections import Counter
+from aiohttp import web
+
+BOT_USER = {'id': 100000, 'is_bot': True, 'first_name': 'Bench', 'username': 'bench_confession_bot'}
+CHANNEL_ID = -1001000000000
+
+
+class FakeBotAPI:
+    def __init__(self, latency: float = 0.0, host: str = '127.0.0.1', port: int = 0):
+        self.latency = latency
+        self.host = host
+        self.port = port
+        self.calls: Counter = Counter()
+        self._message_ids = itertools.count(1)
+        self._runner = None
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_post('/bot{token}/{method}', self._handle)
+        app.router.add_get('/calls', self._calls)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        # Port 0 lets the OS pick a free one; read back what it chose.
+        self.port = site._server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        if self._runner:
+            await self._runner.cleanup()
+
+    def _chat(self, chat_id) -> dict:
+        if isinstance(chat_id, str) and not chat_id.lstrip('-').isdigit():
+            return {'id': CHANNEL_ID, 'type': 'channel', 'title': 'Bench', 'username': chat_id.lstrip('@')}
+        chat_id = int(chat_id)
+        if chat_id < 0:
+            return {'id': chat_id, 'type': 'channel', 'title': 'Bench'}
+        return {'id': chat_id, 'type': 'private', 'first_name': 'User'}
+
+    def _message(self, params: dict) -> dict:
+        message = {
+            'message_id': int(params.get('message_id') or next(self._message_ids)),
+            'date': int(time.time()),
+            'chat': self._chat(params.get('chat_id', CHANNEL_ID)),
+            'text': params.get('text', ''),
+        }
+        if params.get('reply_markup'):
+            message['reply_markup'] = json.loads(params['reply_markup'])
+        return message
+
+    async def _calls(self, request: web.Request) -> web.Response:
+        return web.json_response(dict(self.calls))
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        method = request.match_info['method']
+        self.calls[method] += 1
+        params = dict(await request.post())
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        lowered = method.lower()
+        if lowered == 'getme':
+            result = BOT_USER
+        elif lowered.startswith('send'):
+            result = self._message(params)
+        elif lowered.startswith('edit'):
+            # Inline messages have no chat; the API then returns True.
+            result = self._message(params) if 'chat_id' in params else True
+        else:
+            result = True
+        return web.json_response({'ok': True, 'result': result})
+
+
+def serve(port: int, latency: float = 0.0):
+    """Runs a server until the process is terminated."""
+    async def run():
+        api = FakeBotAPI(latency=latency, port=port)
+        await api.start()
+        await asyncio.Event().wait()
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fake Telegram Bot API for load tests.")
+    parser.add_argument('--port', type=int, default=8081)
+    parser.add_argument('--latency', type=float, default=0.0, help="Seconds added to every response")
+    args = parser.parse_args()
+    serve(args.port, args.latency)
@@ -0,0 +1,395 @@
+"""
+End-to-end load test.
+
+Runs bot/main.py's dispatcher in-process against a fake Bot API server
+(fake_bot_api.py, in its own process so it does not compete with the bot
+for the event loop) and a throwaway database, replays synthetic traffic
+and prints the results as JSON:
+
+    python bench/loadtest.py --database-url postgresql://postgres@localhost/postgres
+    python bench/loadtest.py --users 500 --output before.json
+
+The database URL must allow CREATE DATABASE: a fresh `confessions_bench_<pid>`
+database is created there, migrated, and dropped afterwards. Per scenario the
+report contains throughput, latency percentiles, database queries per update
+and Bot API calls per update, so two reports can be diffed across versions.
+
+Bot and outbound rate limits are lifted so that the bot itself is measured;
+pass --telegram-limits to keep the outbound limits.
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import logging
+import argparse
+import itertools
+import socket
+import subprocess
+import multiprocessing
+from urllib.parse import urlsplit, urlunsplit
+
+import asyncpg
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+BOT_DIR = os.path.join(BENCH_DIR, '..', 'bot')
+sys.path.insert(0, BOT_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+import fake_bot_api  # noqa: E402
+
+SETTLE_TIMEOUT = 30
+HOT_CONFESSION = "SELECT min(id) FROM confessions"
+UNLIMITED = '1000000000/1'
+
+
+# -------------------- Updates --------------------
+_update_ids = itertools.count(1)
+_message_ids = itertools.count(1)
+
+
+def _user(user_id: int) -> dict:
+    return {'id': user_id, 'is_bot': False, 'first_name': f'User{user_id}'}
+
+
+def message(user_id: int, text: str) -> dict:
+    return {
+        'update_id': next(_update_ids),
+        'message': {
+            'message_id': next(_message_ids),
+            'date': int(time.time()),
+            'chat': {'id': user_id, 'type': 'private', 'first_name': f'User{user_id}'},
+            'from': _user(user_id),
+            'text': text,
+        },
+    }
+
+
+def callback(user_id: int, data: str) -> dict:
+    return {
+        'update_id': next(_update_ids),
+        'callback_query': {
+            'id': str(next(_update_ids)),
+            'from': _user(user_id),
+            'chat_instance': str(user_id),
+            'data': data,
+            'message': {
+                'message_id': next(_message_ids),
+                'date': int(time.time()),
+                'chat': {'id': user_id, 'type': 'private', 'first_name': f'User{user_id}'},
+                'text': 'menu',
+            },
+        },
+    }
+
+
+# -------------------- Scenarios --------------------
+# A scenario returns sessions: lists of updates one user sends in order.
+# Sessions run concurrently, updates within a session one after another.
+
+def confession_burst(users: int, hot_id: int):
+    from main import CATEGORIES
+    return [
+        [
+            message(u, '/confess'),
+            callback(u, f'category:{CATEGORIES[u % len(CATEGORIES)]}'),
+            message(u, f'Load test confession from user {u}, with enough text to be realistic.'),
+        ]
+        for u in _user_ids(users)
+    ]
+
+
+def reaction_storm(users: int, hot_id: int):
+    return [
+        [callback(u, f'react:relatable:{hot_id}'), callback(u, f'react:support:{hot_id}')]
+        for u in _user_ids(users)
+    ]
+
+
+def comment_flood(users: int, hot_id: int):
+    return [
+        [
+            callback(u, f'givecomment:{hot_id}'),
+            message(u, f'/start comment_{hot_id}'),
+            message(u, f'Load test comment from user {u}.'),
+        ]
+        for u in _user_ids(users)
+    ]
+
+
+def comment_browsing(users: int, hot_id: int):
+    return [[callback(u, f'viewcomments:{hot_id}')] for u in _user_ids(users)]
+
+
+def leaderboard_spam(users: int, hot_id: int):
+    return [
+        [
+            message(u, '/leaderboard'),
+            callback(u, 'leaderboard:week'),
+            callback(u, 'leaderboard:day'),
+            callback(u, 'leaderboard:all'),
+        ]
+        for u in _user_ids(users)
+    ]
+
+
+def search_spam(users: int, hot_id: int):
+    return [
+        [
+            message(u, '/search load test confession'),
+            callback(u, 'search:-:1:load test confession'),
+            callback(u, 'search:0:0:load test confession'),
+        ]
+        for u in _user_ids(users)
+    ]
+
+
+SCENARIOS = {
+    'confession_burst': confession_burst,
+    'reaction_storm': reaction_storm,
+    'comment_flood': comment_flood,
+    'comment_browsing': comment_browsing,
+    'leaderboard_spam': leaderboard_spam,
+    'search_spam': search_spam,
+}
+
+_next_user = itertools.count(1_000_000)
+
+
+def _user_ids(count: int):
+    # Fresh users per scenario, so per-user state from earlier scenarios never interferes.
+    return [next(_next_user) for _ in range(count)]
+
+
+# -------------------- Measurement --------------------
+def _percentile(sorted_values, pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def _query_counts() -> dict:
+    import db
+    return {name: stats['count'] for name, stats in db.query_stats().items()}
+
+
+def _delta(after: dict, before: dict) -> dict:
+    return {k: v - before.get(k, 0) for k, v in sorted(after.items()) if v - before.get(k, 0)}
+
+
+async def _settle():
+    """Waits until buffered reactions, debounced edits and the outbound queue are done."""
+    import outbound
+    import markup_updater
+    import reactions
+    deadline = time.monotonic() + SETTLE_TIMEOUT
+    while time.monotonic() < deadline:
+        queue = outbound.stats()
+        idle = not reactions._pending and not reactions._flush_lock.locked()
+        if idle and not markup_updater._tasks and not queue['queue_depth'] and not queue['in_flight']:
+            return
+        await asyncio.sleep(0.1)
+
+
+async def run_scenario(dp, api: 'FakeAPIProcess', name: str, users: int, concurrency: int, hot_id: int) -> dict:
+    from aiogram import types
+
+    sessions = SCENARIOS[name](users, hot_id)
+    latencies = []
+    errors = 0
+    slots = asyncio.Semaphore(concurrency)
+
+    async def run_session(updates):
+        nonlocal errors
+        async with slots:
+            for update in updates:
+                start = time.perf_counter()
+                try:
+                    # A task per update, as in the webhook worker: aiogram caches
+                    # the FSM state in a context variable for the current context.
+                    await asyncio.create_task(dp.process_update(types.Update(**update)))
+                except Exception as e:
+                    errors += 1
+                    logging.warning(f"{name}: update failed: {e!r}")
+                latencies.append(time.perf_counter() - start)
+
+    queries_before, calls_before = _query_counts(), await api.calls()
+    started = time.perf_counter()
+    await asyncio.gather(*(run_session(s) for s in sessions))
+    elapsed = time.perf_counter() - started
+    await _settle()
+    queries = _delta(_query_counts(), queries_before)
+    calls = _delta(await api.calls(), calls_before)
+
+    count = len(latencies)
+    latencies.sort()
+    return {
+        'users': users,
+        'updates': count,
+        'errors': errors,
+        'seconds': round(elapsed, 4),
+        'updates_per_second': round(count / elapsed, 1) if elapsed else 0.0,
+        'latency_ms': {
+            'p50': round(_percentile(latencies, 50) * 1000, 3),
+            'p90': round(_percentile(latencies, 90) * 1000, 3),
+            'p99': round(_percentile(latencies, 99) * 1000, 3),
+            'max': round(latencies[-1] * 1000, 3) if latencies else 0.0,
+        },
+        'db_queries_per_update': round(sum(queries.values()) / count, 3) if count else 0.0,
+        'api_calls_per_update': round(sum(calls.values()) / count, 3) if count else 0.0,
+        'db_queries': queries,
+        'api_calls': calls,
+    }
+
+
+# -------------------- Setup --------------------
+class FakeAPIProcess:
+    """fake_bot_api.FakeBotAPI served from a separate process."""
+
+    def __init__(self, latency: float):
+        with socket.socket() as sock:
+            sock.bind(('127.0.0.1', 0))
+            self.port = sock.getsockname()[1]
+        self.url = f"http://127.0.0.1:{self.port}"
+        self._process = multiprocessing.get_context('spawn').Process(
+            target=fake_bot_api.serve, args=(self.port, latency), name='fake-bot-api', daemon=True
+        )
+
+    async def start(self):
+        import aiohttp
+        self._process.start()
+        self._session = aiohttp.ClientSession()
+        for _ in range(100):
+            try:
+                await self.calls()
+                return
+            except aiohttp.ClientError:
+                await asyncio.sleep(0.1)
+        raise RuntimeError("The fake Bot API did not start")
+
+    async def calls(self) -> dict:
+        async with self._session.get(self.url + '/calls') as response:
+            return await response.json()
+
+    async def stop(self):
+        await self._session.close()
+        self._process.terminate()
+        self._process.join()
+
+
+def _with_database(url: str, name: str) -> str:
+    parts = urlsplit(url)
+    return urlunsplit(parts._replace(path='/' + name))
+
+
+def _git_revision() -> str:
+    try:
+        return subprocess.run(
+            ['git', 'describe', '--always', '--dirty'], cwd=BENCH_DIR,
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def _configure(args, api_url: str, database_url: str):
+    """Sets the bot's environment; must run before main/config are imported."""
+    from cryptography.fernet import Fernet
+
+    os.environ.update({
+        'BOT_TOKEN': '123456:load-test-token',
+        'CHANNEL_USERNAME': '@bench_channel',
+        'DATABASE_URL': database_url,
+        'FERNET_KEY': Fernet.generate_key().decode(),
+        'TELEGRAM_API_URL': api_url,
+        'FSM_STORAGE': 'memory',
+        'RATE_LIMIT_BACKEND': 'memory',
+        'MIGRATE_ON_STARTUP': '1',
+        'METRICS_PORT': '0',
+        'MARKUP_EDIT_WINDOW': str(args.edit_window),
+    })
+    os.environ.pop('MODERATION_RULES_FILE', None)
+    for action in ('CONFESS', 'REACT', 'COMMENT', 'VIEW'):
+        os.environ[f'RATE_LIMIT_{action}'] = UNLIMITED
+    if not args.telegram_limits:
+        for name in ('OUTBOUND_GLOBAL_RATE', 'OUTBOUND_CHAT_RATE', 'OUTBOUND_GROUP_RATE'):
+            os.environ[name] = '1000000'
+
+
+async def main(args):
+    admin_url = args.database_url or os.getenv('BENCH_DATABASE_URL')
+    if not admin_url:
+        sys.exit("Pass --database-url or set BENCH_DATABASE_URL.")
+    db_name = f"confessions_bench_{os.getpid()}"
+    admin = await asyncpg.connect(admin_url)
+    await admin.execute(f'CREATE DATABASE "{db_name}"')
+
+    api = FakeAPIProcess(latency=args.api_latency / 1000)
+    await api.start()
+    try:
+        _configure(args, api.url, _with_database(admin_url, db_name))
+        from aiogram import Bot, Dispatcher
+        import main as bot_main
+        import db
+
+        dp = bot_main.dp
+        Bot.set_current(dp.bot)
+        Dispatcher.set_current(dp)
+        await bot_main.on_startup(dp)
+        try:
+            report = {
+                'revision': _git_revision(),
+                'settings': {
+                    'users': args.users,
+                    'concurrency': args.concurrency,
+                    'api_latency_ms': args.api_latency,
+                    'edit_window': args.edit_window,
+                    'telegram_limits': args.telegram_limits,
+                },
+                'scenarios': {},
+            }
+            hot_id = 0
+            for name in args.scenarios:
+                if not hot_id and name != 'confession_burst':
+                    # Everything else targets one hot confession; make sure it exists.
+                    await run_scenario(dp, api, 'confession_burst', 1, 1, 0)
+                    hot_id = await db.fetchval(HOT_CONFESSION)
+                result = await run_scenario(dp, api, name, args.users, args.concurrency, hot_id)
+                hot_id = hot_id or await db.fetchval(HOT_CONFESSION)
+                report['scenarios'][name] = result
+                print(
+                    f"{name:>18}: {result['updates_per_second']:>8} upd/s  "
+                    f"p50 {result['latency_ms']['p50']:>7} ms  p99 {result['latency_ms']['p99']:>7} ms  "
+                    f"{result['db_queries_per_update']} q/upd  {result['api_calls_per_update']} api/upd  "
+                    f"{result['errors']} errors",
+                    file=sys.stderr
+                )
+        finally:
+            await bot_main.on_shutdown(dp)
+            await (await dp.bot.get_session()).close()
+    finally:
+        await api.stop()
+        await admin.execute(f'DROP DATABASE IF EXISTS "{db_name}" WITH (FORCE)')
+        await admin.close()
+
+    output = json.dumps(report, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load test the bot against a fake Bot API and a throwaway database.")
+    parser.add_argument('--database-url', help="Postgres URL allowed to CREATE DATABASE (default: $BENCH_DATABASE_URL)")
+    parser.add_argument('--users', type=int, default=200, help="Simulated users per scenario")
+    parser.add_argument('--concurrency', type=int, default=64, help="Users served concurrently")
+    parser.add_argument('--api-latency', type=float, default=0.0, help="Milliseconds added to every fake Bot API response")
+    parser.add_argument('--edit-window', type=float, default=0.5, help="MARKUP_EDIT_WINDOW used during the run")
+    parser.add_argument('--telegram-limits', action='store_true', help="Keep the outbound Bot API rate limits")
+    parser.add_argument('--scenarios', nargs='+', choices=list(SCENARIOS), default=list(SCENARIOS))
+    parser.add_argument('--output', help="Write the JSON report to this file instead of stdout")
+    asyncio.run(main(parser.parse_args()))
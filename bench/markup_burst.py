@@ -0,0 +1,94 @@
+"""
+Keyboard edits caused by a burst of reactions on one channel post.
+
+Replays a burst of reactions (1,000 by default, spread evenly over
+--duration seconds) against markup_updater with a fake bot that only counts
+edit_message_reply_markup calls, and prints how many edits reached the Bot
+API. "per-reaction" is the behaviour before the debounced scheduler: one
+edit per reaction. Every --window value is then measured with the debounced
+scheduler. No database or network is involved.
+
+    python bench/markup_burst.py
+    python bench/markup_burst.py --reactions 1000 --duration 10 --window 0.5 2 5
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH_DIR, '..', 'bot'))
+
+CHAT_ID = -1001000000000
+MESSAGE_ID = 42
+CONF_ID = 1
+
+
+class CountingBot:
+    """Stands in for aiogram's Bot; records the counters each edit carried."""
+
+    def __init__(self):
+        self.edits = []
+
+    async def edit_message_reply_markup(self, chat_id, message_id, reply_markup):
+        self.edits.append(reply_markup.inline_keyboard[0][0].text)
+        return True
+
+
+async def burst(reactions: int, duration: float, window) -> dict:
+    """Sends `reactions` keyboard updates; window=None edits once per reaction."""
+    import markup_updater
+    import outbound
+    from main import confession_keyboard
+
+    bot = CountingBot()
+    markup_updater.init_updater(bot)
+    markup_updater.MARKUP_EDIT_WINDOW = window or 0
+    outbound.start_outbound()
+    started = time.perf_counter()
+    pause = duration / reactions
+    for n in range(1, reactions + 1):
+        markup = confession_keyboard(CONF_ID, relatable=n)
+        if window is None:
+            await outbound.send(
+                outbound.CHANNEL_POST, CHAT_ID, bot.edit_message_reply_markup,
+                chat_id=CHAT_ID, message_id=MESSAGE_ID, reply_markup=markup
+            )
+        else:
+            markup_updater.schedule_markup_edit(CONF_ID, CHAT_ID, MESSAGE_ID, markup)
+        await asyncio.sleep(pause)
+    while markup_updater._tasks:
+        await asyncio.sleep(0.01)
+    await outbound.stop_outbound()
+    return {
+        'window': 'per-reaction' if window is None else window,
+        'reactions': reactions,
+        'edits': len(bot.edits),
+        'last_edit': bot.edits[-1] if bot.edits else None,
+        'seconds': round(time.perf_counter() - started, 2),
+    }
+
+
+async def main(args):
+    results = []
+    for window in [None] + args.window:
+        result = await burst(args.reactions, args.duration, window)
+        results.append(result)
+        print(f"{str(result['window']):>13}: {result['edits']:>5} edits for {result['reactions']} reactions, "
+              f"last edit shows {result['last_edit']!r}", file=sys.stderr)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Count keyboard edits for a burst of reactions.")
+    parser.add_argument('--reactions', type=int, default=1000)
+    parser.add_argument('--duration', type=float, default=10.0, help="Seconds the burst is spread over")
+    parser.add_argument('--window', type=float, nargs='+', default=[0.5, 2.0], help="MARKUP_EDIT_WINDOW values to measure")
+    args = parser.parse_args()
+    # Lift the outbound limits so only the coalescing is measured; main.py needs a token to import.
+    for name in ('OUTBOUND_GLOBAL_RATE', 'OUTBOUND_CHAT_RATE', 'OUTBOUND_GROUP_RATE'):
+        os.environ[name] = '1000000'
+    os.environ.setdefault('BOT_TOKEN', '123456:markup-burst-token')
+    asyncio.run(main(args))
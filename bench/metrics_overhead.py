@@ -0,0 +1,138 @@
+"""
+Hot-path cost of the instrumentation in metrics.py.
+
+Measures, best of --repeat runs:
+  * an update through aiogram's dispatcher to an empty handler, without and
+    with MetricsMiddleware (messages and callback queries);
+  * a single Histogram.observe;
+  * with --database-url, `SELECT 1` through an instrumented db.Session
+    against the same call on the bare connection.
+The handlers are empty on purpose: real ones spend milliseconds in Postgres
+and the Bot API, so the relative overhead here is an upper bound.
+
+    python bench/metrics_overhead.py
+    python bench/metrics_overhead.py --updates 20000 --database-url postgresql://postgres@localhost/postgres
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH_DIR, '..', 'bot'))
+
+MESSAGE = {'update_id': 1, 'message': {
+    'message_id': 1, 'date': 0, 'text': 'hello',
+    'chat': {'id': 5, 'type': 'private'}, 'from': {'id': 5, 'is_bot': False, 'first_name': 'a'},
+}}
+CALLBACK = {'update_id': 2, 'callback_query': {
+    'id': '1', 'chat_instance': '1', 'data': 'noop',
+    'from': {'id': 5, 'is_bot': False, 'first_name': 'a'},
+}}
+
+
+def _dispatcher(instrumented: bool):
+    from aiogram import Bot, Dispatcher
+    import metrics
+
+    dp = Dispatcher(Bot(token=os.environ['BOT_TOKEN']))
+    if instrumented:
+        dp.middleware.setup(metrics.MetricsMiddleware())
+
+    @dp.message_handler()
+    async def on_message(m):
+        pass
+
+    @dp.callback_query_handler()
+    async def on_callback(cb):
+        pass
+
+    return dp
+
+
+async def _per_update(dp, raw: dict, updates: int, repeat: int) -> float:
+    from aiogram import Bot, Dispatcher, types
+
+    Bot.set_current(dp.bot)
+    Dispatcher.set_current(dp)
+    best = float('inf')
+    for _ in range(repeat):
+        batch = [types.Update(**raw) for _ in range(updates)]
+        started = time.perf_counter()
+        for update in batch:
+            await dp.process_update(update)
+        best = min(best, (time.perf_counter() - started) / updates)
+    await (await dp.bot.get_session()).close()
+    return best
+
+
+def _observe(calls: int, repeat: int) -> float:
+    import metrics
+
+    histogram = metrics.Histogram('bench_seconds', 'Benchmark', ('label',))
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for _ in range(calls):
+            histogram.observe(0.003, 'x')
+        best = min(best, (time.perf_counter() - started) / calls)
+    return best
+
+
+async def _database(url: str, calls: int, repeat: int) -> dict:
+    import asyncpg
+    import db
+
+    conn = await asyncpg.connect(url)
+    try:
+        session = db.Session(conn)
+        raw = instrumented = float('inf')
+        for _ in range(repeat):
+            started = time.perf_counter()
+            for _ in range(calls):
+                await conn.fetchval('SELECT 1')
+            raw = min(raw, (time.perf_counter() - started) / calls)
+            started = time.perf_counter()
+            for _ in range(calls):
+                await session.fetchval('SELECT 1')
+            instrumented = min(instrumented, (time.perf_counter() - started) / calls)
+    finally:
+        await conn.close()
+    return {'raw_us': round(raw * 1e6, 1), 'instrumented_us': round(instrumented * 1e6, 1)}
+
+
+async def main(args):
+    report = {'dispatcher': {}}
+    for name, raw in (('message', MESSAGE), ('callback_query', CALLBACK)):
+        plain = await _per_update(_dispatcher(False), raw, args.updates, args.repeat)
+        instrumented = await _per_update(_dispatcher(True), raw, args.updates, args.repeat)
+        report['dispatcher'][name] = {
+            'plain_us': round(plain * 1e6, 1),
+            'instrumented_us': round(instrumented * 1e6, 1),
+            'overhead_us': round((instrumented - plain) * 1e6, 1),
+        }
+        print(f"{name:>15}: {plain * 1e6:6.1f} us -> {instrumented * 1e6:6.1f} us per update "
+              f"(+{(instrumented - plain) * 1e6:.1f} us)", file=sys.stderr)
+
+    report['histogram_observe_us'] = round(_observe(args.updates * 10, args.repeat) * 1e6, 2)
+    print(f"{'observe':>15}: {report['histogram_observe_us']} us per call", file=sys.stderr)
+
+    if args.database_url:
+        report['select_1'] = await _database(args.database_url, args.queries, args.repeat)
+        print(f"{'SELECT 1':>15}: {report['select_1']['raw_us']} us -> "
+              f"{report['select_1']['instrumented_us']} us per call", file=sys.stderr)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure the hot-path cost of metrics.py.")
+    parser.add_argument('--updates', type=int, default=10_000, help="Updates per run through each dispatcher")
+    parser.add_argument('--queries', type=int, default=2_000, help="Queries per run with --database-url")
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--database-url', help="Also time SELECT 1 through db.Session")
+    args = parser.parse_args()
+    # config.py needs a token to import.
+    os.environ.setdefault('BOT_TOKEN', '123456:metrics-overhead-token')
+    asyncio.run(main(args))
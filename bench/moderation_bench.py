@@ -0,0 +1,90 @@
+"""
+Moderation throughput against blocklist size.
+
+Builds a moderation Engine for each --sizes value (random words, split
+between a redact and a reject list) and runs a fixed set of messages
+through it, printing the build time and messages checked per second. The
+messages mix clean text, links, phone numbers, dates and blocklisted words.
+No database or network is involved.
+
+    python bench/moderation_bench.py
+    python bench/moderation_bench.py --sizes 0 1000 100000 --messages 20000
+"""
+import os
+import sys
+import json
+import time
+import random
+import string
+import argparse
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH_DIR, '..', 'bot'))
+
+SENTENCES = [
+    "I failed my exam again and I have not told my parents yet",
+    "my boss keeps calling me on weekends, I was born 12.03.1995 and I feel 60",
+    "call me at +1 (555) 123-4567 or write to someone@example.com",
+    "check out example.com/deal and t.me/somechannel for more",
+    "I hate my job.co-workers are fine though, score 100000",
+    "between 1990-2000 everything was easier, see you 2024-10-17",
+]
+
+
+def _words(count: int, rng: random.Random) -> list:
+    words = set()
+    while len(words) < count:
+        words.add(''.join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(4, 10))))
+    return sorted(words)
+
+
+def measure(size: int, messages: int, rng: random.Random) -> dict:
+    from moderation import Engine, REDACT, REJECT
+
+    words = _words(size, rng)
+    started = time.perf_counter()
+    engine = Engine({('bench', REDACT): words[::2], ('bench-reject', REJECT): words[1::2]})
+    build = time.perf_counter() - started
+
+    texts = []
+    for n in range(messages):
+        text = SENTENCES[n % len(SENTENCES)]
+        if words and n % 3 == 0:
+            text += ' ' + rng.choice(words)
+        texts.append(text)
+    flagged = 0
+    started = time.perf_counter()
+    for text in texts:
+        if engine.check(text).spans:
+            flagged += 1
+    elapsed = time.perf_counter() - started
+    return {
+        'blocklist': size,
+        'build_seconds': round(build, 3),
+        'messages': messages,
+        'flagged': flagged,
+        'messages_per_second': round(messages / elapsed),
+    }
+
+
+def main(args):
+    rng = random.Random(args.seed)
+    results = []
+    for size in args.sizes:
+        result = measure(size, args.messages, rng)
+        results.append(result)
+        print(f"{result['blocklist']:>7} entries: built in {result['build_seconds']:.3f}s, "
+              f"{result['messages_per_second']:>7} messages/s", file=sys.stderr)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure moderation throughput against blocklist size.")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[0, 100, 1000, 10_000, 100_000],
+                        help="Blocklist sizes to measure")
+    parser.add_argument('--messages', type=int, default=10_000)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+    # config.py needs a token to import.
+    os.environ.setdefault('BOT_TOKEN', '123456:moderation-bench-token')
+    main(args)
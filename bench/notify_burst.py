@@ -0,0 +1,131 @@
+"""
+Author notifications sent for a burst of reactions.
+
+Replays a burst of reactions (1,000 by default, over 20 confessions of 5
+authors, spread evenly over --duration seconds) through notifier.py and
+prints how many messages reached the authors, per 1,000 reactions.
+"per-reaction" is the behaviour before notifier.py: one message per
+reaction. Each --duration value is then measured with the batched
+notifier, including the digests sent when it stops. The notifier's clock
+is simulated, so long bursts take no time; the claim query and the Bot API
+are stubbed. No database or network is involved.
+
+    python bench/notify_burst.py
+    python bench/notify_burst.py --reactions 1000 --duration 10 600 3600
+"""
+import os
+import sys
+import json
+import asyncio
+import argparse
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH_DIR, '..', 'bot'))
+
+
+class Clock:
+    """Stands in for the time module inside notifier.py."""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def monotonic(self) -> float:
+        return self.now
+
+
+class CountingBot:
+    """Stands in for aiogram's Bot; records who got a message and when."""
+
+    def __init__(self, clock: Clock):
+        self.clock = clock
+        self.messages = []
+
+    async def send_message(self, chat_id, text, **kwargs):
+        self.messages.append((self.clock.now, chat_id))
+        return True
+
+
+async def burst(args, duration) -> dict:
+    import notifier
+
+    clock = Clock()
+    bot = CountingBot(clock)
+    messages = bot.messages
+    last_notified = {}  # confession id -> last_notified_count, as in the database
+
+    async def claim(sql, ids, engagements):
+        # Same effect as CLAIM_NOTIFICATIONS.
+        claimed = []
+        for conf_id, engagement in zip(ids, engagements):
+            if last_notified.get(conf_id, 0) < engagement:
+                last_notified[conf_id] = engagement
+                claimed.append({'id': conf_id})
+        return claimed
+
+    async def send(priority, chat_id, call, /, *call_args, **kwargs):
+        # Straight to the bot: the outbound limits are not what is measured here.
+        return await call(*call_args, **kwargs)
+
+    notifier.time = clock
+    notifier.fetch = claim
+    notifier.send = send
+    notifier.CHANNEL_USERNAME = '@bench'
+    notifier._bot = bot
+    notifier._pending.clear()
+    notifier._last_sent.clear()
+
+    engagement = {}
+    next_tick = notifier.TICK
+    if duration is None:
+        sent = args.reactions
+    else:
+        for n in range(args.reactions):
+            at = duration * n / args.reactions
+            while next_tick <= at:
+                clock.now = next_tick
+                await notifier._flush()
+                next_tick += notifier.TICK
+            clock.now = at
+            conf_id = 1 + n % args.confessions
+            engagement[conf_id] = engagement.get(conf_id, 0) + 1
+            notifier.record(conf_id % args.authors, conf_id, conf_id, engagement[conf_id], last_notified.get(conf_id, 0))
+        while next_tick <= duration:
+            clock.now = next_tick
+            await notifier._flush()
+            next_tick += notifier.TICK
+        during = len(messages)
+        await notifier._flush(force=True)
+        sent = len(messages)
+    result = {
+        'duration': 'per-reaction' if duration is None else duration,
+        'reactions': args.reactions,
+        'messages': sent,
+        'messages_per_1000_reactions': round(sent * 1000 / args.reactions, 1),
+    }
+    if duration is not None:
+        result['sent_at_shutdown'] = sent - during
+    return result
+
+
+async def main(args):
+    results = []
+    for duration in [None] + args.duration:
+        result = await burst(args, duration)
+        results.append(result)
+        shutdown = f" ({result['sent_at_shutdown']} at shutdown)" if 'sent_at_shutdown' in result else ''
+        print(f"{str(result['duration']):>13}: {result['messages']:>5} messages for {result['reactions']} reactions"
+              f"{shutdown}", file=sys.stderr)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Count author notifications for a burst of reactions.")
+    parser.add_argument('--reactions', type=int, default=1000)
+    parser.add_argument('--confessions', type=int, default=20)
+    parser.add_argument('--authors', type=int, default=5)
+    parser.add_argument('--duration', type=float, nargs='+', default=[10.0, 600.0, 3600.0],
+                        help="Seconds the burst is spread over (simulated)")
+    args = parser.parse_args()
+    # config.py needs a token to import.
+    os.environ.setdefault('BOT_TOKEN', '123456:notify-burst-token')
+    asyncio.run(main(args))
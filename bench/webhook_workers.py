@@ -0,0 +1,221 @@
+"""
+Webhook throughput with one worker process versus several.
+
+Starts the real webhook front (bot/webhook.py) once per --workers value,
+against the same fake Bot API and throwaway database as loadtest.py, and
+posts loadtest.py's callback scenarios (a reaction storm and comment
+browsing on one hot post) to the endpoint over HTTP. The endpoint answers
+as soon as an update is queued, so an update counts as handled once the
+bot answered its callback query; throughput is callbacks answered per
+second, from the first request to the last answer. The channel keyboard
+edits sent for the hot post are reported too; they should not grow with
+the number of workers.
+
+    python bench/webhook_workers.py --database-url postgresql://postgres@localhost/postgres
+    python bench/webhook_workers.py --workers 1 4 --users 500 --api-latency 50
+
+Each sequence of a user's updates is posted in order; a 503 (worker queue
+full) is retried after a short pause, as Telegram would. The numbers only
+mean something relative to each other and to the number of CPU cores
+available: on a single core, extra workers only help while updates wait on
+the Bot API or the database (--api-latency).
+"""
+import os
+import sys
+import json
+import time
+import signal
+import asyncio
+import argparse
+import subprocess
+import tempfile
+
+import aiohttp
+import asyncpg
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCH_DIR)
+
+import loadtest  # noqa: E402  (also puts bot/ on sys.path)
+
+SECRET = 'bench-webhook-secret'
+SCENARIOS = ('reaction_storm', 'comment_browsing')
+READY_TIMEOUT = 60
+RETRY_PAUSE = 0.05
+
+
+def _free_port() -> int:
+    import socket
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+class WebhookProcess:
+    """`python webhook.py` with the given number of workers."""
+
+    def __init__(self, workers: int, spool_dir: str):
+        self.port = _free_port()
+        self.url = f"http://127.0.0.1:{self.port}/webhook"
+        env = dict(
+            os.environ,
+            WEBHOOK_WORKERS=str(workers),
+            WEBHOOK_SECRET=SECRET,
+            WEBAPP_HOST='127.0.0.1',
+            WEBAPP_PORT=str(self.port),
+            REACTION_SPOOL_FILE=os.path.join(spool_dir, 'reactions.spool'),
+        )
+        env.pop('WEBHOOK_HOST', None)
+        self._process = subprocess.Popen([sys.executable, 'webhook.py'], cwd=loadtest.BOT_DIR, env=env)
+
+    def stop(self):
+        # SIGINT stops the front, which then drains and joins the workers.
+        self._process.send_signal(signal.SIGINT)
+        self._process.wait(timeout=loadtest.SETTLE_TIMEOUT + 30)
+
+
+async def _post(session: aiohttp.ClientSession, url: str, update: dict):
+    headers = {'X-Telegram-Bot-Api-Secret-Token': SECRET}
+    while True:
+        try:
+            async with session.post(url, json=update, headers=headers) as response:
+                if response.status == 200:
+                    return
+                if response.status != 503:
+                    raise RuntimeError(f"Webhook answered {response.status}")
+        except aiohttp.ClientConnectionError:
+            pass  # not listening yet
+        await asyncio.sleep(RETRY_PAUSE)
+
+
+async def _wait_for(api: loadtest.FakeAPIProcess, method: str, count: int, timeout: float) -> bool:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if (await api.calls()).get(method, 0) >= count:
+            return True
+        await asyncio.sleep(0.02)
+    return False
+
+
+async def run(workers: int, args, api: loadtest.FakeAPIProcess, database_url: str) -> dict:
+    with tempfile.TemporaryDirectory() as spool_dir:
+        webhook = WebhookProcess(workers, spool_dir)
+        try:
+            async with aiohttp.ClientSession() as session:
+                # Warm up: one confession through the webhook, which also waits
+                # for every worker to have migrated and started.
+                conn = await asyncpg.connect(database_url)
+                try:
+                    for update in loadtest.confession_burst(1, 0)[0]:
+                        await _post(session, webhook.url, update)
+                    deadline = time.monotonic() + READY_TIMEOUT
+                    hot_id = None
+                    while hot_id is None and time.monotonic() < deadline:
+                        await asyncio.sleep(0.1)
+                        try:
+                            hot_id = await conn.fetchval(loadtest.HOT_CONFESSION)
+                        except asyncpg.UndefinedTableError:
+                            pass
+                finally:
+                    await conn.close()
+                if hot_id is None:
+                    raise RuntimeError(f"{workers} worker(s): no confession was posted within {READY_TIMEOUT}s")
+                # Every worker answers one callback before the clock starts.
+                warmup = [loadtest.callback(u, 'leaderboard:all') for u in range(1, workers * 4 + 1)]
+                target = (await api.calls()).get('answerCallbackQuery', 0) + len(warmup)
+                await asyncio.gather(*(_post(session, webhook.url, u) for u in warmup))
+                await _wait_for(api, 'answerCallbackQuery', target, READY_TIMEOUT)
+
+                sessions = [s for name in SCENARIOS for s in loadtest.SCENARIOS[name](args.users, hot_id)]
+                updates = sum(len(s) for s in sessions)
+                slots = asyncio.Semaphore(args.concurrency)
+
+                async def send_session(updates_in_order):
+                    async with slots:
+                        for update in updates_in_order:
+                            await _post(session, webhook.url, update)
+
+                before = await api.calls()
+                answered = before.get('answerCallbackQuery', 0)
+                started = time.perf_counter()
+                await asyncio.gather(*(send_session(s) for s in sessions))
+                posted = time.perf_counter() - started
+                done = await _wait_for(api, 'answerCallbackQuery', answered + updates, loadtest.SETTLE_TIMEOUT)
+                elapsed = time.perf_counter() - started
+                handled = (await api.calls()).get('answerCallbackQuery', 0) - answered
+        finally:
+            webhook.stop()
+    # Counted after the workers flushed their pending edits on shutdown.
+    edits = (await api.calls()).get('editMessageReplyMarkup', 0) - before.get('editMessageReplyMarkup', 0)
+    return {
+        'workers': workers,
+        'updates': updates,
+        'handled': handled,
+        'completed': done,
+        'seconds': round(elapsed, 3),
+        'post_seconds': round(posted, 3),
+        'updates_per_second': round(handled / elapsed, 1) if elapsed else 0.0,
+        'keyboard_edits': edits,
+    }
+
+
+async def main(args):
+    admin_url = args.database_url or os.getenv('BENCH_DATABASE_URL')
+    if not admin_url:
+        sys.exit("Pass --database-url or set BENCH_DATABASE_URL.")
+    api = loadtest.FakeAPIProcess(latency=args.api_latency / 1000)
+    await api.start()
+    admin = await asyncpg.connect(admin_url)
+    results = []
+    try:
+        for workers in args.workers:
+            # A fresh database per run, so later runs don't read a bigger one.
+            db_name = f"confessions_bench_{os.getpid()}_{workers}"
+            await admin.execute(f'CREATE DATABASE "{db_name}"')
+            try:
+                database_url = loadtest._with_database(admin_url, db_name)
+                loadtest._configure(args, api.url, database_url)
+                result = await run(workers, args, api, database_url)
+            finally:
+                await admin.execute(f'DROP DATABASE IF EXISTS "{db_name}" WITH (FORCE)')
+            results.append(result)
+            print(
+                f"{workers:>3} worker(s): {result['updates_per_second']:>8} upd/s  "
+                f"{result['handled']}/{result['updates']} handled in {result['seconds']}s, "
+                f"{result['keyboard_edits']} keyboard edits",
+                file=sys.stderr
+            )
+    finally:
+        await admin.close()
+        await api.stop()
+
+    report = {
+        'revision': loadtest._git_revision(),
+        'settings': {
+            'users': args.users,
+            'concurrency': args.concurrency,
+            'api_latency_ms': args.api_latency,
+            'cpus': os.cpu_count(),
+        },
+        'runs': results,
+    }
+    output = json.dumps(report, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare webhook throughput across worker counts.")
+    parser.add_argument('--database-url', help="Postgres URL allowed to CREATE DATABASE (default: $BENCH_DATABASE_URL)")
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 4], help="WEBHOOK_WORKERS values to compare")
+    parser.add_argument('--users', type=int, default=200, help="Simulated users per scenario")
+    parser.add_argument('--concurrency', type=int, default=64, help="Users posting concurrently")
+    parser.add_argument('--api-latency', type=float, default=0.0, help="Milliseconds added to every fake Bot API response")
+    parser.add_argument('--output', help="Write the JSON report to this file instead of stdout")
+    args = parser.parse_args()
+    # loadtest._configure reads these.
+    args.edit_window, args.telegram_limits = 0.5, False
+    asyncio.run(main(args))
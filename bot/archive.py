@@ -0,0 +1,302 @@
+"""
+Partition maintenance and archival for reactions and comments.
+
+Both tables are partitioned by the month of their confession (migration 007).
+Months of old confessions are rarely read, so they can be moved out of the
+database into compressed files and loaded back when needed.
+
+Usage (from the bot directory):
+    python archive.py list                      # partitions and archived months
+    python archive.py ensure [--months-ahead 2] # create upcoming partitions
+    python archive.py archive --older-than 12   # archive months older than 12 months
+    python archive.py archive 2024-01 2024-02   # archive the given months
+    python archive.py restore 2024-01           # load an archived month back
+
+Archiving a month detaches its partitions (reactions_yYYYYmMM and
+comments_yYYYYmMM), streams each one with COPY into ARCHIVE_DIR and drops it
+once the file is complete and its row count checked. Reactions and comments
+written to an archived month afterwards go to the default partition and are
+merged back on restore. Counters on confessions are left as they are, so
+archived confessions keep showing their totals; check_counters.py skips them.
+
+Uniqueness is only enforced within a partition, so a reaction written while
+its month is archived is counted even if the archive already holds the same
+one. Rather than drop such reactions in the flush (and with them the new
+ones, which are most of them), restoring a reactions month discards the
+duplicates and recounts the reaction counters of every confession that got
+reactions meanwhile.
+
+Archive format, per partition:
+    <table>.csv.gz  gzip-compressed CSV (PostgreSQL COPY ... FORMAT csv,
+                    HEADER), one row per reaction or comment, columns as
+                    listed in the manifest
+    <table>.json    manifest: {"table", "parent", "month" ("YYYY-MM"),
+                    "format": "csv", "compression": "gzip", "header": true,
+                    "columns": [...], "rows", "sha256" (of the .csv.gz),
+                    "archived_at"}
+The files can be read without the bot, e.g. `zcat reactions_y2024m01.csv.gz`
+or `COPY ... FROM PROGRAM 'zcat ...' WITH (FORMAT csv, HEADER)`.
+"""
+import argparse
+import asyncio
+import gzip
+import hashlib
+import json
+import os
+import sys
+from datetime import date, datetime, timezone
+from typing import List
+import asyncpg
+from config import DATABASE_URL, ARCHIVE_DIR, PARTITION_MONTHS_AHEAD
+
+PARENTS = ('reactions', 'comments')
+# Detaching needs a short exclusive lock on the parent table; give up rather
+# than queue behind a long query and block the bot's writes meanwhile.
+LOCK_TIMEOUT = '5s'
+
+PARTITIONS_QUERY = """
+    SELECT parent.relname AS parent, child.relname AS name,
+           pg_get_expr(child.relpartbound, child.oid) AS bounds,
+           child.reltuples::bigint AS estimated_rows,
+           pg_total_relation_size(child.oid) AS bytes
+    FROM pg_inherits i
+    JOIN pg_class parent ON parent.oid = i.inhparent
+    JOIN pg_class child ON child.oid = i.inhrelid
+    WHERE parent.relname = ANY($1::text[])
+    ORDER BY parent.relname, child.relname
+"""
+
+
+# Confessions of a month with reactions in the default partition, locked in
+# id order like the reaction flush does, so neither can deadlock the other.
+LOCK_DEFAULT_REACTED = """
+    SELECT id FROM confessions
+    WHERE id IN (
+        SELECT confession_id FROM reactions_default
+        WHERE confession_created_at >= $1::date::timestamp AT TIME ZONE 'UTC'
+          AND confession_created_at < ($1::date + interval '1 month')::timestamp AT TIME ZONE 'UTC'
+    )
+    ORDER BY id
+    FOR UPDATE
+"""
+
+# Then the author_stats rows the recount updates, in author order (see
+# FLUSH_REACTIONS in reactions.py).
+LOCK_AUTHOR_STATS = """
+    SELECT author_id FROM author_stats
+    WHERE author_id IN (SELECT author_id FROM confessions WHERE id = ANY($1::int[]))
+    ORDER BY author_id
+    FOR UPDATE
+"""
+
+RECOUNT_REACTIONS = """
+    UPDATE confessions c
+    SET relatable_count = r.relatable, support_count = r.support
+    FROM (
+        SELECT confession_id,
+               COUNT(*) FILTER (WHERE reaction_type = 'relatable') AS relatable,
+               COUNT(*) FILTER (WHERE reaction_type = 'support') AS support
+        FROM reactions
+        WHERE confession_id = ANY($1::int[])
+          AND confession_created_at >= $2::date::timestamp AT TIME ZONE 'UTC'
+          AND confession_created_at < ($2::date + interval '1 month')::timestamp AT TIME ZONE 'UTC'
+        GROUP BY confession_id
+    ) r
+    WHERE c.id = r.confession_id
+"""
+
+
+def partition_name(parent: str, month: date) -> str:
+    """Same naming as engagement_partition_name() in migration 007."""
+    return f"{parent}_y{month.year:04d}m{month.month:02d}"
+
+
+def parse_month(value: str) -> date:
+    return datetime.strptime(value, '%Y-%m').date()
+
+
+def months_before(months: int) -> date:
+    """First day of the month `months` months before the current one (UTC)."""
+    today = datetime.now(timezone.utc).date()
+    index = today.year * 12 + today.month - 1 - months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def _sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+async def _is_attached(conn: asyncpg.Connection, name: str) -> bool:
+    return await conn.fetchval("SELECT EXISTS (SELECT 1 FROM pg_inherits WHERE inhrelid = to_regclass($1))", name)
+
+
+async def _columns(conn: asyncpg.Connection, name: str) -> List[str]:
+    rows = await conn.fetch("""
+        SELECT attname FROM pg_attribute
+        WHERE attrelid = to_regclass($1) AND attnum > 0 AND NOT attisdropped
+        ORDER BY attnum
+    """, name)
+    return [r['attname'] for r in rows]
+
+
+async def archive_partition(conn: asyncpg.Connection, parent: str, month: date, directory: str) -> bool:
+    """Moves one partition to `directory`. Returns False if there was nothing to archive."""
+    name = partition_name(parent, month)
+    if await conn.fetchval("SELECT 1 FROM archived_partitions WHERE table_name = $1", name):
+        print(f"{name}: already archived")
+        return False
+    if await conn.fetchval("SELECT to_regclass($1)", name) is None:
+        print(f"{name}: no such partition")
+        return False
+
+    # Detached first, so that no write lands in the table while it is copied.
+    # A table left detached by an interrupted run is picked up from here.
+    if await _is_attached(conn, name):
+        async with conn.transaction():
+            await conn.execute(f"SET LOCAL lock_timeout = '{LOCK_TIMEOUT}'")
+            await conn.execute(f'ALTER TABLE "{parent}" DETACH PARTITION "{name}"')
+
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"{name}.csv.gz")
+    partial = path + '.partial'
+    with gzip.open(partial, 'wb') as f:
+        status = await conn.copy_from_table(name, output=f, format='csv', header=True)
+    rows = int(status.split()[-1])
+    expected = await conn.fetchval(f'SELECT count(*) FROM "{name}"')
+    if rows != expected:
+        os.remove(partial)
+        raise RuntimeError(f"{name}: copied {rows} rows but the table has {expected}; left it detached")
+    with open(partial, 'rb') as f:
+        os.fsync(f.fileno())
+    os.replace(partial, path)
+    sha256 = _sha256(path)
+
+    manifest = {
+        'table': name,
+        'parent': parent,
+        'month': month.strftime('%Y-%m'),
+        'format': 'csv',
+        'compression': 'gzip',
+        'header': True,
+        'columns': await _columns(conn, name),
+        'rows': rows,
+        'sha256': sha256,
+        'archived_at': datetime.now(timezone.utc).isoformat(),
+    }
+    with open(os.path.join(directory, f"{name}.json"), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+
+    async with conn.transaction():
+        await conn.execute(
+            "INSERT INTO archived_partitions(table_name, parent, month, file, row_count, sha256) VALUES($1, $2, $3, $4, $5, $6)",
+            name, parent, month, os.path.abspath(path), rows, sha256
+        )
+        await conn.execute(f'DROP TABLE "{name}"')
+    print(f"{name}: archived {rows} rows to {path}")
+    return True
+
+
+async def restore_partition(conn: asyncpg.Connection, parent: str, month: date, directory: str) -> bool:
+    """Loads an archived partition back and attaches it. Returns False if it was not archived."""
+    name = partition_name(parent, month)
+    archived = await conn.fetchrow("SELECT file, row_count, sha256 FROM archived_partitions WHERE table_name = $1", name)
+    if archived is None:
+        print(f"{name}: not archived")
+        return False
+    path = archived['file'] if os.path.exists(archived['file']) else os.path.join(directory, f"{name}.csv.gz")
+    with open(os.path.join(os.path.dirname(path), f"{name}.json"), encoding='utf-8') as f:
+        manifest = json.load(f)
+    if _sha256(path) != archived['sha256']:
+        raise RuntimeError(f"{name}: {path} does not match the checksum recorded when it was archived")
+
+    async with conn.transaction():
+        await conn.execute(f"SET LOCAL lock_timeout = '{LOCK_TIMEOUT}'")
+        await conn.execute(f'CREATE TABLE "{name}" (LIKE "{parent}" INCLUDING ALL)')
+        with gzip.open(path, 'rb') as f:
+            status = await conn.copy_to_table(name, source=f, columns=manifest['columns'], format='csv', header=True)
+        rows = int(status.split()[-1])
+        if rows != archived['row_count']:
+            raise RuntimeError(f"{name}: loaded {rows} rows, the archive recorded {archived['row_count']}")
+        reacted = []
+        if parent == 'reactions':
+            reacted = [r['id'] for r in await conn.fetch(LOCK_DEFAULT_REACTED, month)]
+            await conn.execute(LOCK_AUTHOR_STATS, reacted)
+        # Also moves in what was written to this month while it was archived.
+        await conn.execute("SELECT attach_engagement_partition($1, $2)", parent, month)
+        if reacted:
+            await conn.execute(RECOUNT_REACTIONS, reacted, month)
+        await conn.execute("DELETE FROM archived_partitions WHERE table_name = $1", name)
+    recounted = f", recounted {len(reacted)} confession(s)" if reacted else ""
+    print(f"{name}: restored {rows} rows from {path}{recounted}")
+    return True
+
+
+async def list_partitions(conn: asyncpg.Connection):
+    for r in await conn.fetch(PARTITIONS_QUERY, list(PARENTS)):
+        print(f"{r['name']:28} {r['bounds']:80} ~{max(r['estimated_rows'], 0)} rows, {r['bytes'] // 1024} kB")
+    for r in await conn.fetch("SELECT table_name, row_count, file, archived_at FROM archived_partitions ORDER BY table_name"):
+        print(f"{r['table_name']:28} archived {r['archived_at']:%Y-%m-%d}: {r['row_count']} rows in {r['file']}")
+
+
+async def attached_months(conn: asyncpg.Connection, before: date) -> List[date]:
+    """Months with an attached partition that start before `before`."""
+    months = set()
+    for r in await conn.fetch(PARTITIONS_QUERY, list(PARENTS)):
+        suffix = r['name'][len(r['parent']):]
+        if suffix.startswith('_y') and suffix != '_default':
+            month = datetime.strptime(suffix, '_y%Ym%m').date()
+            if month < before:
+                months.add(month)
+    return sorted(months)
+
+
+async def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Partition maintenance and archival for reactions and comments.")
+    sub = parser.add_subparsers(dest='command', required=True)
+    sub.add_parser('list', help="Show partitions and archived months")
+    ensure = sub.add_parser('ensure', help="Create partitions for this month and the next ones")
+    ensure.add_argument('--months-ahead', type=int, default=PARTITION_MONTHS_AHEAD)
+    archive = sub.add_parser('archive', help="Move months to compressed files")
+    archive.add_argument('months', nargs='*', type=parse_month, help="Months to archive, as YYYY-MM")
+    archive.add_argument('--older-than', type=int, help="Archive every month older than this many months")
+    archive.add_argument('--dir', default=ARCHIVE_DIR)
+    restore = sub.add_parser('restore', help="Load archived months back")
+    restore.add_argument('months', nargs='+', type=parse_month, help="Months to restore, as YYYY-MM")
+    restore.add_argument('--dir', default=ARCHIVE_DIR)
+    args = parser.parse_args(argv)
+
+    conn = await asyncpg.connect(DATABASE_URL)
+    try:
+        if args.command == 'list':
+            await list_partitions(conn)
+        elif args.command == 'ensure':
+            await conn.execute("SELECT ensure_engagement_partitions($1)", args.months_ahead)
+            await list_partitions(conn)
+        elif args.command == 'archive':
+            current = months_before(0)
+            months = list(args.months)
+            if args.older_than is not None:
+                months += await attached_months(conn, months_before(max(args.older_than, 1)))
+            if not months:
+                parser.error("give months to archive or --older-than")
+            for month in sorted(set(months)):
+                if month >= current:
+                    print(f"{month:%Y-%m}: the current month and later cannot be archived")
+                    continue
+                for parent in PARENTS:
+                    await archive_partition(conn, parent, month, args.dir)
+        elif args.command == 'restore':
+            for month in args.months:
+                for parent in PARENTS:
+                    await restore_partition(conn, parent, month, args.dir)
+        return 0
+    finally:
+        await conn.close()
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
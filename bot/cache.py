@@ -0,0 +1,107 @@
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Hashable, Tuple
+
+# Bounded read-through caches.
+# A cache wraps an async loader: get(key) returns the cached value while it
+# is fresh, otherwise calls the loader. Concurrent misses for the same key
+# share one load, so a burst of taps on a popular post costs one query.
+# Entries expire after `ttl` seconds and the least recently used ones are
+# evicted beyond `maxsize`. A None result ("not found") is kept for
+# `negative_ttl` seconds, or not at all when that is 0.
+
+_caches: Dict[str, "AsyncCache"] = {}
+
+
+class AsyncCache:
+    def __init__(self, name: str, loader: Callable[[Hashable], Awaitable], maxsize: int, ttl: float, negative_ttl: float = 0):
+        self.name = name
+        self.loader = loader
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self._entries: "OrderedDict[Hashable, Tuple[float, object]]" = OrderedDict()
+        self._loading: Dict[Hashable, asyncio.Task] = {}
+        # Bumped by every invalidation; loads started before one are not stored.
+        self._generation = 0
+        self.hits = self.misses = self.coalesced = 0
+        _caches[name] = self
+
+    async def get(self, key: Hashable):
+        entry = self._entries.get(key)
+        if entry is not None:
+            if time.monotonic() < entry[0]:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            del self._entries[key]
+
+        task = self._loading.get(key)
+        if task is None:
+            self.misses += 1
+            task = asyncio.ensure_future(self._load(key, self._generation))
+            task.add_done_callback(_consume_exception)
+            self._loading[key] = task
+        else:
+            self.coalesced += 1
+        # Shielded: a cancelled caller must not cancel the load others wait for.
+        return await asyncio.shield(task)
+
+    async def _load(self, key: Hashable, generation: int):
+        try:
+            value = await self.loader(key)
+        finally:
+            if self._loading.get(key) is asyncio.current_task():
+                del self._loading[key]
+        if generation == self._generation:
+            self.put(key, value)
+        return value
+
+    def put(self, key: Hashable, value):
+        """Stores a value directly, e.g. one just written to the database."""
+        ttl = self.ttl if value is not None else self.negative_ttl
+        if ttl <= 0:
+            return
+        self._entries[key] = (time.monotonic() + ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, key: Hashable):
+        self._entries.pop(key, None)
+        self._loading.pop(key, None)
+        self._generation += 1
+
+    def invalidate_where(self, predicate: Callable[[Hashable], bool]):
+        for key in [k for k in self._entries if predicate(k)]:
+            del self._entries[key]
+        for key in [k for k in self._loading if predicate(k)]:
+            del self._loading[key]
+        self._generation += 1
+
+    def clear(self):
+        self._entries.clear()
+        self._loading.clear()
+        self._generation += 1
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses + self.coalesced
+        return {
+            'size': len(self._entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'coalesced': self.coalesced,
+            'hit_rate': (self.hits + self.coalesced) / lookups if lookups else 0.0,
+        }
+
+
+def _consume_exception(task: asyncio.Task):
+    # Marks the exception as retrieved; the callers that awaited it got it already.
+    if not task.cancelled():
+        task.exception()
+
+
+def stats() -> Dict[str, dict]:
+    """Stats of every cache, by name."""
+    return {name: cache.stats() for name, cache in _caches.items()}
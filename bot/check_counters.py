@@ -0,0 +1,78 @@
+"""
+Consistency check for the denormalized counters on `confessions`.
+
+Confessions of archived months (see archive.py) are skipped: their reactions
+and comments are no longer in the database to count.
+
+Usage (from the bot directory):
+    python check_counters.py           # report drift only
+    python check_counters.py --repair  # report and fix drift
+"""
+import sys
+import asyncio
+import asyncpg
+from config import DATABASE_URL
+
+DRIFT_QUERY = """
+    SELECT c.id,
+           c.relatable_count, COALESCE(r.relatable, 0) AS actual_relatable,
+           c.support_count, COALESCE(r.support, 0) AS actual_support,
+           c.comments_count, COALESCE(cm.total, 0) AS actual_comments
+    FROM confessions c
+    LEFT JOIN (
+        SELECT confession_id,
+               COUNT(*) FILTER (WHERE reaction_type = 'relatable') AS relatable,
+               COUNT(*) FILTER (WHERE reaction_type = 'support') AS support
+        FROM reactions
+        GROUP BY confession_id
+    ) r ON r.confession_id = c.id
+    LEFT JOIN (
+        SELECT confession_id, COUNT(*) AS total
+        FROM comments
+        GROUP BY confession_id
+    ) cm ON cm.confession_id = c.id
+    WHERE (c.relatable_count, c.support_count, c.comments_count)
+          IS DISTINCT FROM (COALESCE(r.relatable, 0), COALESCE(r.support, 0), COALESCE(cm.total, 0))
+      AND NOT EXISTS (
+          SELECT 1 FROM archived_partitions a
+          WHERE c.created_at >= a.month::timestamp AT TIME ZONE 'UTC'
+            AND c.created_at < (a.month + interval '1 month')::timestamp AT TIME ZONE 'UTC'
+      )
+    ORDER BY c.id
+"""
+
+# Recounts a single confession. Run after locking the row so that concurrent
+# inserts, which also update this row, are serialized behind the repair.
+REPAIR_QUERY = """
+    UPDATE confessions
+    SET relatable_count = (SELECT COUNT(*) FROM reactions WHERE confession_id = $1 AND reaction_type = 'relatable'),
+        support_count = (SELECT COUNT(*) FROM reactions WHERE confession_id = $1 AND reaction_type = 'support'),
+        comments_count = (SELECT COUNT(*) FROM comments WHERE confession_id = $1)
+    WHERE id = $1
+"""
+
+
+async def check_counters(repair: bool = False) -> int:
+    """Prints every confession whose counters drifted. Returns the number found."""
+    conn = await asyncpg.connect(DATABASE_URL)
+    try:
+        rows = await conn.fetch(DRIFT_QUERY)
+        for r in rows:
+            print(
+                f"#{r['id']}: relatable {r['relatable_count']} -> {r['actual_relatable']}, "
+                f"support {r['support_count']} -> {r['actual_support']}, "
+                f"comments {r['comments_count']} -> {r['actual_comments']}"
+            )
+            if repair:
+                async with conn.transaction():
+                    await conn.execute("SELECT id FROM confessions WHERE id = $1 FOR UPDATE", r['id'])
+                    await conn.execute(REPAIR_QUERY, r['id'])
+        print(f"{len(rows)} confession(s) with drifted counters{', repaired' if repair and rows else ''}.")
+        return len(rows)
+    finally:
+        await conn.close()
+
+
+if __name__ == "__main__":
+    drifted = asyncio.run(check_counters(repair='--repair' in sys.argv[1:]))
+    sys.exit(1 if drifted and '--repair' not in sys.argv[1:] else 0)
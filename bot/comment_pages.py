@@ -0,0 +1,106 @@
+from typing import List, Tuple
+from cache import AsyncCache
+from db import fetch, query
+
+# Keyset-paginated comment pages.
+# A page starts right after (or ends right before) an anchor comment id and
+# holds as many comments as fit in one Telegram message, so every page is a
+# bounded index range scan on (confession_id, id) in a single partition, no
+# matter how long the thread is. Recently rendered pages are kept in a small
+# read-through cache.
+
+MESSAGE_LIMIT = 4096
+PAGE_ROWS = 20
+CACHE_SIZE = 512
+CACHE_TTL = 30
+
+NEXT = 'n'
+PREV = 'p'
+
+# The confession's created_at is the partition key of comments (007); with
+# it the scan is pruned to the one partition holding the thread.
+COMMENTS_AFTER = query('comments_after', """
+    SELECT id, text FROM comments
+    WHERE confession_id=$1 AND id > $2
+      AND confession_created_at = (SELECT created_at FROM confessions WHERE id=$1)
+    ORDER BY id LIMIT $3
+""")
+COMMENTS_BEFORE = query('comments_before', """
+    SELECT id, text FROM comments
+    WHERE confession_id=$1 AND id < $2
+      AND confession_created_at = (SELECT created_at FROM confessions WHERE id=$1)
+    ORDER BY id DESC LIMIT $3
+""")
+
+def _header(conf_id: int) -> str:
+    return f"📜 Comments for confession #{conf_id}:\n\n"
+
+
+def _entry(text: str) -> str:
+    return f"💬 \"{text}\""
+
+
+def _length(text: str) -> int:
+    """Length as Telegram counts it: in UTF-16 code units, so most emoji count twice."""
+    return len(text.encode('utf-16-le')) // 2
+
+
+def _truncate(text: str, units: int) -> str:
+    """The longest prefix of `text` within `units` UTF-16 code units."""
+    # A surrogate pair cut in half is dropped rather than left dangling.
+    return text.encode('utf-16-le')[:units * 2].decode('utf-16-le', errors='ignore')
+
+
+def _fit(conf_id: int, rows) -> List[Tuple[int, str]]:
+    """Takes rows in order while the rendered page stays within the message limit."""
+    budget = MESSAGE_LIMIT - _length(_header(conf_id))
+    taken = []
+    for r in rows:
+        entry = _entry(r['text'])
+        cost = _length(entry) + (2 if taken else 0)
+        if cost > budget:
+            if not taken:
+                # A single comment longer than a whole page is shown truncated.
+                taken.append((r['id'], _truncate(entry, budget - 1) + '…'))
+            break
+        taken.append((r['id'], entry))
+        budget -= cost
+    return taken
+
+
+async def _load(conf_id: int, direction: str, anchor: int):
+    if direction == NEXT:
+        rows = await fetch(COMMENTS_AFTER, conf_id, anchor, PAGE_ROWS + 1)
+    else:
+        rows = await fetch(COMMENTS_BEFORE, conf_id, anchor, PAGE_ROWS + 1)
+    taken = _fit(conf_id, rows)
+    more = len(rows) > len(taken)
+    if direction == NEXT:
+        return taken, anchor > 0, more
+    taken.reverse()
+    return taken, more, True
+
+
+async def _render(key: tuple):
+    conf_id, direction, anchor = key
+    entries, has_prev, has_next = await _load(conf_id, direction, anchor)
+    if not entries:
+        return None
+    text = _header(conf_id) + "\n\n".join(e for _, e in entries)
+    return (text, entries[0][0], entries[-1][0], has_prev, has_next)
+
+
+_pages = AsyncCache('comment_pages', _render, maxsize=CACHE_SIZE, ttl=CACHE_TTL, negative_ttl=CACHE_TTL)
+
+
+async def get_page(conf_id: int, direction: str = NEXT, anchor: int = 0):
+    """
+    Returns (text, first_id, last_id, has_prev, has_next) for a page, or None
+    if there are no comments in that direction.
+    """
+    return await _pages.get((conf_id, direction, anchor))
+
+
+def invalidate(conf_id: int):
+    """Drops cached pages of a confession, e.g. after a new comment."""
+    _pages.invalidate_where(lambda key: key[0] == conf_id)
@@ -9,5 +9,108 @@ DATABASE_URL = os.getenv("DATABASE_URL")
 FERNET_KEY = os.getenv("FERNET_KEY")
 REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
 
-# Notify author when reactions increase by this number
+# Notify author when reactions + comments increase by this number
 NOTIFY_DELTA = int(os.getenv("NOTIFY_DELTA", "3"))
+# Minimum seconds between two notifications to the same author
+NOTIFY_MIN_INTERVAL = int(os.getenv("NOTIFY_MIN_INTERVAL", "60"))
+# Seconds after which smaller gains are sent anyway as a digest
+NOTIFY_DIGEST_INTERVAL = int(os.getenv("NOTIFY_DIGEST_INTERVAL", "900"))
+
+# Seconds to coalesce channel keyboard edits for a single confession
+MARKUP_EDIT_WINDOW = float(os.getenv("MARKUP_EDIT_WINDOW", "2"))
+
+# Seconds between leaderboard reconciliations against Postgres
+LEADERBOARD_RECONCILE_INTERVAL = int(os.getenv("LEADERBOARD_RECONCILE_INTERVAL", "300"))
+
+# FSM storage backend: "memory" (single process) or "redis" (shared between workers)
+FSM_STORAGE = os.getenv("FSM_STORAGE", "memory")
+# Seconds before an abandoned conversation expires in Redis (0 disables expiry)
+FSM_TTL = int(os.getenv("FSM_TTL", "86400"))
+
+# Base URL of the Bot API server; leave unset for api.telegram.org (set it to point at a local fake API)
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL")
+
+# Webhook mode (python webhook.py)
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST")  # e.g. https://bot.example.com; unset to skip setWebhook
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")
+WEBAPP_HOST = os.getenv("WEBAPP_HOST", "0.0.0.0")
+WEBAPP_PORT = int(os.getenv("WEBAPP_PORT", "8080"))
+WEBHOOK_WORKERS = int(os.getenv("WEBHOOK_WORKERS", "4"))
+# Updates buffered per worker before the endpoint starts answering 503
+WEBHOOK_QUEUE_SIZE = int(os.getenv("WEBHOOK_QUEUE_SIZE", "1000"))
+# Updates a single worker processes concurrently (different users only)
+WEBHOOK_WORKER_CONCURRENCY = int(os.getenv("WEBHOOK_WORKER_CONCURRENCY", "64"))
+
+# Outbound Bot API rate limits (messages per second), for the whole bot
+OUTBOUND_GLOBAL_RATE = float(os.getenv("OUTBOUND_GLOBAL_RATE", "30"))
+OUTBOUND_CHAT_RATE = float(os.getenv("OUTBOUND_CHAT_RATE", "1"))
+OUTBOUND_GROUP_RATE = float(os.getenv("OUTBOUND_GROUP_RATE", str(20 / 60)))
+OUTBOUND_MAX_RETRIES = int(os.getenv("OUTBOUND_MAX_RETRIES", "3"))
+# Where the outbound buckets live: "redis" (shared between webhook workers) or "memory"
+# (per process; each of the WEBHOOK_WORKERS workers then gets 1/WEBHOOK_WORKERS of the global and group rates)
+OUTBOUND_BACKEND = os.getenv("OUTBOUND_BACKEND", "memory")
+
+# Apply pending schema migrations when the bot starts
+MIGRATE_ON_STARTUP = os.getenv("MIGRATE_ON_STARTUP", "1") == "1"
+
+
+def _rate_limit(name: str, default: str):
+    """Parses a "<actions>/<seconds>" limit, e.g. "1/300"."""
+    capacity, period = os.getenv(name, default).split("/")
+    return int(capacity), float(period)
+
+
+# Per-user rate limits for each action
+RATE_LIMITS = {
+    "confess": _rate_limit("RATE_LIMIT_CONFESS", "1/300"),
+    "react": _rate_limit("RATE_LIMIT_REACT", "30/60"),
+    "comment": _rate_limit("RATE_LIMIT_COMMENT", "5/60"),
+    "view": _rate_limit("RATE_LIMIT_VIEW", "30/60"),
+    "search": _rate_limit("RATE_LIMIT_SEARCH", "20/60"),
+}
+# Rate limiter backend: "memory" (per process) or "redis" (shared between workers)
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "memory")
+# Users tracked by the in-memory backend before the least recent are forgotten
+RATE_LIMIT_MAX_KEYS = int(os.getenv("RATE_LIMIT_MAX_KEYS", "100000"))
+
+# Blocklist file for the moderation engine (see moderation.py for the format)
+MODERATION_RULES_FILE = os.getenv("MODERATION_RULES_FILE")
+# Seconds between checks of the rules file for changes
+MODERATION_RELOAD_INTERVAL = float(os.getenv("MODERATION_RELOAD_INTERVAL", "5"))
+
+# Database connection pool
+DB_POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", "2"))
+DB_POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", "10"))
+# Prepared statements cached per connection; set to 0 behind PgBouncer in transaction mode
+DB_STATEMENT_CACHE_SIZE = int(os.getenv("DB_STATEMENT_CACHE_SIZE", "256"))
+# Seconds before a query is cancelled (0 disables the timeout)
+DB_COMMAND_TIMEOUT = float(os.getenv("DB_COMMAND_TIMEOUT", "30")) or None
+# Queries slower than this many milliseconds are logged
+DB_SLOW_QUERY_MS = float(os.getenv("DB_SLOW_QUERY_MS", "200"))
+
+# Prometheus metrics and profiler endpoint (port 0 disables it); webhook workers use port + worker index
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9100"))
+# Seconds between stack samples while the profiler is running
+PROFILE_INTERVAL = float(os.getenv("PROFILE_INTERVAL", "0.005"))
+
+# Cached confession metadata (id, text, channel post, author); rows never change after posting
+CONFESSION_CACHE_SIZE = int(os.getenv("CONFESSION_CACHE_SIZE", "10000"))
+CONFESSION_CACHE_TTL = float(os.getenv("CONFESSION_CACHE_TTL", "3600"))
+
+# Reactions are written in batches every REACTION_FLUSH_INTERVAL seconds or once REACTION_BATCH_SIZE are queued
+REACTION_FLUSH_INTERVAL = float(os.getenv("REACTION_FLUSH_INTERVAL", "0.5"))
+REACTION_BATCH_SIZE = int(os.getenv("REACTION_BATCH_SIZE", "500"))
+# Recent reactions remembered to answer duplicate taps without a query
+REACTION_DEDUPE_SIZE = int(os.getenv("REACTION_DEDUPE_SIZE", "100000"))
+# Reactions that could not be written on shutdown are saved here and replayed on start
+REACTION_SPOOL_FILE = os.getenv("REACTION_SPOOL_FILE", "reactions.spool")
+
+# Monthly partitions of reactions/comments created ahead of time on startup (see archive.py)
+PARTITION_MONTHS_AHEAD = int(os.getenv("PARTITION_MONTHS_AHEAD", "2"))
+# Where archive.py writes archived partitions
+ARCHIVE_DIR = os.getenv("ARCHIVE_DIR", "archive")
+
+# Database read by export.py, e.g. a replica; defaults to DATABASE_URL
+EXPORT_DATABASE_URL = os.getenv("EXPORT_DATABASE_URL") or DATABASE_URL
@@ -1,15 +1,133 @@
+import time
+import logging
 import asyncpg
-from typing import Optional
-from config import DATABASE_URL
+from contextlib import asynccontextmanager
+from typing import Dict, Iterable, NamedTuple, Optional, Sequence, Union
+from config import (
+    DATABASE_URL, MIGRATE_ON_STARTUP, DB_POOL_MIN_SIZE, DB_POOL_MAX_SIZE,
+    DB_STATEMENT_CACHE_SIZE, DB_COMMAND_TIMEOUT, DB_SLOW_QUERY_MS,
+)
+from migrate import run_migrations
+from metrics import Counter, Histogram
+
+# Data access layer.
+# Queries are registered once with a name (`query('confession_by_id', ...)`);
+# the name labels their timings, and asyncpg's per-connection statement cache
+# prepares each one on first use and reuses the plan afterwards. Every call is
+# timed into a histogram per query name (exported by metrics.py) and calls
+# slower than DB_SLOW_QUERY_MS are logged. Plain SQL strings are accepted too
+# and are counted as 'adhoc'.
 
 _pool: Optional[asyncpg.pool.Pool] = None
 
+
+class Query(NamedTuple):
+    name: str
+    sql: str
+
+
+_queries: Dict[str, Query] = {}
+
+
+def query(name: str, sql: str) -> Query:
+    """Registers a named query."""
+    existing = _queries.get(name)
+    if existing is not None and existing.sql != sql:
+        raise ValueError(f"Query {name!r} is already registered with different SQL")
+    _queries[name] = Query(name, sql)
+    return _queries[name]
+
+
+SqlOrQuery = Union[Query, str]
+
+QUERY_SECONDS = Histogram('db_query_seconds', 'Latency of database calls', ('query',))
+QUERY_ERRORS = Counter('db_query_errors_total', 'Failed database calls', ('query', 'error'))
+ACQUIRE_SECONDS = Histogram('db_pool_acquire_seconds', 'Time spent waiting for a pool connection')
+
+
+def _observe(name: str, elapsed: float, error: Optional[Exception]):
+    QUERY_SECONDS.observe(elapsed, name)
+    if error is not None:
+        QUERY_ERRORS.inc(name, type(error).__name__)
+    if elapsed * 1000 >= DB_SLOW_QUERY_MS:
+        logging.warning(f"Slow query {name}: {elapsed * 1000:.1f} ms")
+
+
+def query_stats() -> Dict[str, dict]:
+    """Returns the timings of every query name (bucket counts are not cumulative)."""
+    return {labels[0]: QUERY_SECONDS.snapshot(*labels) for labels in list(QUERY_SECONDS.values)}
+
+
+def pool_stats() -> dict:
+    if not _pool:
+        return {}
+    return {'size': _pool.get_size(), 'idle': _pool.get_idle_size(), 'max_size': _pool.get_max_size()}
+
+
+class Session:
+    """Instrumented wrapper around a single connection."""
+
+    def __init__(self, conn: asyncpg.Connection):
+        self.conn = conn
+
+    async def _run(self, name: str, call, *args, **kwargs):
+        start = time.perf_counter()
+        error = None
+        try:
+            return await call(*args, **kwargs)
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            _observe(name, time.perf_counter() - start, error)
+
+    async def fetchrow(self, q: SqlOrQuery, *args):
+        name, sql = _resolve(q)
+        return await self._run(name, self.conn.fetchrow, sql, *args)
+
+    async def fetch(self, q: SqlOrQuery, *args):
+        name, sql = _resolve(q)
+        return await self._run(name, self.conn.fetch, sql, *args)
+
+    async def fetchval(self, q: SqlOrQuery, *args):
+        name, sql = _resolve(q)
+        return await self._run(name, self.conn.fetchval, sql, *args)
+
+    async def execute(self, q: SqlOrQuery, *args):
+        name, sql = _resolve(q)
+        return await self._run(name, self.conn.execute, sql, *args)
+
+    async def executemany(self, q: SqlOrQuery, args: Iterable[Sequence]):
+        name, sql = _resolve(q)
+        return await self._run(name, self.conn.executemany, sql, args)
+
+    async def copy_records(self, table: str, records: Iterable[Sequence], columns: Sequence[str]):
+        return await self._run(f"copy:{table}", self.conn.copy_records_to_table, table, records=records, columns=list(columns))
+
+
+def _resolve(q: SqlOrQuery):
+    if isinstance(q, Query):
+        return q.name, q.sql
+    return 'adhoc', q
+
+
 async def init_db():
     """Initializes the database connection pool."""
     global _pool
     if not _pool:
-        _pool = await asyncpg.create_pool(DATABASE_URL)
+        _pool = await asyncpg.create_pool(
+            DATABASE_URL,
+            min_size=DB_POOL_MIN_SIZE,
+            max_size=DB_POOL_MAX_SIZE,
+            statement_cache_size=DB_STATEMENT_CACHE_SIZE,
+            command_timeout=DB_COMMAND_TIMEOUT,
+        )
         print("Database pool created.")
+        if MIGRATE_ON_STARTUP:
+            async with _pool.acquire() as conn:
+                applied = await run_migrations(conn)
+            if applied:
+                print(f"Applied migrations: {', '.join(applied)}")
 
 async def close_db():
     """Closes the database connection pool."""
@@ -18,21 +136,57 @@ async def close_db():
         await _pool.close()
         print("Database pool closed.")
 
-async def fetchrow(query, *args):
-    """Fetches a single row from the database."""
+@asynccontextmanager
+async def _acquire():
+    start = time.perf_counter()
     async with _pool.acquire() as conn:
-        return await conn.fetchrow(query, *args)
+        ACQUIRE_SECONDS.observe(time.perf_counter() - start)
+        yield conn
+
+@asynccontextmanager
+async def transaction():
+    """
+    Runs several statements on one connection inside a transaction:
+
+        async with transaction() as tx:
+            row = await tx.fetchrow(SOME_QUERY, ...)
+            await tx.execute(OTHER_QUERY, ...)
 
-async def fetch(query, *args):
+    Commits when the block exits normally, rolls back on an exception.
+    """
+    async with _acquire() as conn:
+        async with conn.transaction():
+            yield Session(conn)
+
+async def fetchrow(q: SqlOrQuery, *args):
+    """Fetches a single row from the database."""
+    async with _acquire() as conn:
+        return await Session(conn).fetchrow(q, *args)
+
+async def fetch(q: SqlOrQuery, *args):
     """Fetches multiple rows from the database."""
-    async with _pool.acquire() as conn:
-        return await conn.fetch(query, *args)
+    async with _acquire() as conn:
+        return await Session(conn).fetch(q, *args)
 
-async def execute(query, *args):
+async def fetchval(q: SqlOrQuery, *args):
+    """Fetches a single value from the database."""
+    async with _acquire() as conn:
+        return await Session(conn).fetchval(q, *args)
+
+async def execute(q: SqlOrQuery, *args):
     """
-    Executes a command (INSERT, UPDATE, DELETE) within a transaction.
-    This ensures the data is properly saved (committed) to the database.
+    Executes a single command (INSERT, UPDATE, DELETE). It commits on its own;
+    use transaction() when several statements must succeed or fail together.
     """
-    async with _pool.acquire() as conn:
-        async with conn.transaction():
-            return await conn.execute(query, *args)
+    async with _acquire() as conn:
+        return await Session(conn).execute(q, *args)
+
+async def executemany(q: SqlOrQuery, args: Iterable[Sequence]):
+    """Executes a command once per argument tuple, pipelined in one transaction."""
+    async with _acquire() as conn:
+        return await Session(conn).executemany(q, args)
+
+async def copy_records(table: str, records: Iterable[Sequence], columns: Sequence[str]):
+    """Bulk-loads rows into a table with COPY; much faster than INSERTs for large batches."""
+    async with _acquire() as conn:
+        return await Session(conn).copy_records(table, records, columns)
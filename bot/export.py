@@ -0,0 +1,180 @@
+"""
+Streaming export of confessions and their engagement for analytics.
+
+Usage (from the bot directory):
+    python export.py --output confessions.csv
+    python export.py --format ndjson --output confessions.ndjson.gz
+    python export.py --watermark-file export.watermark --output new.csv  # only rows since the last run
+
+Rows are read through a server-side cursor in batches of --batch-size and
+written as they arrive, so memory stays constant however large the table
+is. The export uses its own connection (EXPORT_DATABASE_URL, e.g. a
+replica; DATABASE_URL otherwise), never the bot's pool, and reads one
+consistent snapshot.
+
+Columns: id, created_at, category, author, text, relatable_count,
+support_count, comments_count, channel_message_id. `author` is a
+pseudonym (utils.pseudonymize_userid): the same author gets the same value
+in every export, and it cannot be turned back into a Telegram user id.
+Counts are the ones at the time of the export.
+
+Incremental exports: rows are ordered by (created_at, id) and only those
+after the watermark are exported. The watermark is given with --since /
+--since-id, or read from and written back to --watermark-file. Confessions
+younger than --lag seconds are left for the next run, so a row committed
+just after the snapshot is not skipped.
+"""
+import argparse
+import asyncio
+import csv
+import gzip
+import json
+import os
+import sys
+import time
+from datetime import datetime, timezone
+from typing import Optional, TextIO, Tuple
+import asyncpg
+from config import EXPORT_DATABASE_URL
+from utils import pseudonymize_userid
+
+COLUMNS = (
+    'id', 'created_at', 'category', 'author', 'text',
+    'relatable_count', 'support_count', 'comments_count', 'channel_message_id',
+)
+
+# Ordered by (created_at, id), the watermark; served by confessions_created_at_idx (004).
+EXPORT_QUERY = """
+    SELECT id, created_at, category, author_id, text,
+           relatable_count, support_count, comments_count, channel_message_id
+    FROM confessions
+    WHERE (created_at, id) > ($1, $2)
+      AND created_at < now() - make_interval(secs => $3)
+    ORDER BY created_at, id
+"""
+
+Watermark = Tuple[datetime, int]
+EPOCH: Watermark = (datetime(1970, 1, 1, tzinfo=timezone.utc), 0)
+
+
+class CsvWriter:
+    def __init__(self, out: TextIO, include_text: bool):
+        self.writer = csv.writer(out)
+        self.writer.writerow([c for c in COLUMNS if include_text or c != 'text'])
+
+    def write(self, rows):
+        self.writer.writerows(rows)
+
+
+class NdjsonWriter:
+    def __init__(self, out: TextIO, include_text: bool):
+        self.out = out
+        self.columns = [c for c in COLUMNS if include_text or c != 'text']
+
+    def write(self, rows):
+        columns = self.columns
+        self.out.write(''.join(json.dumps(dict(zip(columns, row)), ensure_ascii=False) + '\n' for row in rows))
+
+
+WRITERS = {'csv': CsvWriter, 'ndjson': NdjsonWriter}
+
+
+def read_watermark(path: str) -> Optional[Watermark]:
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding='utf-8') as f:
+        data = json.load(f)
+    return datetime.fromisoformat(data['created_at']), int(data['id'])
+
+
+def write_watermark(path: str, watermark: Watermark):
+    # Written next to the target and renamed, so a crash never leaves half a file.
+    partial = path + '.partial'
+    with open(partial, 'w', encoding='utf-8') as f:
+        json.dump({'created_at': watermark[0].isoformat(), 'id': watermark[1]}, f)
+    os.replace(partial, path)
+
+
+def _open_output(path: str) -> TextIO:
+    if path == '-':
+        return sys.stdout
+    if path.endswith('.gz'):
+        return gzip.open(path, 'wt', compresslevel=6, encoding='utf-8', newline='')
+    return open(path, 'w', encoding='utf-8', newline='')
+
+
+async def export(out: TextIO, fmt: str = 'csv', since: Watermark = EPOCH, include_text: bool = True,
+                 batch_size: int = 5000, lag: float = 60.0) -> Tuple[int, Watermark]:
+    """Writes every confession after `since`. Returns the row count and the new watermark."""
+    writer = WRITERS[fmt](out, include_text)
+    pseudonyms = {}
+    count = 0
+    watermark = since
+    conn = await asyncpg.connect(EXPORT_DATABASE_URL)
+    try:
+        async with conn.transaction(isolation='repeatable_read', readonly=True):
+            cursor = await conn.cursor(EXPORT_QUERY, since[0], since[1], lag)
+            while True:
+                rows = await cursor.fetch(batch_size)
+                if not rows:
+                    break
+                batch = []
+                for r in rows:
+                    author = pseudonyms.get(r['author_id'])
+                    if author is None:
+                        author = pseudonyms[r['author_id']] = pseudonymize_userid(r['author_id'])
+                    row = [r['id'], r['created_at'].isoformat(), r['category'], author]
+                    if include_text:
+                        row.append(r['text'])
+                    row += [r['relatable_count'], r['support_count'], r['comments_count'], r['channel_message_id']]
+                    batch.append(row)
+                writer.write(batch)
+                count += len(rows)
+                watermark = (rows[-1]['created_at'], rows[-1]['id'])
+                # Pseudonyms are memoized per author; dropped now and then to keep memory flat.
+                if len(pseudonyms) > 100_000:
+                    pseudonyms.clear()
+    finally:
+        await conn.close()
+    return count, watermark
+
+
+async def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Stream confessions with reaction and comment counts to CSV or NDJSON.")
+    parser.add_argument('--format', choices=sorted(WRITERS), default='csv')
+    parser.add_argument('--output', default='-', help="File to write ('-' for stdout); a .gz suffix compresses it")
+    parser.add_argument('--since', type=datetime.fromisoformat, help="Export rows created after this time (ISO 8601)")
+    parser.add_argument('--since-id', type=int, default=0, help="With --since: also rows at exactly that time with a larger id")
+    parser.add_argument('--watermark-file', help="Read the watermark from this file and store the new one after the export")
+    parser.add_argument('--no-text', action='store_true', help="Leave out the confession text")
+    parser.add_argument('--batch-size', type=int, default=5000, help="Rows fetched from the cursor at a time")
+    parser.add_argument('--lag', type=float, default=60.0, help="Skip confessions younger than this many seconds")
+    args = parser.parse_args(argv)
+
+    since = EPOCH
+    if args.since:
+        since = (args.since if args.since.tzinfo else args.since.replace(tzinfo=timezone.utc), args.since_id)
+    elif args.watermark_file:
+        since = read_watermark(args.watermark_file) or EPOCH
+
+    out = _open_output(args.output)
+    started = time.perf_counter()
+    try:
+        count, watermark = await export(out, args.format, since, not args.no_text, args.batch_size, args.lag)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    elapsed = time.perf_counter() - started
+    # The watermark only moves once the output is complete.
+    if args.watermark_file:
+        write_watermark(args.watermark_file, watermark)
+    print(
+        f"Exported {count} confessions in {elapsed:.1f}s ({count / elapsed if elapsed else 0:.0f} rows/s); "
+        f"watermark {watermark[0].isoformat()} #{watermark[1]}",
+        file=sys.stderr
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
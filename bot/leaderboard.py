@@ -0,0 +1,166 @@
+import asyncio
+import heapq
+import logging
+import datetime
+from typing import Dict, List, Optional, Tuple
+from config import LEADERBOARD_RECONCILE_INTERVAL
+from db import fetch, query
+
+# In-memory leaderboards.
+# Confessions created within the last week are grouped into hourly buckets,
+# each keeping its own top-N. A window is answered by merging the top-N of
+# the buckets it covers, so sliding the window never rescans anything.
+# Scores only ever grow (reactions are never removed), which is what lets a
+# bounded top-N be maintained incrementally.
+
+TOP_N = 10
+BUCKET_SECONDS = 3600
+WINDOWS = {
+    'day': datetime.timedelta(days=1),
+    'week': datetime.timedelta(days=7),
+}
+RETENTION = max(WINDOWS.values())
+
+TEXTS_BY_ID = query('leaderboard_texts', "SELECT id, text FROM confessions WHERE id = ANY($1::int[])")
+RECENT_SCORES = query('leaderboard_recent', """
+    SELECT id, text, created_at, relatable_count + support_count AS total_reactions
+    FROM confessions
+    WHERE created_at >= NOW() - $1::interval
+""")
+BEST_SCORES = query('leaderboard_best', """
+    SELECT id, text, created_at, relatable_count + support_count AS total_reactions
+    FROM confessions
+    ORDER BY relatable_count + support_count DESC, id DESC
+    LIMIT $1
+""")
+
+
+class _TopN:
+    """Keeps the N highest (score, id) pairs offered so far."""
+
+    def __init__(self, size: int):
+        self.size = size
+        self.items: Dict[int, int] = {}
+
+    def offer(self, conf_id: int, score: int):
+        if conf_id in self.items or len(self.items) < self.size:
+            self.items[conf_id] = score
+            return
+        weakest = min(self.items, key=lambda i: (self.items[i], i))
+        if (score, conf_id) > (self.items[weakest], weakest):
+            del self.items[weakest]
+            self.items[conf_id] = score
+
+
+class _Bucket:
+    def __init__(self):
+        self.scores: Dict[int, int] = {}
+        self.top = _TopN(TOP_N)
+
+
+_buckets: Dict[int, _Bucket] = {}
+_created: Dict[int, float] = {}  # confession id -> created_at timestamp, for confessions in a bucket
+_texts: Dict[int, str] = {}
+_all_time = _TopN(TOP_N)
+_reconciler: Optional[asyncio.Task] = None
+
+
+def _bucket_key(ts: float) -> int:
+    return int(ts // BUCKET_SECONDS)
+
+
+def _evict_expired(now: float):
+    oldest = _bucket_key(now - RETENTION.total_seconds())
+    for key in [k for k in _buckets if k < oldest]:
+        for conf_id in _buckets.pop(key).scores:
+            _created.pop(conf_id, None)
+            if conf_id not in _all_time.items:
+                _texts.pop(conf_id, None)
+
+
+def _track(conf_id: int, score: int, created_at: datetime.datetime, text: Optional[str] = None):
+    ts = created_at.timestamp()
+    now = datetime.datetime.now(datetime.timezone.utc).timestamp()
+    if text is not None:
+        _texts[conf_id] = text
+    if ts >= now - RETENTION.total_seconds():
+        bucket = _buckets.setdefault(_bucket_key(ts), _Bucket())
+        bucket.scores[conf_id] = score
+        bucket.top.offer(conf_id, score)
+        _created[conf_id] = ts
+    _all_time.offer(conf_id, score)
+
+
+def add_confession(conf_id: int, created_at: datetime.datetime, text: str):
+    """Registers a freshly posted confession with zero reactions."""
+    _track(conf_id, 0, created_at, text)
+
+
+def update_score(conf_id: int, score: int, created_at: datetime.datetime):
+    """Records the new total reaction count of a confession."""
+    _track(conf_id, score, created_at)
+
+
+def top(period: str) -> List[Tuple[int, int]]:
+    """Returns up to TOP_N (confession id, reactions) pairs for 'day', 'week' or 'all'."""
+    if period == 'all':
+        candidates = _all_time.items.items()
+    else:
+        now = datetime.datetime.now(datetime.timezone.utc).timestamp()
+        _evict_expired(now)
+        cutoff = now - WINDOWS[period].total_seconds()
+        first = _bucket_key(cutoff)
+        candidates = []
+        for key, bucket in _buckets.items():
+            if key > first:
+                candidates.extend(bucket.top.items.items())
+            elif key == first:
+                # The bucket straddling the cutoff is filtered exactly.
+                candidates.extend((i, s) for i, s in bucket.scores.items() if _created[i] >= cutoff)
+    return heapq.nlargest(TOP_N, candidates, key=lambda item: (item[1], item[0]))
+
+
+async def leaderboard(period: str) -> List[dict]:
+    """Returns the ranked rows (id, text, total_reactions) for a period."""
+    ranked = top(period)
+    missing = [conf_id for conf_id, _ in ranked if conf_id not in _texts]
+    if missing:
+        # Primary-key lookups only; happens for entries learned from another worker.
+        for r in await fetch(TEXTS_BY_ID, missing):
+            _texts[r['id']] = r['text']
+    return [
+        {'id': conf_id, 'text': _texts.get(conf_id, ''), 'total_reactions': score}
+        for conf_id, score in ranked
+    ]
+
+
+async def reconcile():
+    """Rebuilds all structures from Postgres, correcting any drift."""
+    global _buckets, _created, _texts, _all_time
+    recent = await fetch(RECENT_SCORES, RETENTION)
+    best = await fetch(BEST_SCORES, TOP_N)
+
+    _buckets, _created, _texts, _all_time = {}, {}, {}, _TopN(TOP_N)
+    for r in list(recent) + list(best):
+        _track(r['id'], r['total_reactions'], r['created_at'], r['text'])
+
+
+async def _reconcile_forever():
+    while True:
+        await asyncio.sleep(LEADERBOARD_RECONCILE_INTERVAL)
+        try:
+            await reconcile()
+        except Exception as e:
+            logging.warning(f"Leaderboard reconciliation failed: {e}")
+
+
+async def start_leaderboard():
+    """Loads the initial state and starts periodic reconciliation."""
+    global _reconciler
+    await reconcile()
+    _reconciler = asyncio.create_task(_reconcile_forever())
+
+
+async def stop_leaderboard():
+    if _reconciler:
+        _reconciler.cancel()
@@ -1,26 +1,80 @@
+import html
 import logging
-import datetime
-from aiogram import Bot, Dispatcher, executor, types
-from aiogram.contrib.fsm_storage.memory import MemoryStorage
+import asyncpg
+from aiogram import Dispatcher, executor, types
+from aiogram.bot.api import TelegramAPIServer, TELEGRAM_PRODUCTION
 from aiogram.dispatcher import FSMContext
 from aiogram.dispatcher.filters.state import State, StatesGroup
-from aiogram.utils.exceptions import MessageNotModified, ChatNotFound
+from aiogram.utils.exceptions import ChatNotFound, MessageNotModified
 
 # --- Make sure you have these files in the same 'bot' directory ---
 # Note: These files (config.py, db.py, utils.py) are assumed to exist and are not part of this script.
-from config import BOT_TOKEN, CHANNEL_USERNAME, NOTIFY_DELTA
-from db import init_db, fetchrow, fetch, execute, close_db
-from utils import sanitize_text, encrypt_userid, decrypt_userid
+from config import BOT_TOKEN, CHANNEL_USERNAME, TELEGRAM_API_URL, CONFESSION_CACHE_SIZE, CONFESSION_CACHE_TTL, PARTITION_MONTHS_AHEAD
+from db import init_db, fetchrow, execute, close_db, query, pool_stats
+from utils import sanitize_text, encrypt_userid
+from moderation import moderate, REJECT
+from storage import create_storage
+from ratelimit import create_limiter, rate_limit, RateLimitMiddleware
+from outbound import send, start_outbound, stop_outbound, USER_REPLY, CHANNEL_POST, stats as outbound_stats
+from markup_updater import init_updater, schedule_markup_edit, flush_pending, stats as markup_stats
+from cache import AsyncCache
+import cache
+import metrics
+import leaderboard
+import comment_pages
+import my_confessions
+import search
+import notifier
+import owners
+import reactions
 
 logging.basicConfig(level=logging.INFO)
 
 # --- Bot Initialization ---
-bot = Bot(token=BOT_TOKEN)
-storage = MemoryStorage()
+bot = metrics.InstrumentedBot(token=BOT_TOKEN, server=TelegramAPIServer.from_base(TELEGRAM_API_URL) if TELEGRAM_API_URL else TELEGRAM_PRODUCTION)
+storage = create_storage()
 dp = Dispatcher(bot, storage=storage)
+dp.middleware.setup(metrics.MetricsMiddleware())
+limiter = create_limiter()
+dp.middleware.setup(RateLimitMiddleware(limiter))
 
 CATEGORIES = ['💔 Love', '💼 Work', '👨‍👩‍👧 Family', '😔 Mental Health', '😜 Funny', '🎲 Random']
-CONFESSION_COOLDOWN = datetime.timedelta(minutes=5)
+REACTION_TYPES = ('relatable', 'support')
+REJECTED_MESSAGE = "Sorry, your message contains content that isn't allowed here. Please rephrase it and try again."
+
+# -------------------- Queries --------------------
+CONFESSION_BY_ID = query('confession_by_id', """
+    SELECT id, text, channel_chat_id, channel_message_id, author_id, created_at
+    FROM confessions WHERE id=$1
+""")
+INSERT_CONFESSION = query('insert_confession', """
+    INSERT INTO confessions(author_id, author_user_id, channel_chat_id, channel_message_id, category, text, search_vector)
+    VALUES($1, $2, $3, $4, $5, $6, to_tsvector('english', $6)) RETURNING id, created_at
+""")
+# Inserts the comment and bumps the counter in one statement. The comment
+# goes to the partition of its confession's month (007).
+ADD_COMMENT = query('add_comment', """
+    WITH ins AS (
+        INSERT INTO comments(confession_id, commenter_user_id, text, confession_created_at)
+        SELECT id, $2, $3, created_at FROM confessions WHERE id = $1
+        RETURNING confession_id
+    )
+    UPDATE confessions c
+    SET comments_count = c.comments_count + 1
+    FROM ins
+    WHERE c.id = ins.confession_id
+    RETURNING c.id, c.relatable_count, c.support_count, c.comments_count,
+              c.channel_chat_id, c.channel_message_id, c.author_id, c.last_notified_count
+""")
+
+# Creates this month's and upcoming partitions of reactions/comments (007).
+ENSURE_PARTITIONS = query('ensure_partitions', "SELECT ensure_engagement_partitions($1)")
+
+# Confession rows never change once posted; missing ids are remembered briefly.
+confessions = AsyncCache(
+    'confessions', lambda conf_id: fetchrow(CONFESSION_BY_ID, conf_id),
+    maxsize=CONFESSION_CACHE_SIZE, ttl=CONFESSION_CACHE_TTL, negative_ttl=10
+)
 
 # -------------------- FSMs (State Machines) --------------------
 class ConfessState(StatesGroup):
@@ -30,6 +84,17 @@ class ConfessState(StatesGroup):
 class CommentState(StatesGroup):
     waiting_text = State()
 
+# -------------------- Keyboards --------------------
+def confession_keyboard(conf_id: int, relatable: int = 0, support: int = 0, comments: int = 0) -> types.InlineKeyboardMarkup:
+    inline = types.InlineKeyboardMarkup(row_width=2)
+    inline.add(
+        types.InlineKeyboardButton(f"👍 Relatable ({relatable})", callback_data=f"react:relatable:{conf_id}"),
+        types.InlineKeyboardButton(f"❤️ Support ({support})", callback_data=f"react:support:{conf_id}"),
+        types.InlineKeyboardButton(f"💬 Comments ({comments})", callback_data=f"viewcomments:{conf_id}"),
+        types.InlineKeyboardButton("➕ Add Comment", callback_data=f"givecomment:{conf_id}")
+    )
+    return inline
+
 # -------------------- Bot Commands --------------------
 @dp.message_handler(commands=['start'], state='*')
 async def cmd_start(m: types.Message, state: FSMContext):
@@ -43,22 +108,22 @@ async def cmd_start(m: types.Message, state: FSMContext):
         try:
             confession_id = int(args.split('_')[1])
             # FIX 3: Fetch confession text to provide context
-            confession = await fetchrow("SELECT id, text FROM confessions WHERE id=$1", confession_id)
+            confession = await confessions.get(confession_id)
             if confession:
                 await state.update_data(confession_id=confession_id)
                 
                 # FIX 3: Reply with the original confession text quoted
                 reply_text = (
                     f"You are leaving an anonymous comment for confession #{confession_id}:\n\n"
-                    f"<blockquote>{sanitize_text(confession['text'])}</blockquote>\n\n"
+                    f"<blockquote>{html.escape(sanitize_text(confession['text']), quote=False)}</blockquote>\n\n"
                     "<b>Please type your comment below:</b>"
                 )
-                await m.reply(reply_text, parse_mode=types.ParseMode.HTML)
+                await send(USER_REPLY, m.chat.id, m.reply, reply_text, parse_mode=types.ParseMode.HTML)
                 await CommentState.waiting_text.set()
             else:
-                await m.reply("Sorry, the confession you're trying to comment on doesn't exist anymore.")
+                await send(USER_REPLY, m.chat.id, m.reply, "Sorry, the confession you're trying to comment on doesn't exist anymore.")
         except (ValueError, IndexError):
-            await m.reply("Invalid comment link.")
+            await send(USER_REPLY, m.chat.id, m.reply, "Invalid comment link.")
         return
 
     # FIX 1: Improved welcome message with clear calls to action.
@@ -68,7 +133,7 @@ async def cmd_start(m: types.Message, state: FSMContext):
         "➡️ Use /confess to post a new confession.\n"
         "➡️ Use /help to see everything I can do."
     )
-    await m.reply(welcome_text)
+    await send(USER_REPLY, m.chat.id, m.reply, welcome_text)
 
 
 @dp.message_handler(commands=['help'], state='*')
@@ -84,26 +149,21 @@ async def cmd_help(m: types.Message, state: FSMContext):
         "I'm here to provide a safe space for you to share your thoughts, secrets, and stories anonymously.\n\n"
         "*Here are the commands you can use:*\n\n"
         "`🔹 /confess` - Start the process of posting a new anonymous confession.\n\n"
-        "`🔹 /leaderboard` - See the most popular confessions! You'll get options to view the top posts from today or this week.\n\n"
+        "`🔹 /leaderboard` - See the most popular confessions! You'll get options to view the top posts from today, this week or all time.\n\n"
         "`🔹 /my_confessions` - View a list of all the confessions you have personally made.\n\n"
+        "`🔹 /search <words>` - Find confessions by their text, optionally within one category.\n\n"
         "`🔹 /help` - Show this message again.\n\n"
         "Your identity is always kept secret. Feel free to express yourself."
     )
-    await m.reply(help_text, parse_mode=types.ParseMode.MARKDOWN)
+    await send(USER_REPLY, m.chat.id, m.reply, help_text, parse_mode=types.ParseMode.MARKDOWN)
 
 
 @dp.message_handler(commands=['confess'])
+@rate_limit('confess', consume=False)
 async def cmd_confess(m: types.Message):
-    user_id = m.from_user.id
-    last_confession = await fetchrow("SELECT created_at FROM confessions WHERE author_id = $1 ORDER BY created_at DESC LIMIT 1", user_id)
-
-    if last_confession:
-        time_since = datetime.datetime.now(datetime.timezone.utc) - last_confession['created_at']
-        if time_since < CONFESSION_COOLDOWN:
-            remaining = CONFESSION_COOLDOWN - time_since
-            minutes, seconds = divmod(int(remaining.total_seconds()), 60)
-            await m.reply(f"Please wait {minutes}m {seconds}s before confessing again.")
-            return
+    # RateLimitMiddleware only checks the cooldown (RATE_LIMIT_CONFESS) here;
+    # the token is taken in receive_confession once the confession is posted,
+    # so a cancelled or rejected confession does not start the cooldown.
 
     # Create an inline keyboard for categories and the cancel button
     inline_kb = types.InlineKeyboardMarkup(row_width=2)
@@ -113,7 +173,7 @@ async def cmd_confess(m: types.Message):
     # Add the cancel button on its own row at the bottom
     inline_kb.row(types.InlineKeyboardButton("❌ Cancel Confession", callback_data="cancel_confession"))
 
-    await m.reply("Pick a category for your confession:", reply_markup=inline_kb)
+    await send(USER_REPLY, m.chat.id, m.reply, "Pick a category for your confession:", reply_markup=inline_kb)
     await ConfessState.waiting_category.set()
 
 # -------------------- Confession Flow --------------------
@@ -124,55 +184,50 @@ async def category_chosen(cb: types.CallbackQuery, state: FSMContext):
     await state.update_data(category=category)
     
     # Edit the message to remove the category buttons and ask for text
-    await cb.message.edit_text("Type your confession below. It will be posted anonymously.")
+    await send(USER_REPLY, cb.message.chat.id, cb.message.edit_text, "Type your confession below. It will be posted anonymously.")
     
     # Add inline cancel button for text input stage, sent as a new message
     inline_cancel_kb = types.InlineKeyboardMarkup().add(
         types.InlineKeyboardButton("❌ Cancel Confession", callback_data="cancel_confession")
     )
-    await bot.send_message(cb.from_user.id, "Remember, you can always stop.", reply_markup=inline_cancel_kb)
+    await send(USER_REPLY, cb.from_user.id, bot.send_message, cb.from_user.id, "Remember, you can always stop.", reply_markup=inline_cancel_kb)
     await ConfessState.waiting_text.set()
 
 @dp.message_handler(state=ConfessState.waiting_text)
 async def receive_confession(m: types.Message, state: FSMContext):
     data = await state.get_data()
     category = data.get('category')
-    text = sanitize_text(m.text)
+    verdict = moderate(m.text or '')
+    text = verdict.text
     author_id = m.from_user.id
 
+    if verdict.action == REJECT:
+        await send(USER_REPLY, m.chat.id, m.reply, REJECTED_MESSAGE)
+        return
     if not text or len(text) < 5:
-        await m.reply("Your confession seems too short. Please try again with at least 5 characters.")
+        await send(USER_REPLY, m.chat.id, m.reply, "Your confession seems too short. Please try again with at least 5 characters.")
         # User is still in ConfessState.waiting_text, so the cancel button remains
         return
 
-    inline = types.InlineKeyboardMarkup(row_width=2)
-    inline.add(
-        types.InlineKeyboardButton("👍 Relatable (0)", callback_data="react:relatable:0"),
-        types.InlineKeyboardButton("❤️ Support (0)", callback_data="react:support:0"),
-        types.InlineKeyboardButton("💬 Comments (0)", callback_data="viewcomments:0"),
-        types.InlineKeyboardButton("➕ Add Comment", callback_data="givecomment:0")
-    )
+    inline = confession_keyboard(0)
 
-    posted = await bot.send_message(CHANNEL_USERNAME, f"{category} Anonymous Confession\n\n\"{text}\"", reply_markup=inline)
+    posted = await send(CHANNEL_POST, CHANNEL_USERNAME, bot.send_message, CHANNEL_USERNAME, f"{category} Anonymous Confession\n\n\"{text}\"", reply_markup=inline)
+    # The confession is out: start the cooldown checked by cmd_confess.
+    await limiter.hit('confess', author_id)
     enc_author = encrypt_userid(author_id)
 
-    row = await fetchrow("""
-        INSERT INTO confessions(author_id, author_user_id, channel_chat_id, channel_message_id, category, text)
-        VALUES($1, $2, $3, $4, $5, $6) RETURNING id
-    """, author_id, enc_author, posted.chat.id, posted.message_id, category, text)
+    row = await fetchrow(INSERT_CONFESSION, author_id, enc_author, posted.chat.id, posted.message_id, category, text)
     confession_id = row['id']
+    leaderboard.add_confession(confession_id, row['created_at'], text)
+    confessions.put(confession_id, {
+        'id': confession_id, 'text': text, 'channel_chat_id': posted.chat.id,
+        'channel_message_id': posted.message_id, 'author_id': author_id, 'created_at': row['created_at'],
+    })
 
-    new_inline = types.InlineKeyboardMarkup(row_width=2)
-    new_inline.add(
-        types.InlineKeyboardButton("👍 Relatable (0)", callback_data=f"react:relatable:{confession_id}"),
-        types.InlineKeyboardButton("❤️ Support (0)", callback_data=f"react:support:{confession_id}"),
-        types.InlineKeyboardButton(f"💬 Comments (0)", callback_data=f"viewcomments:{confession_id}"),
-        types.InlineKeyboardButton("➕ Add Comment", callback_data=f"givecomment:{confession_id}")
-    )
-    await bot.edit_message_reply_markup(chat_id=posted.chat.id, message_id=posted.message_id, reply_markup=new_inline)
+    await send(CHANNEL_POST, posted.chat.id, bot.edit_message_reply_markup, chat_id=posted.chat.id, message_id=posted.message_id, reply_markup=confession_keyboard(confession_id))
 
     link = f"https://t.me/{CHANNEL_USERNAME.strip('@')}/{posted.message_id}"
-    await m.reply(f"✅ Your confession has been posted anonymously!\n\n🔗 View it here: {link}\n\nSee /leaderboard to see top confessions!")
+    await send(USER_REPLY, m.chat.id, m.reply, f"✅ Your confession has been posted anonymously!\n\n🔗 View it here: {link}\n\nSee /leaderboard to see top confessions!")
     await state.finish()
 
 # -------------------- Cancel Confession Handler --------------------
@@ -181,61 +236,44 @@ async def cancel_confession(cb: types.CallbackQuery, state: FSMContext):
     await cb.answer("Confession cancelled.", show_alert=False)
     await state.finish()
     try:
-        await cb.message.edit_text("❌ Your confession has been cancelled.")
+        await send(USER_REPLY, cb.message.chat.id, cb.message.edit_text, "❌ Your confession has been cancelled.")
     except Exception as e:
         # Fallback if editing fails (e.g., message is too old)
         logging.warning(f"Could not edit message on cancel: {e}")
-        await bot.send_message(cb.from_user.id, "❌ Your confession has been cancelled.")
+        await send(USER_REPLY, cb.from_user.id, bot.send_message, cb.from_user.id, "❌ Your confession has been cancelled.")
 
 
 # -------------------- Notifications and Reactions --------------------
-async def update_reactions_and_notify(conf_id: int, user_id: int, notification_type: str):
-    counts = await fetch("SELECT reaction_type, COUNT(*) AS c FROM reactions WHERE confession_id=$1 GROUP BY reaction_type", conf_id)
-    mapping = {r['reaction_type']: r['c'] for r in counts}
-    r_rel = mapping.get('relatable', 0)
-    r_sup = mapping.get('support', 0)
+async def update_reactions_and_notify(row, notify_author: bool):
+    """Refreshes the channel keyboard and notifies the author.
 
-    comments_count_row = await fetchrow("SELECT COUNT(*) as c FROM comments WHERE confession_id=$1", conf_id)
-    c_count = comments_count_row['c'] if comments_count_row else 0
+    `row` is the confession row returned by the reaction/comment insert,
+    carrying the fresh counters and the channel/author ids. `notify_author`
+    is False when the author was the only one acting.
+    """
+    conf_id = row['id']
+    chat_id, msg_id, author_id = row['channel_chat_id'], row['channel_message_id'], row['author_id']
+    counts = (row['relatable_count'], row['support_count'], row['comments_count'])
 
-    row = await fetchrow("SELECT channel_chat_id, channel_message_id, author_id FROM confessions WHERE id=$1", conf_id)
-    if not row:
-        return
+    # Edits are coalesced per confession to stay under Telegram's per-chat edit limits.
+    owners.dispatch('keyboard', conf_id, conf_id, chat_id, msg_id, counts)
 
-    chat_id, msg_id, author_id = row['channel_chat_id'], row['channel_message_id'], row['author_id']
-    
-    new_inline = types.InlineKeyboardMarkup(row_width=2)
-    new_inline.add(
-        types.InlineKeyboardButton(f"👍 Relatable ({r_rel})", callback_data=f"react:relatable:{conf_id}"),
-        types.InlineKeyboardButton(f"❤️ Support ({r_sup})", callback_data=f"react:support:{conf_id}"),
-        types.InlineKeyboardButton(f"💬 Comments ({c_count})", callback_data=f"viewcomments:{conf_id}"),
-        types.InlineKeyboardButton("➕ Add Comment", callback_data=f"givecomment:{conf_id}")
-    )
-    
-    try:
-        await bot.edit_message_reply_markup(chat_id=chat_id, message_id=msg_id, reply_markup=new_inline)
-    except MessageNotModified:
-        pass # Ignore if markup is the same
-    except Exception as e:
-        logging.warning(f"Could not edit message markup for {conf_id}: {e}")
-
-    # Notify author if it's not their own action
-    if author_id != user_id:
-        link = f"https://t.me/{CHANNEL_USERNAME.strip('@')}/{msg_id}"
-        if notification_type == 'reaction':
-            message = f"🎉 Someone reacted to your confession #{conf_id}!\n\nTap to view: {link}"
-        else: # 'comment'
-            message = f"💬 Someone commented on your confession #{conf_id}!\n\nTap to view: {link}"
-        
-        try:
-            await bot.send_message(author_id, message)
-        except ChatNotFound:
-            logging.warning(f"Could not send notification to author {author_id}: Chat not found (user might have blocked the bot).")
-        except Exception as e:
-            logging.error(f"Could not send notification to author {author_id}: {e}")
+    # Notify author if it's not their own action; notifier batches and throttles these.
+    if notify_author:
+        owners.dispatch('notify', author_id, author_id, conf_id, msg_id, sum(counts), row['last_notified_count'])
+
+
+def refresh_keyboard(conf_id: int, chat_id: int, msg_id: int, counts):
+    """Runs in the confession's owner (see owners.py)."""
+    schedule_markup_edit(conf_id, chat_id, msg_id, confession_keyboard(conf_id, *counts), counts)
+
+
+owners.register('keyboard', refresh_keyboard)
+owners.register('notify', notifier.record)
 
 
 @dp.callback_query_handler(lambda c: c.data and c.data.startswith('react:'), state='*')
+@rate_limit('react')
 async def on_react(cb: types.CallbackQuery):
     _, rtype, conf_id_str = cb.data.split(':')
     conf_id = int(conf_id_str)
@@ -244,14 +282,24 @@ async def on_react(cb: types.CallbackQuery):
     if conf_id == 0:
         await cb.answer("Please wait a moment...", show_alert=True)
         return
+    if rtype not in REACTION_TYPES:
+        await cb.answer()
+        return
 
-    try:
-        await execute("INSERT INTO reactions(confession_id, user_id, reaction_type) VALUES($1,$2,$3)", conf_id, user_id, rtype)
-        await cb.answer("Thanks for reacting!")
-        await update_reactions_and_notify(conf_id, user_id, notification_type='reaction')
-    except Exception:
+    if not await confessions.get(conf_id):
+        await cb.answer("This confession does not seem to exist anymore.")
+        return
+    # Answered right away; reactions.py writes the reaction with the next batch.
+    if not reactions.add(conf_id, user_id, rtype):
         await cb.answer("You've already reacted with this type.")
         return
+    await cb.answer("Thanks for reacting!")
+
+
+async def on_reactions_flushed(row):
+    """Applies a confession's new counters after a batch of reactions was written."""
+    leaderboard.update_score(row['id'], row['relatable_count'] + row['support_count'], row['created_at'])
+    await update_reactions_and_notify(row, any(actor != row['author_id'] for actor in row['actors']))
 
 # -------------------- Commenting Flow --------------------
 @dp.callback_query_handler(lambda c: c.data and c.data.startswith('givecomment:'), state='*')
@@ -265,11 +313,13 @@ async def on_add_comment(cb: types.CallbackQuery):
         logging.warning("User clicked on givecomment button with confession_id 0")
         return
 
-    bot_info = await bot.get_me()
+    # Resolved once in on_startup and cached by aiogram afterwards.
+    bot_info = await bot.me
     comment_link = f"https://t.me/{bot_info.username}?start=comment_{confession_id}"
     
     try:
-        await bot.send_message(
+        await send(
+            USER_REPLY, cb.from_user.id, bot.send_message,
             cb.from_user.id,
             f"To leave an anonymous comment on confession #{confession_id}, please click the button below.",
             reply_markup=types.InlineKeyboardMarkup().add(
@@ -277,70 +327,107 @@ async def on_add_comment(cb: types.CallbackQuery):
             )
         )
     except ChatNotFound:
-        await bot.send_message(cb.from_user.id, "I couldn't send you the comment link because I can't start a chat with you. Please start a chat with me first!")
+        await send(USER_REPLY, cb.from_user.id, bot.send_message, cb.from_user.id, "I couldn't send you the comment link because I can't start a chat with you. Please start a chat with me first!")
     except Exception:
-        await bot.send_message(cb.from_user.id, "I couldn't send you the comment link. Have you started a chat with me and are you not blocking me?")
+        await send(USER_REPLY, cb.from_user.id, bot.send_message, cb.from_user.id, "I couldn't send you the comment link. Have you started a chat with me and are you not blocking me?")
 
 
 @dp.message_handler(state=CommentState.waiting_text)
+@rate_limit('comment')
 async def handle_comment(m: types.Message, state: FSMContext):
     data = await state.get_data()
     confession_id = data.get('confession_id')
-    text = m.text.strip()
+    verdict = moderate(m.text or '')
+    text = verdict.text
     commenter_id = m.from_user.id
 
     if not confession_id:
-        await m.reply("Something went wrong. Please try commenting again.")
+        await send(USER_REPLY, m.chat.id, m.reply, "Something went wrong. Please try commenting again.")
         await state.finish()
         return
+    if verdict.action == REJECT:
+        await send(USER_REPLY, m.chat.id, m.reply, REJECTED_MESSAGE)
+        return
     if not text:
-        await m.reply("A comment cannot be empty. Please try again.")
+        await send(USER_REPLY, m.chat.id, m.reply, "A comment cannot be empty. Please try again.")
         return
 
     try:
-        confession = await fetchrow("SELECT channel_chat_id, channel_message_id, author_id FROM confessions WHERE id=$1", confession_id)
-        if not confession:
-            await m.reply("This confession does not seem to exist anymore.")
-            await state.finish()
+        confession = await fetchrow(ADD_COMMENT, confession_id, commenter_id, text)
+        if confession is None:
+            await send(USER_REPLY, m.chat.id, m.reply, "This confession does not seem to exist anymore.")
             return
-
-        await execute("INSERT INTO comments(confession_id, commenter_user_id, text) VALUES($1,$2,$3)", confession_id, commenter_id, text)
+        comment_pages.invalidate(confession_id)
 
         comment_message = f"💬 Anonymous Comment:\n\n\"{text}\""
-        await bot.send_message(
+        await send(
+            CHANNEL_POST, confession['channel_chat_id'], bot.send_message,
             chat_id=confession['channel_chat_id'], text=comment_message, reply_to_message_id=confession['channel_message_id']
         )
         
-        await m.reply("✅ Your anonymous comment has been posted!")
+        await send(USER_REPLY, m.chat.id, m.reply, "✅ Your anonymous comment has been posted!")
         
-        await update_reactions_and_notify(confession_id, commenter_id, notification_type='comment')
+        await update_reactions_and_notify(confession, confession['author_id'] != commenter_id)
 
+    except asyncpg.ForeignKeyViolationError:
+        await send(USER_REPLY, m.chat.id, m.reply, "This confession does not seem to exist anymore.")
     except Exception as e:
         logging.error(f"Failed to save comment for confession {confession_id}: {e}")
-        await m.reply("❌ An error occurred while saving your comment.")
+        await send(USER_REPLY, m.chat.id, m.reply, "❌ An error occurred while saving your comment.")
     finally:
         await state.finish()
 
 
+def comments_page_keyboard(conf_id: int, page) -> types.InlineKeyboardMarkup:
+    _, first_id, last_id, has_prev, has_next = page
+    kb = types.InlineKeyboardMarkup(row_width=2)
+    buttons = []
+    if has_prev:
+        buttons.append(types.InlineKeyboardButton("⬅️ Previous", callback_data=f"cpage:{conf_id}:{comment_pages.PREV}:{first_id}"))
+    if has_next:
+        buttons.append(types.InlineKeyboardButton("Next ➡️", callback_data=f"cpage:{conf_id}:{comment_pages.NEXT}:{last_id}"))
+    kb.add(*buttons)
+    return kb
+
+
 @dp.callback_query_handler(lambda c: c.data and c.data.startswith('viewcomments:'), state='*')
+@rate_limit('view')
 async def view_comments(cb: types.CallbackQuery):
     confession_id = int(cb.data.split(':')[1])
     if confession_id == 0:
         await cb.answer("Please wait a moment...", show_alert=True)
         return
-    rows = await fetch("SELECT text FROM comments WHERE confession_id=$1", confession_id)
-    if not rows:
+    page = await comment_pages.get_page(confession_id)
+    if not page:
         await cb.answer("No comments yet.", show_alert=True)
         return
-    comment_text = "\n\n".join([f"💬 \"{r['text']}\"" for r in rows])
     try:
-        await bot.send_message(cb.from_user.id, f"📜 Comments for confession #{confession_id}:\n\n{comment_text}")
+        await send(
+            USER_REPLY, cb.from_user.id, bot.send_message,
+            cb.from_user.id, page[0], reply_markup=comments_page_keyboard(confession_id, page)
+        )
         await cb.answer()
     except ChatNotFound:
         await cb.answer("I couldn't send you the comments because I can't start a chat with you. Please start a chat with me first!", show_alert=True)
     except Exception:
         await cb.answer("I couldn't send you the comments. Have you started a chat with me?", show_alert=True)
 
+
+@dp.callback_query_handler(lambda c: c.data and c.data.startswith('cpage:'), state='*')
+@rate_limit('view')
+async def page_comments(cb: types.CallbackQuery):
+    _, conf_id_str, direction, anchor_str = cb.data.split(':')
+    confession_id = int(conf_id_str)
+    page = await comment_pages.get_page(confession_id, direction, int(anchor_str))
+    if not page:
+        await cb.answer("No more comments.")
+        return
+    try:
+        await send(USER_REPLY, cb.message.chat.id, cb.message.edit_text, page[0], reply_markup=comments_page_keyboard(confession_id, page))
+    except MessageNotModified:
+        pass
+    await cb.answer()
+
 # -------------------- Leaderboard and My Confessions --------------------
 @dp.message_handler(commands=['leaderboard'])
 async def leaderboard_menu(m: types.Message):
@@ -349,28 +436,23 @@ async def leaderboard_menu(m: types.Message):
         types.InlineKeyboardButton("🏆 Weekly", callback_data="leaderboard:week"),
         types.InlineKeyboardButton("📅 Daily", callback_data="leaderboard:day")
     )
-    await m.reply("Select a leaderboard to view:", reply_markup=kb)
+    kb.row(types.InlineKeyboardButton("🌟 All-time", callback_data="leaderboard:all"))
+    await send(USER_REPLY, m.chat.id, m.reply, "Select a leaderboard to view:", reply_markup=kb)
 
 @dp.callback_query_handler(lambda c: c.data.startswith('leaderboard:'))
+@rate_limit('view')
 async def show_leaderboard(cb: types.CallbackQuery):
     period = cb.data.split(':')[1]
-    
-    interval = '1 DAY' if period == 'day' else '7 DAY'
-    title = 'Daily' if period == 'day' else 'Weekly'
-
-    query = f"""
-        SELECT c.id, c.text, COUNT(r.id) as total_reactions
-        FROM confessions c
-        LEFT JOIN reactions r ON c.id = r.confession_id
-        WHERE c.created_at >= NOW() - INTERVAL '{interval}'
-        GROUP BY c.id, c.text
-        ORDER BY total_reactions DESC, c.id DESC
-        LIMIT 10
-    """
-    rows = await fetch(query)
+    if period not in ('day', 'week', 'all'):
+        period = 'week'
+
+    title = {'day': 'Daily', 'week': 'Weekly', 'all': 'All-time'}[period]
+
+    # Served from the in-memory leaderboard; no aggregate query on the request path.
+    rows = await leaderboard.leaderboard(period)
 
     if not rows:
-        await cb.message.edit_text(f"No confessions with reactions found for the {title} leaderboard.")
+        await send(USER_REPLY, cb.message.chat.id, cb.message.edit_text, f"No confessions with reactions found for the {title} leaderboard.")
         await cb.answer()
         return
 
@@ -379,7 +461,7 @@ async def show_leaderboard(cb: types.CallbackQuery):
         snippet = (r['text'][:70] + '...') if len(r['text']) > 70 else r['text']
         lines.append(f"{i}. #{r['id']}: \"{snippet}\" — Reactions: {r['total_reactions']}")
     
-    await cb.message.edit_text("\n".join(lines))
+    await send(USER_REPLY, cb.message.chat.id, cb.message.edit_text, "\n".join(lines))
     await cb.answer()
 
 @dp.message_handler(commands=['my_confessions'])
@@ -390,58 +472,142 @@ async def my_confessions_menu(m: types.Message):
         types.InlineKeyboardButton("This Week's Confessions", callback_data="my_confessions:week"),
         types.InlineKeyboardButton("All My Confessions", callback_data="my_confessions:all")
     )
-    await m.reply("Select a time period to view your confessions:", reply_markup=kb)
+    await send(USER_REPLY, m.chat.id, m.reply, "Select a time period to view your confessions:", reply_markup=kb)
+
+def my_confessions_keyboard(period: str, page) -> types.InlineKeyboardMarkup:
+    _, first_id, last_id, has_newer, has_older = page
+    kb = types.InlineKeyboardMarkup(row_width=2)
+    buttons = []
+    if has_newer:
+        buttons.append(types.InlineKeyboardButton("⬅️ Newer", callback_data=f"mypage:{period}:{my_confessions.NEWER}:{first_id}"))
+    if has_older:
+        buttons.append(types.InlineKeyboardButton("Older ➡️", callback_data=f"mypage:{period}:{my_confessions.OLDER}:{last_id}"))
+    kb.add(*buttons)
+    return kb
 
 @dp.callback_query_handler(lambda c: c.data.startswith('my_confessions:'))
+@rate_limit('view')
 async def show_my_confessions(cb: types.CallbackQuery):
     period = cb.data.split(':')[1]
-    user_id = cb.from_user.id
+    if period not in my_confessions.PERIODS:
+        period = 'all'
 
-    where_clause = "WHERE c.author_id = $1"
-    params = [user_id]
-    if period == 'day':
-        where_clause += " AND c.created_at >= NOW() - INTERVAL '1 DAY'"
-        title = "Today's"
-    elif period == 'week':
-        where_clause += " AND c.created_at >= NOW() - INTERVAL '7 DAY'"
-        title = "This Week's"
-    else:
-        title = "All Your"
-
-    query = f"""
-        SELECT c.id, c.text, c.channel_message_id, COUNT(r.id) as total_reactions
-        FROM confessions c
-        LEFT JOIN reactions r ON c.id = r.confession_id
-        {where_clause}
-        GROUP BY c.id, c.text, c.channel_message_id
-        ORDER BY c.id DESC
-    """
-    rows = await fetch(query, *params)
-
-    if not rows:
-        await cb.message.edit_text(f"You have not made any confessions in this time period.")
+    page = await my_confessions.get_page(cb.from_user.id, period, CHANNEL_USERNAME)
+    if not page:
+        await send(USER_REPLY, cb.message.chat.id, cb.message.edit_text, f"You have not made any confessions in this time period.")
         await cb.answer()
         return
 
-    lines = [f"📜 {title} Confessions:\n"]
-    for r in rows:
-        link = f"https://t.me/{CHANNEL_USERNAME.strip('@')}/{r['channel_message_id']}"
-        snippet = (r['text'][:50] + '...') if len(r['text']) > 50 else r['text']
-        lines.append(f"• \"{snippet}\" - [View]({link}) ({r['total_reactions']} reactions)")
+    await send(USER_REPLY, cb.message.chat.id, cb.message.edit_text,
+        page[0], parse_mode=types.ParseMode.HTML, disable_web_page_preview=True,
+        reply_markup=my_confessions_keyboard(period, page)
+    )
+    await cb.answer()
 
-    await cb.message.edit_text("\n".join(lines), parse_mode=types.ParseMode.MARKDOWN, disable_web_page_preview=True)
+@dp.callback_query_handler(lambda c: c.data.startswith('mypage:'))
+@rate_limit('view')
+async def page_my_confessions(cb: types.CallbackQuery):
+    _, period, direction, anchor_str = cb.data.split(':')
+    if period not in my_confessions.PERIODS:
+        period = 'all'
+    page = await my_confessions.get_page(cb.from_user.id, period, CHANNEL_USERNAME, direction, int(anchor_str))
+    if not page:
+        await cb.answer("No more confessions.")
+        return
+    try:
+        await send(USER_REPLY, cb.message.chat.id, cb.message.edit_text,
+            page[0], parse_mode=types.ParseMode.HTML, disable_web_page_preview=True,
+            reply_markup=my_confessions_keyboard(period, page)
+        )
+    except MessageNotModified:
+        pass
+    await cb.answer()
+
+
+# -------------------- Search --------------------
+def search_keyboard(terms: str, category_index: str, page: int, has_prev: bool, has_next: bool) -> types.InlineKeyboardMarkup:
+    kb = types.InlineKeyboardMarkup(row_width=4)
+    nav = []
+    if has_prev:
+        nav.append(types.InlineKeyboardButton("⬅️ Previous", callback_data=f"search:{category_index}:{page - 1}:{terms}"))
+    if has_next:
+        nav.append(types.InlineKeyboardButton("Next ➡️", callback_data=f"search:{category_index}:{page + 1}:{terms}"))
+    if nav:
+        kb.row(*nav)
+    filters = [("-", "All")] + [(str(i), c.split()[0]) for i, c in enumerate(CATEGORIES)]
+    kb.add(*[
+        types.InlineKeyboardButton(f"✅ {label}" if index == category_index else label, callback_data=f"search:{index}:0:{terms}")
+        for index, label in filters
+    ])
+    return kb
+
+async def render_search(terms: str, category_index: str, page: int):
+    category = CATEGORIES[int(category_index)] if category_index != "-" else None
+    result = await search.get_page(terms, category, page, CHANNEL_USERNAME)
+    if not result:
+        scope = f" in {category}" if category else ""
+        return f"No confessions found for \"{html.escape(terms)}\"{html.escape(scope)}.", search_keyboard(terms, category_index, 0, False, False)
+    text, has_prev, has_next = result
+    return text, search_keyboard(terms, category_index, page, has_prev, has_next)
+
+@dp.message_handler(commands=['search'])
+@rate_limit('search')
+async def cmd_search(m: types.Message):
+    terms = search.normalize(m.get_args() or '')
+    if not terms:
+        await send(USER_REPLY, m.chat.id, m.reply, "Usage: /search <words>, e.g. /search exam stress")
+        return
+    text, kb = await render_search(terms, "-", 0)
+    await send(USER_REPLY, m.chat.id, m.reply, text, parse_mode=types.ParseMode.HTML, disable_web_page_preview=True, reply_markup=kb)
+
+@dp.callback_query_handler(lambda c: c.data and c.data.startswith('search:'))
+@rate_limit('search')
+async def page_search(cb: types.CallbackQuery):
+    _, category_index, page_str, terms = cb.data.split(':', 3)
+    if category_index != "-" and not (category_index.isdigit() and int(category_index) < len(CATEGORIES)):
+        category_index = "-"
+    text, kb = await render_search(terms, category_index, max(0, int(page_str)))
+    try:
+        await send(USER_REPLY, cb.message.chat.id, cb.message.edit_text, text, parse_mode=types.ParseMode.HTML, disable_web_page_preview=True, reply_markup=kb)
+    except MessageNotModified:
+        pass
     await cb.answer()
 
 
 # -------------------- Startup / Shutdown Hooks --------------------
 async def on_startup(dispatcher):
     await init_db()
+    await execute(ENSURE_PARTITIONS, PARTITION_MONTHS_AHEAD)
+    await bot.me
+    start_outbound()
+    init_updater(bot)
+    notifier.start_notifier(bot)
+    await leaderboard.start_leaderboard()
+    reactions.start_reactions(on_reactions_flushed)
+    metrics.register_stats('db_pool', pool_stats)
+    metrics.register_stats('outbound', outbound_stats)
+    metrics.register_stats('markup_updater', lambda: markup_stats)
+    metrics.register_stats('notifier', lambda: notifier.stats)
+    metrics.register_stats('owners', lambda: owners.stats)
+    metrics.register_stats('cache', cache.stats)
+    metrics.register_stats('reactions', lambda: reactions.stats)
+    await metrics.start_server()
 
 async def on_shutdown(dispatcher):
+    await metrics.stop_server()
+    # Written first: the batch's counters still go to the leaderboard, keyboards and notifier.
+    await reactions.stop_reactions()
+    await leaderboard.stop_leaderboard()
+    await flush_pending()
+    await notifier.stop_notifier()
+    await stop_outbound()
     await close_db()
 
 # -------------------- Main Entry Point --------------------
+# Long polling, for development. Production runs `python webhook.py`.
 if __name__ == "__main__":
+    # Picks up what webhook workers spooled, too.
+    reactions.gather_spools(reactions.spool_file)
     executor.start_polling(
         dp,
         on_startup=on_startup,
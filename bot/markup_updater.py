@@ -0,0 +1,102 @@
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+from aiogram import Bot, types
+from aiogram.utils.exceptions import MessageNotModified, RetryAfter
+from config import MARKUP_EDIT_WINDOW
+from outbound import send, CHANNEL_POST
+
+# Debounced keyboard edits for channel posts.
+# Every reaction/comment only records the latest markup for its confession;
+# a single task per confession waits MARKUP_EDIT_WINDOW seconds and then
+# performs one edit with whatever markup is newest at that point.
+# Counters only grow, so an update whose counts are all at most those last
+# scheduled is older (e.g. a batch committed earlier but delivered later)
+# and is dropped rather than allowed to roll the post back.
+
+MAX_TRACKED = 10000
+
+_bot: Optional[Bot] = None
+_pending: Dict[int, Tuple[int, int, types.InlineKeyboardMarkup]] = {}
+_tasks: Dict[int, asyncio.Task] = {}
+_latest: "OrderedDict[int, Tuple[int, ...]]" = OrderedDict()
+
+stats = {'requested': 0, 'stale': 0, 'edited': 0, 'retry_after': 0, 'failed': 0}
+
+
+def init_updater(bot: Bot):
+    """Sets the bot used to perform the edits."""
+    global _bot
+    _bot = bot
+
+
+def schedule_markup_edit(conf_id: int, chat_id: int, message_id: int, markup: types.InlineKeyboardMarkup,
+                         counts: Optional[Tuple[int, ...]] = None):
+    """
+    Queues a keyboard edit, replacing any edit still pending for this
+    confession. `counts` are the counters shown by `markup`; the edit is
+    skipped when they are not newer than the last ones scheduled.
+    """
+    stats['requested'] += 1
+    if counts is not None:
+        last = _latest.get(conf_id)
+        if last is not None and all(new <= old for new, old in zip(counts, last)):
+            stats['stale'] += 1
+            return
+        _latest[conf_id] = counts
+        _latest.move_to_end(conf_id)
+        if len(_latest) > MAX_TRACKED:
+            _latest.popitem(last=False)
+    _pending[conf_id] = (chat_id, message_id, markup)
+    if conf_id not in _tasks:
+        _tasks[conf_id] = asyncio.create_task(_flush_later(conf_id))
+
+
+async def _flush_later(conf_id: int):
+    try:
+        await asyncio.sleep(MARKUP_EDIT_WINDOW)
+        while conf_id in _pending:
+            chat_id, message_id, markup = _pending.pop(conf_id)
+            try:
+                # retry=False: on flood control we resend the newest markup ourselves.
+                await send(
+                    CHANNEL_POST, chat_id, _bot.edit_message_reply_markup,
+                    chat_id=chat_id, message_id=message_id, reply_markup=markup, retry=False
+                )
+                stats['edited'] += 1
+            except MessageNotModified:
+                pass
+            except RetryAfter as e:
+                # Keep the newest markup if one arrived meanwhile, otherwise retry this one.
+                stats['retry_after'] += 1
+                _pending.setdefault(conf_id, (chat_id, message_id, markup))
+                logging.warning(f"Flood control while editing confession {conf_id}, retrying in {e.timeout}s")
+                await asyncio.sleep(e.timeout)
+                continue
+            except Exception as e:
+                stats['failed'] += 1
+                logging.warning(f"Could not edit message markup for {conf_id}: {e}")
+
+            # Updates that arrived during the edit get their own window.
+            if conf_id in _pending:
+                await asyncio.sleep(MARKUP_EDIT_WINDOW)
+    finally:
+        _tasks.pop(conf_id, None)
+
+
+async def flush_pending():
+    """Sends all pending edits immediately. Used on shutdown."""
+    for task in list(_tasks.values()):
+        task.cancel()
+    await asyncio.gather(*_tasks.values(), return_exceptions=True)
+    while _pending:
+        conf_id, (chat_id, message_id, markup) = _pending.popitem()
+        try:
+            await send(CHANNEL_POST, chat_id, _bot.edit_message_reply_markup, chat_id=chat_id, message_id=message_id, reply_markup=markup, retry=False)
+            stats['edited'] += 1
+        except MessageNotModified:
+            pass
+        except Exception as e:
+            stats['failed'] += 1
+            logging.warning(f"Could not edit message markup for {conf_id} on shutdown: {e}")
@@ -0,0 +1,290 @@
+"""
+Metrics, tracing and profiling.
+
+Handler, Bot API and database latencies are recorded in histograms and
+served in Prometheus text format on http://METRICS_HOST:METRICS_PORT/metrics
+(webhook workers listen on METRICS_PORT + worker index). Recording is a
+dict lookup, a bisect and a few increments, so it stays on the hot path.
+
+The same server toggles a sampling profiler at runtime:
+    POST /profile/start[?interval=0.005]   start sampling the event loop thread
+    POST /profile/stop                     stop and return the folded stacks
+    GET  /profile                          folded stacks collected so far
+The output is in the "folded" format read by flamegraph.pl and speedscope.
+"""
+import sys
+import time
+import bisect
+import logging
+import threading
+from collections import Counter as _Tally
+from contextvars import ContextVar
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+from aiohttp import web
+from aiogram import Bot, types
+from aiogram.dispatcher.handler import current_handler
+from aiogram.dispatcher.middlewares import BaseMiddleware
+from config import METRICS_HOST, METRICS_PORT, PROFILE_INTERVAL
+
+# Bucket upper bounds in seconds; +Inf is implied.
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+def _labels(names: Sequence[str], values: Sequence) -> str:
+    if not names:
+        return ''
+    escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for v in values)
+    return '{' + ','.join(f'{n}="{v}"' for n, v in zip(names, escaped)) + '}'
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name, self.help, self.labelnames = name, help, tuple(labelnames)
+        self.values: Dict[tuple, float] = {}
+        _registry.append(self)
+
+    def inc(self, *labels, amount: float = 1):
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for labels, value in self.values.items():
+            lines.append(f"{self.name}{_labels(self.labelnames, labels)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = BUCKETS):
+        self.name, self.help, self.labelnames = name, help, tuple(labelnames)
+        self.buckets = tuple(buckets)
+        # labels -> [bucket counts..., +Inf count, sum]; counts are not cumulative
+        self.values: Dict[tuple, list] = {}
+        _registry.append(self)
+
+    def observe(self, seconds: float, *labels):
+        v = self.values.get(labels)
+        if v is None:
+            v = self.values[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+        v[bisect.bisect_left(self.buckets, seconds)] += 1
+        v[-1] += seconds
+
+    def snapshot(self, *labels) -> Optional[dict]:
+        v = self.values.get(labels)
+        if v is None:
+            return None
+        return {'buckets': v[:-1], 'count': sum(v[:-1]), 'sum': v[-1]}
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        names = self.labelnames + ('le',)
+        for labels, v in self.values.items():
+            total = 0
+            for bound, count in zip(self.buckets + (float('inf'),), v):
+                total += count
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                lines.append(f"{self.name}_bucket{_labels(names, labels + (le,))} {total}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, labels)} {v[-1]}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, labels)} {total}")
+        return lines
+
+
+_registry: list = []
+_components: List[Tuple[str, Callable[[], dict]]] = []
+
+
+def register_stats(component: str, stats: Callable[[], dict]):
+    """Exports the numeric values of a module's stats dict as gauges."""
+    _components.append((component, stats))
+
+
+def _flatten(prefix: str, value, out: list):
+    if isinstance(value, dict):
+        for k, v in value.items():
+            _flatten(f"{prefix}_{k}" if prefix else str(k), v, out)
+    elif isinstance(value, (int, float)) and not isinstance(value, bool):
+        out.append((prefix, value))
+
+
+def render() -> str:
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    lines.append("# HELP bot_component Internal counters and gauges of the bot's components")
+    lines.append("# TYPE bot_component gauge")
+    for component, stats in _components:
+        flat = []
+        try:
+            _flatten('', stats(), flat)
+        except Exception as e:
+            logging.warning(f"Could not collect stats for {component}: {e}")
+        for name, value in flat:
+            lines.append(f"bot_component{_labels(('component', 'stat'), (component, name))} {value}")
+    return '\n'.join(lines) + '\n'
+
+
+# -------------------- Handlers --------------------
+HANDLER_SECONDS = Histogram('bot_handler_seconds', 'Time spent handling an update', ('update_type', 'handler'))
+HANDLER_ERRORS = Counter('bot_handler_errors_total', 'Updates whose handler raised', ('update_type', 'handler', 'error'))
+
+TIMED_UPDATES = ('message', 'edited_message', 'callback_query', 'inline_query')
+
+# Name of the handler that runs for the current update, for labelling errors.
+_handler_name: ContextVar[str] = ContextVar('metrics_handler', default='none')
+
+
+async def _pre(self, obj, data: dict):
+    data['_metrics_start'] = time.perf_counter()
+    _handler_name.set('none')
+
+
+async def _process(self, obj, data: dict):
+    _handler_name.set(getattr(current_handler.get(), '__name__', 'unknown'))
+
+
+def _post(update_type: str):
+    async def post(self, obj, results, data: dict):
+        start = data.get('_metrics_start')
+        if start is not None:
+            HANDLER_SECONDS.observe(time.perf_counter() - start, update_type, _handler_name.get())
+    return post
+
+
+class MetricsMiddleware(BaseMiddleware):
+    """
+    Times every message/callback query, labelled by update type and handler.
+    Hooks on these levels rather than on the update itself because
+    Dispatcher.process_update (used by the webhook workers) skips the
+    update-level middleware.
+    """
+
+    async def on_pre_process_error(self, update: types.Update, error: Exception, data: dict):
+        HANDLER_ERRORS.inc(_update_type(update), _handler_name.get(), type(error).__name__)
+
+
+for _type in TIMED_UPDATES:
+    setattr(MetricsMiddleware, f'on_pre_process_{_type}', _pre)
+    setattr(MetricsMiddleware, f'on_process_{_type}', _process)
+    setattr(MetricsMiddleware, f'on_post_process_{_type}', _post(_type))
+
+
+def _update_type(update: types.Update) -> str:
+    for field in TIMED_UPDATES:
+        if getattr(update, field, None) is not None:
+            return field
+    return 'other'
+
+
+# -------------------- Bot API --------------------
+API_SECONDS = Histogram('bot_api_seconds', 'Latency of Bot API requests', ('method',))
+API_ERRORS = Counter('bot_api_errors_total', 'Failed Bot API requests', ('method', 'error'))
+
+
+class InstrumentedBot(Bot):
+    """Bot whose every API request is timed and whose failures are counted."""
+
+    async def request(self, method, data=None, files=None, **kwargs):
+        start = time.perf_counter()
+        try:
+            return await super().request(method, data, files, **kwargs)
+        except Exception as e:
+            API_ERRORS.inc(method, type(e).__name__)
+            raise
+        finally:
+            API_SECONDS.observe(time.perf_counter() - start, method)
+
+
+# -------------------- Sampling Profiler --------------------
+class SamplingProfiler:
+    """Samples the stack of one thread from a background thread."""
+
+    def __init__(self):
+        self.samples: _Tally = _Tally()
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None
+
+    def start(self, interval: float, target: Optional[int] = None):
+        if self.running:
+            return
+        self.samples = _Tally()
+        self._stop.clear()
+        target = target or threading.get_ident()
+        self._thread = threading.Thread(target=self._sample, args=(interval, target), name='profiler', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._thread:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+
+    def _sample(self, interval: float, target: int):
+        while not self._stop.wait(interval):
+            frame = sys._current_frames().get(target)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({code.co_filename.rsplit('/', 1)[-1]}:{frame.f_lineno})")
+                frame = frame.f_back
+            if stack:
+                self.samples[';'.join(reversed(stack))] += 1
+
+    def folded(self) -> str:
+        return ''.join(f"{stack} {count}\n" for stack, count in self.samples.most_common())
+
+
+profiler = SamplingProfiler()
+
+
+# -------------------- HTTP Endpoint --------------------
+async def _metrics(request: web.Request) -> web.Response:
+    return web.Response(text=render(), content_type='text/plain', charset='utf-8')
+
+
+async def _profile_start(request: web.Request) -> web.Response:
+    interval = float(request.query.get('interval', PROFILE_INTERVAL))
+    profiler.start(interval, request.app['loop_thread'])
+    return web.Response(text=f"profiling every {interval}s\n")
+
+
+async def _profile_stop(request: web.Request) -> web.Response:
+    profiler.stop()
+    return web.Response(text=profiler.folded())
+
+
+async def _profile(request: web.Request) -> web.Response:
+    return web.Response(text=profiler.folded())
+
+
+_runner: Optional[web.AppRunner] = None
+# Offsets the port so that several processes on one host can each serve metrics.
+instance = 0
+
+
+async def start_server():
+    """Serves /metrics and /profile; a METRICS_PORT of 0 disables the server."""
+    global _runner
+    if not METRICS_PORT or _runner:
+        return
+    app = web.Application()
+    app['loop_thread'] = threading.get_ident()
+    app.router.add_get('/metrics', _metrics)
+    app.router.add_post('/profile/start', _profile_start)
+    app.router.add_post('/profile/stop', _profile_stop)
+    app.router.add_get('/profile', _profile)
+    _runner = web.AppRunner(app, access_log=None)
+    await _runner.setup()
+    port = METRICS_PORT + instance
+    await web.TCPSite(_runner, METRICS_HOST, port).start()
+    logging.info(f"Metrics on http://{METRICS_HOST}:{port}/metrics")
+
+
+async def stop_server():
+    global _runner
+    profiler.stop()
+    if _runner:
+        await _runner.cleanup()
+        _runner = None
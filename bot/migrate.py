@@ -0,0 +1,112 @@
+"""
+Forward-only, versioned schema migrations.
+
+Migrations are the numbered `migrations/NNN_name.sql` files, applied in
+order and recorded in `schema_migrations`. A file is applied in a single
+transaction unless it contains the line `-- migrate: no-transaction`, in
+which case its statements run one by one (required for CREATE INDEX
+CONCURRENTLY).
+
+Usage (from the bot directory):
+    python migrate.py
+The bot also applies pending migrations on startup (see MIGRATE_ON_STARTUP).
+"""
+import os
+import re
+import asyncio
+import logging
+import asyncpg
+from typing import List, Tuple
+from config import DATABASE_URL
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'migrations')
+NO_TRANSACTION_MARKER = '-- migrate: no-transaction'
+FILENAME_RE = re.compile(r'^(\d+)_[\w-]+\.sql$')
+# Arbitrary key for the advisory lock that serializes concurrent runners.
+LOCK_KEY = 0x636f6e66
+LOCK_POLL_INTERVAL = 0.5
+
+
+def discover() -> List[Tuple[str, str]]:
+    """Returns (version, path) for every migration file, in order."""
+    found = []
+    for name in os.listdir(MIGRATIONS_DIR):
+        match = FILENAME_RE.match(name)
+        if match:
+            found.append((int(match.group(1)), name[:-len('.sql')], os.path.join(MIGRATIONS_DIR, name)))
+    return [(version, path) for _, version, path in sorted(found)]
+
+
+def split_statements(sql: str) -> List[str]:
+    """Splits a script on top-level semicolons, leaving $$-quoted bodies intact."""
+    statements, current, in_dollar = [], [], False
+    for line in sql.splitlines():
+        if not in_dollar and line.strip().startswith('--'):
+            continue
+        current.append(line)
+        if line.count('$$') % 2:
+            in_dollar = not in_dollar
+        if not in_dollar and line.rstrip().endswith(';'):
+            statement = '\n'.join(current).strip()
+            if statement.strip(';').strip():
+                statements.append(statement)
+            current = []
+    if '\n'.join(current).strip():
+        statements.append('\n'.join(current).strip())
+    return statements
+
+
+async def _lock(conn: asyncpg.Connection):
+    # pg_try_advisory_lock in a loop instead of a blocking pg_advisory_lock:
+    # a session blocked on the lock would hold a snapshot that CREATE INDEX
+    # CONCURRENTLY in the lock holder has to wait for.
+    while not await conn.fetchval("SELECT pg_try_advisory_lock($1)", LOCK_KEY):
+        await asyncio.sleep(LOCK_POLL_INTERVAL)
+
+
+async def run_migrations(conn: asyncpg.Connection) -> List[str]:
+    """Applies every pending migration and returns the versions applied."""
+    await _lock(conn)
+    try:
+        # Under the lock: concurrent CREATE TABLE IF NOT EXISTS can still
+        # collide on the catalog and fail with a unique violation.
+        await conn.execute("""
+            CREATE TABLE IF NOT EXISTS schema_migrations (
+                version TEXT PRIMARY KEY,
+                applied_at TIMESTAMP WITH TIME ZONE DEFAULT now()
+            )
+        """)
+        applied = {r['version'] for r in await conn.fetch("SELECT version FROM schema_migrations")}
+        done = []
+        for version, path in discover():
+            if version in applied:
+                continue
+            with open(path, encoding='utf-8') as f:
+                sql = f.read()
+            logging.info(f"Applying migration {version}")
+            if NO_TRANSACTION_MARKER in sql:
+                for statement in split_statements(sql):
+                    await conn.execute(statement)
+                await conn.execute("INSERT INTO schema_migrations(version) VALUES($1)", version)
+            else:
+                async with conn.transaction():
+                    await conn.execute(sql)
+                    await conn.execute("INSERT INTO schema_migrations(version) VALUES($1)", version)
+            done.append(version)
+        return done
+    finally:
+        await conn.execute("SELECT pg_advisory_unlock($1)", LOCK_KEY)
+
+
+async def main():
+    conn = await asyncpg.connect(DATABASE_URL)
+    try:
+        done = await run_migrations(conn)
+        print(f"Applied {len(done)} migration(s): {', '.join(done)}" if done else "Database is up to date.")
+    finally:
+        await conn.close()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(main())
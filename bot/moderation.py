@@ -0,0 +1,254 @@
+"""
+Moderation engine for confessions and comments.
+
+Two fixed passes over each message, independent of blocklist size:
+  * one merged regex with the built-in rules (links, obfuscated links,
+    phone numbers, e-mails, @handles), run on the lower-cased text;
+  * one trie-compiled regex holding every blocklist entry, run on the text
+    after folding common look-alike characters (0 -> o, $ -> s, ...).
+Both normalizations keep string length, so match offsets are valid spans
+in the original text.
+
+Blocklists are read from MODERATION_RULES_FILE and reloaded when the file
+changes. Format: a `[category:action]` header followed by one word or
+phrase per line, `#` starts a comment. Actions are `redact` (replace the
+span with [redacted]) and `reject` (refuse the whole message):
+
+    [profanity:redact]
+    some word
+    [threats:reject]
+    some phrase
+"""
+import os
+import re
+import asyncio
+import time
+import logging
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Tuple
+from config import MODERATION_RULES_FILE, MODERATION_RELOAD_INTERVAL
+
+ALLOW, REDACT, REJECT = 'allow', 'redact', 'reject'
+ACTIONS = (REDACT, REJECT)
+REDACTED = '[redacted]'
+
+_TLDS = r'(?:com|net|org|io|me|ru|info|xyz|co|app|ly|gg|tk|link|site|online)'
+_DOT = r'(?:\.|\s*[\[\(\{]\s*(?:\.|dot)\s*[\]\)\}]\s*)'
+# A bare " dot " is ordinary prose ("the dot com bubble", "polka dot me"); it
+# only counts next to another sign of a link: www, an e-mail, a path.
+_ANY_DOT = r'(?:' + _DOT + r'|\s+dot\s+)'
+# Dates (12.03.1995, 2024-10-17) and runs of years (1990-2000, 1998 2003).
+_DATE = (
+    r'(?:\d{1,2}[./-]\d{1,2}[./-](?:\d{4}|\d{2})|\d{4}[./-]\d{1,2}[./-]\d{1,2}'
+    r'|(?:19|20)\d\d(?:\s*[-,/&]\s*|\s+)(?:19|20)\d\d)(?!\d)'
+)
+
+# category -> (action, pattern); applied to the lower-cased text.
+BUILTIN_RULES = {
+    'link': (REDACT, '|'.join([
+        r'(?:https?|hxxps?)\s*(?::|\[:\])\s*//\S+',
+        r'www' + _ANY_DOT + r'\S+(?:' + _ANY_DOT + _TLDS + r'\b\S*)?',
+        r'\bt' + _ANY_DOT + r'me\s*/\s*\S+',
+        # The TLD must end the word: "job.co-workers" is not a link.
+        r'\b[a-z0-9-]+\b' + _DOT + _TLDS + r'(?![\w-])(?:/\S*)?',
+        r'\b[a-z0-9-]+\s+dot\s+' + _TLDS + r'\s*/\s*\S+',
+    ])),
+    'email': (REDACT, r'[\w.+-]+(?:@|\s*[\[\(]\s*at\s*[\]\)]\s*)[\w-]+' + _ANY_DOT + r'[a-z]{2,}'),
+    'phone': (REDACT, '|'.join([
+        # International format: a leading + and at least 7 digits.
+        r'\+\s*\d(?:[\s().-]{0,2}\d){6,}',
+        # Otherwise at least 8 digits, starting at a word boundary, and not a
+        # date or a run of years (see _DATE).
+        r'(?<![\w+])\(?(?!' + _DATE + r')\d(?:[\s().-]{0,2}\d){7,}',
+    ])),
+    'handle': (REDACT, r'(?<![\w.])@[a-z][a-z0-9_]{4,}'),
+}
+
+_LOOKALIKES = str.maketrans({'0': 'o', '1': 'i', '3': 'e', '4': 'a', '5': 's', '7': 't', '@': 'a', '$': 's', '!': 'i'})
+
+
+@dataclass
+class Span:
+    start: int
+    end: int
+    category: str
+    action: str
+
+
+@dataclass
+class Verdict:
+    action: str
+    text: str
+    spans: List[Span] = field(default_factory=list)
+
+    @property
+    def categories(self) -> List[str]:
+        return sorted({s.category for s in self.spans})
+
+
+def _lower(text: str) -> str:
+    lowered = text.lower()
+    if len(lowered) == len(text):
+        return lowered
+    # A few characters lower-case to more than one code point; keep those as is.
+    return ''.join(c.lower() if len(c.lower()) == 1 else c for c in text)
+
+
+def _trie_pattern(words: List[str]) -> str:
+    """Builds a regex equivalent to an alternation of `words`, sharing prefixes."""
+    trie: dict = {}
+    for word in words:
+        node = trie
+        for ch in word:
+            node = node.setdefault(ch, {})
+        node[''] = {}
+
+    def build(node: dict) -> str:
+        terminal = '' in node
+        branches = []
+        for ch in sorted(k for k in node if k):
+            piece = r'\s+' if ch == ' ' else re.escape(ch)
+            branches.append(piece + build(node[ch]))
+        if not branches:
+            return ''
+        body = branches[0] if len(branches) == 1 else '(?:' + '|'.join(branches) + ')'
+        if terminal:
+            return '(?:' + body + ')?'
+        return body
+
+    return build(trie)
+
+
+class Engine:
+    """Compiled rule set. Immutable; a reload builds a new one."""
+
+    def __init__(self, lists: Dict[Tuple[str, str], List[str]]):
+        builtin = '|'.join(f'(?P<{name}>{pattern})' for name, (_, pattern) in BUILTIN_RULES.items())
+        self._builtin = re.compile(builtin)
+
+        # One trie over all words; the category of a hit is looked up afterwards.
+        self._word_rules: Dict[str, Tuple[str, str]] = {}
+        for (category, action), words in lists.items():
+            for word in words:
+                key = ' '.join(_lower(word).translate(_LOOKALIKES).split())
+                if key:
+                    current = self._word_rules.get(key)
+                    # The strictest rule wins when a word is listed twice.
+                    if current is None or (action == REJECT and current[1] != REJECT):
+                        self._word_rules[key] = (category, action)
+        self._words = None
+        if self._word_rules:
+            self._words = re.compile(r'(?<!\w)(?:' + _trie_pattern(list(self._word_rules)) + r')(?!\w)')
+        self.size = len(self._word_rules)
+
+    def check(self, text: str) -> Verdict:
+        lowered = _lower(text)
+        spans = [
+            Span(m.start(), m.end(), m.lastgroup, BUILTIN_RULES[m.lastgroup][0])
+            for m in self._builtin.finditer(lowered)
+        ]
+        if self._words is not None:
+            for m in self._words.finditer(lowered.translate(_LOOKALIKES)):
+                category, action = self._word_rules[' '.join(m.group().split())]
+                spans.append(Span(m.start(), m.end(), category, action))
+
+        if not spans:
+            return Verdict(ALLOW, text.strip())
+        spans.sort(key=lambda s: (s.start, s.end))
+        if any(s.action == REJECT for s in spans):
+            return Verdict(REJECT, text.strip(), spans)
+        return Verdict(REDACT, _redact(text, spans).strip(), spans)
+
+
+def _redact(text: str, spans: List[Span]) -> str:
+    parts, pos = [], 0
+    for s in spans:
+        if s.end <= pos:
+            continue
+        parts.append(text[pos:max(pos, s.start)])
+        if s.start >= pos:
+            parts.append(REDACTED)
+        pos = s.end
+    parts.append(text[pos:])
+    return ''.join(parts)
+
+
+def parse_rules(content: str) -> Dict[Tuple[str, str], List[str]]:
+    lists: Dict[Tuple[str, str], List[str]] = {}
+    current = None
+    for number, raw in enumerate(content.splitlines(), start=1):
+        line = raw.split('#', 1)[0].strip()
+        if not line:
+            continue
+        if line.startswith('[') and line.endswith(']'):
+            category, _, action = line[1:-1].partition(':')
+            action = action.strip() or REDACT
+            if action not in ACTIONS:
+                raise ValueError(f"line {number}: unknown action {action!r}")
+            current = lists.setdefault((category.strip(), action), [])
+            continue
+        if current is None:
+            raise ValueError(f"line {number}: entry before any [category:action] header")
+        current.append(line)
+    return lists
+
+
+_engine = Engine({})
+_loaded_mtime: Optional[float] = None
+_checked_at = 0.0
+_building: Optional[asyncio.Future] = None
+
+
+def _load(path: str) -> Engine:
+    with open(path, encoding='utf-8') as f:
+        return Engine(parse_rules(f.read()))
+
+
+def _install(build: Callable[[], Engine]):
+    global _engine
+    try:
+        _engine = build()
+        logging.info(f"Loaded {_engine.size} moderation entries from {MODERATION_RULES_FILE}")
+    except (OSError, ValueError, re.error) as e:
+        # Keep serving with the previous rules.
+        logging.error(f"Could not load moderation rules from {MODERATION_RULES_FILE}: {e}")
+
+
+def _built(future: asyncio.Future):
+    global _building
+    _building = None
+    _install(future.result)
+
+
+def _maybe_reload():
+    global _loaded_mtime, _checked_at, _building
+    now = time.monotonic()
+    if not MODERATION_RULES_FILE or (_building is not None and not _building.done()) or now - _checked_at < MODERATION_RELOAD_INTERVAL:
+        return
+    _checked_at = now
+    try:
+        mtime = os.path.getmtime(MODERATION_RULES_FILE)
+    except OSError:
+        return
+    if mtime == _loaded_mtime:
+        return
+    first = _loaded_mtime is None
+    _loaded_mtime = mtime
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        loop = None
+    if first or loop is None:
+        # Nothing to serve with yet (or no loop to hand the work to).
+        _install(lambda: _load(MODERATION_RULES_FILE))
+        return
+    # Compiling a large blocklist takes long enough to stall every handler;
+    # build it in a thread and keep serving with the current rules meanwhile.
+    _building = loop.run_in_executor(None, _load, MODERATION_RULES_FILE)
+    _building.add_done_callback(_built)
+
+
+def moderate(text: str) -> Verdict:
+    """Checks a message against the current rules."""
+    _maybe_reload()
+    return _engine.check(text)
@@ -0,0 +1,109 @@
+import html
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+from db import fetch, fetchrow, query
+
+# Paged /my_confessions.
+# The summary at the top comes from author_stats (005), a per-author rollup
+# the database keeps current on every insert and counter change, so it is a
+# primary-key read however much the author posted. Below it the confessions
+# are listed PAGE_ROWS at a time, newest first, keyset-paginated on
+# (created_at, id) relative to an anchor confession: each page is a bounded
+# range scan on confessions_author_id_created_at_idx (004).
+
+PAGE_ROWS = 10
+SNIPPET_LENGTH = 50
+
+OLDER = 'o'
+NEWER = 'n'
+
+PERIODS = {
+    'day': ("Today's", timedelta(days=1)),
+    'week': ("This Week's", timedelta(days=7)),
+    'all': ("All Your", None),
+}
+
+AUTHOR_SUMMARY = query('author_summary', """
+    SELECT s.confessions_count, s.reactions_count, s.best_score,
+           b.id AS best_id, b.text AS best_text, b.channel_message_id AS best_message_id
+    FROM author_stats s
+    LEFT JOIN confessions b ON b.id = s.best_confession_id
+    WHERE s.author_id = $1
+""")
+MY_CONFESSIONS_FIRST = query('my_confessions_first', """
+    SELECT id, text, channel_message_id, relatable_count + support_count AS total_reactions
+    FROM confessions
+    WHERE author_id = $1 AND created_at >= $2
+    ORDER BY created_at DESC, id DESC
+    LIMIT $3
+""")
+MY_CONFESSIONS_OLDER = query('my_confessions_older', """
+    SELECT id, text, channel_message_id, relatable_count + support_count AS total_reactions
+    FROM confessions
+    WHERE author_id = $1 AND created_at >= $2
+      AND (created_at, id) < (SELECT created_at, id FROM confessions WHERE id = $3)
+    ORDER BY created_at DESC, id DESC
+    LIMIT $4
+""")
+MY_CONFESSIONS_NEWER = query('my_confessions_newer', """
+    SELECT id, text, channel_message_id, relatable_count + support_count AS total_reactions
+    FROM confessions
+    WHERE author_id = $1 AND created_at >= $2
+      AND (created_at, id) > (SELECT created_at, id FROM confessions WHERE id = $3)
+    ORDER BY created_at, id
+    LIMIT $4
+""")
+
+
+def _snippet(text: str) -> str:
+    snippet = (text[:SNIPPET_LENGTH] + '...') if len(text) > SNIPPET_LENGTH else text
+    return html.escape(snippet)
+
+
+def _link(channel: str, message_id: int) -> str:
+    return f"https://t.me/{channel.strip('@')}/{message_id}"
+
+
+def _summary(row, channel: str) -> str:
+    if row is None or not row['confessions_count']:
+        return ""
+    text = f"📊 {row['confessions_count']} confessions, {row['reactions_count']} reactions in total."
+    if row['best_id'] is not None and row['best_score'] > 0:
+        text += (
+            f"\n🏅 Best: \"{_snippet(row['best_text'])}\" - "
+            f"<a href=\"{_link(channel, row['best_message_id'])}\">View</a> ({row['best_score']} reactions)"
+        )
+    return text + "\n\n"
+
+
+async def get_page(author_id: int, period: str, channel: str, direction: str = OLDER, anchor: Optional[int] = None):
+    """
+    Returns (html, first_id, last_id, has_newer, has_older) for a page of an
+    author's confessions, or None if there are none in that direction.
+    """
+    title, window = PERIODS.get(period, PERIODS['all'])
+    since = datetime.now(timezone.utc) - window if window else datetime.min.replace(tzinfo=timezone.utc)
+    if anchor is None:
+        rows = await fetch(MY_CONFESSIONS_FIRST, author_id, since, PAGE_ROWS + 1)
+    elif direction == NEWER:
+        rows = await fetch(MY_CONFESSIONS_NEWER, author_id, since, anchor, PAGE_ROWS + 1)
+    else:
+        rows = await fetch(MY_CONFESSIONS_OLDER, author_id, since, anchor, PAGE_ROWS + 1)
+    more = len(rows) > PAGE_ROWS
+    rows = rows[:PAGE_ROWS]
+    if not rows:
+        return None
+    if direction == NEWER and anchor is not None:
+        rows.reverse()
+        has_newer, has_older = more, True
+    else:
+        has_newer, has_older = anchor is not None, more
+
+    summary = _summary(await fetchrow(AUTHOR_SUMMARY, author_id), channel)
+    lines = [f"{summary}📜 {title} Confessions:\n"]
+    for r in rows:
+        lines.append(
+            f"• \"{_snippet(r['text'])}\" - "
+            f"<a href=\"{_link(channel, r['channel_message_id'])}\">View</a> ({r['total_reactions']} reactions)"
+        )
+    return "\n".join(lines), rows[0]['id'], rows[-1]['id'], has_newer, has_older
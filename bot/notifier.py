@@ -0,0 +1,124 @@
+import asyncio
+import logging
+import time
+from typing import Dict, Optional
+from aiogram import Bot
+from aiogram.utils.exceptions import ChatNotFound, BotBlocked
+from config import CHANNEL_USERNAME, NOTIFY_DELTA, NOTIFY_DIGEST_INTERVAL, NOTIFY_MIN_INTERVAL
+from db import fetch, query
+from outbound import send, NOTIFICATION
+
+# Batched author notifications.
+# Engagement (reactions + comments) is collected per author. An author is
+# notified once a confession gained NOTIFY_DELTA since its last_notified_count,
+# but at most every NOTIFY_MIN_INTERVAL seconds; smaller gains are sent as a
+# digest after NOTIFY_DIGEST_INTERVAL. One message covers all of an author's
+# pending confessions.
+
+TICK = 1.0
+
+_bot: Optional[Bot] = None
+_pending: Dict[int, Dict[int, dict]] = {}  # author id -> confession id -> entry
+_last_sent: Dict[int, float] = {}
+_loop: Optional[asyncio.Task] = None
+
+# Claims the notification atomically: only confessions whose counter we
+# actually advanced are reported, so concurrent workers never double-send.
+CLAIM_NOTIFICATIONS = query('claim_notifications', """
+    UPDATE confessions c
+    SET last_notified_count = v.engagement
+    FROM unnest($1::int[], $2::int[]) AS v(id, engagement)
+    WHERE c.id = v.id AND c.last_notified_count < v.engagement
+    RETURNING c.id
+""")
+
+stats = {'recorded': 0, 'messages': 0, 'failed': 0}
+
+
+def record(author_id: int, conf_id: int, message_id: int, engagement: int, last_notified: int):
+    """Registers the current engagement total of a confession for its author."""
+    stats['recorded'] += 1
+    entries = _pending.setdefault(author_id, {})
+    entry = entries.get(conf_id)
+    if entry is None:
+        entries[conf_id] = {
+            'message_id': message_id,
+            'engagement': engagement,
+            'last_notified': last_notified,
+            'since': time.monotonic(),
+        }
+    else:
+        entry['engagement'] = max(entry['engagement'], engagement)
+        entry['last_notified'] = max(entry['last_notified'], last_notified)
+
+
+def _is_due(author_id: int, entries: Dict[int, dict], now: float) -> bool:
+    if any(now - e['since'] >= NOTIFY_DIGEST_INTERVAL for e in entries.values()):
+        return True
+    last_sent = _last_sent.get(author_id)
+    if last_sent is not None and now - last_sent < NOTIFY_MIN_INTERVAL:
+        return False
+    return any(e['engagement'] - e['last_notified'] >= NOTIFY_DELTA for e in entries.values())
+
+
+async def _notify(author_id: int, entries: Dict[int, dict]):
+    ids = list(entries)
+    rows = await fetch(CLAIM_NOTIFICATIONS, ids, [entries[i]['engagement'] for i in ids])
+    claimed = sorted(r['id'] for r in rows)
+    if not claimed:
+        return
+
+    channel = CHANNEL_USERNAME.strip('@')
+    lines = []
+    for conf_id in claimed:
+        e = entries[conf_id]
+        gained = e['engagement'] - e['last_notified']
+        link = f"https://t.me/{channel}/{e['message_id']}"
+        lines.append(f"• #{conf_id}: +{gained} new reactions/comments — {link}")
+    if len(lines) == 1:
+        message = f"🎉 Your confession is getting attention!\n\n{lines[0]}"
+    else:
+        message = "🎉 Your confessions are getting attention!\n\n" + "\n".join(lines)
+
+    _last_sent[author_id] = time.monotonic()
+    try:
+        await send(NOTIFICATION, author_id, _bot.send_message, author_id, message, disable_web_page_preview=True)
+        stats['messages'] += 1
+    except (ChatNotFound, BotBlocked):
+        stats['failed'] += 1
+        logging.warning(f"Could not send notification to author {author_id}: Chat not found (user might have blocked the bot).")
+    except Exception as e:
+        stats['failed'] += 1
+        logging.error(f"Could not send notification to author {author_id}: {e}")
+
+
+async def _flush(force: bool = False):
+    now = time.monotonic()
+    due = [a for a, entries in _pending.items() if force or _is_due(a, entries, now)]
+    results = await asyncio.gather(*(_notify(a, _pending.pop(a)) for a in due), return_exceptions=True)
+    for author_id, result in zip(due, results):
+        if isinstance(result, Exception):
+            logging.error(f"Could not notify author {author_id}: {result}")
+
+    # Forget send times that no longer throttle anything.
+    for author_id in [a for a, t in _last_sent.items() if now - t >= NOTIFY_MIN_INTERVAL]:
+        del _last_sent[author_id]
+
+
+async def _flush_forever():
+    while True:
+        await asyncio.sleep(TICK)
+        await _flush()
+
+
+def start_notifier(bot: Bot):
+    global _bot, _loop
+    _bot = bot
+    _loop = asyncio.create_task(_flush_forever())
+
+
+async def stop_notifier():
+    """Stops the loop and sends whatever is still pending."""
+    if _loop:
+        _loop.cancel()
+    await _flush(force=True)
@@ -0,0 +1,348 @@
+import asyncio
+import itertools
+import logging
+import random
+import time
+from typing import Dict, Optional, Tuple
+from aiogram.utils.exceptions import NetworkError, RestartingTelegram, RetryAfter
+from config import (
+    OUTBOUND_BACKEND, OUTBOUND_GLOBAL_RATE, OUTBOUND_CHAT_RATE, OUTBOUND_GROUP_RATE, OUTBOUND_MAX_RETRIES, REDIS_URL,
+)
+
+# Central outbound queue for Bot API calls.
+# Every send/edit goes through one scheduler that enforces a global token
+# bucket plus one per chat, serves higher priority classes first, honours
+# RetryAfter and retries transient failures with jittered backoff.
+# Callback query answers (cb.answer) are the one exception and are called
+# directly: they send no message, so the per-chat limits don't apply, and
+# Telegram expects them within seconds of the button press, which a queue
+# behind a busy chat's bucket could not guarantee.
+#
+# Telegram's limits are per bot, not per process. With OUTBOUND_BACKEND=redis
+# the buckets are shared by all webhook workers. With the default "memory"
+# each worker keeps its own and takes 1/`workers` of the global and group
+# rates (set by webhook.py); private chats keep their full rate, as a user's
+# replies and notifications all come from the one worker owning the user.
+
+USER_REPLY = 0
+CHANNEL_POST = 1
+NOTIFICATION = 2
+PRIORITY_NAMES = {USER_REPLY: 'user_reply', CHANNEL_POST: 'channel_post', NOTIFICATION: 'notification'}
+
+MAX_IDLE_BUCKETS = 10000
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+
+    def _refill(self, now: float):
+        if now > self.updated:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+
+    def delay(self, now: float) -> float:
+        """Seconds until a token is available (0 if one is available now)."""
+        self._refill(now)
+        if now < self.blocked_until:
+            return self.blocked_until - now
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self, now: float):
+        self._refill(now)
+        self.tokens -= 1
+
+    def block(self, seconds: float):
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+
+    def idle(self, now: float) -> bool:
+        self._refill(now)
+        return self.tokens >= self.capacity and now >= self.blocked_until
+
+
+def _chat_rate(chat_id, share: float) -> float:
+    # Channels, groups and @usernames have a much lower per-chat limit than private chats.
+    is_group = isinstance(chat_id, str) or chat_id < 0
+    return OUTBOUND_GROUP_RATE * share if is_group else OUTBOUND_CHAT_RATE
+
+
+class MemoryLimits:
+    """Buckets of this process, holding `share` of the global and group rates."""
+
+    def __init__(self, share: float = 1.0):
+        self.share = share
+        rate = OUTBOUND_GLOBAL_RATE * share
+        self._global = TokenBucket(rate, max(1.0, rate))
+        self._chats: Dict[object, TokenBucket] = {}
+
+    def _chat_bucket(self, chat_id) -> TokenBucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            if len(self._chats) >= MAX_IDLE_BUCKETS:
+                now = time.monotonic()
+                for key in [k for k, b in self._chats.items() if b.idle(now)]:
+                    del self._chats[key]
+            rate = _chat_rate(chat_id, self.share)
+            bucket = self._chats[chat_id] = TokenBucket(rate, max(1.0, rate))
+        return bucket
+
+    async def acquire(self, chat_id) -> Tuple[float, float]:
+        """
+        Takes a token from the global and the chat bucket. Returns (0, 0) on
+        success, else the seconds to wait for the chat or for the global one.
+        """
+        now = time.monotonic()
+        chat = self._chat_bucket(chat_id)
+        chat_delay = chat.delay(now)
+        if chat_delay > 0:
+            return chat_delay, 0.0
+        global_delay = self._global.delay(now)
+        if global_delay > 0:
+            return 0.0, global_delay
+        self._global.take(now)
+        chat.take(now)
+        return 0.0, 0.0
+
+    async def block(self, chat_id, seconds: float):
+        self._chat_bucket(chat_id).block(seconds)
+
+
+class RedisLimits:
+    """Buckets shared by all workers, updated atomically by Lua scripts."""
+
+    ACQUIRE = """
+        local t = redis.call('TIME')
+        local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+        local function load(key, rate)
+            local capacity = math.max(1, rate)
+            local state = redis.call('HMGET', key, 'tokens', 'ts', 'blocked')
+            local tokens = tonumber(state[1]) or capacity
+            local ts = tonumber(state[2]) or now
+            return math.min(capacity, tokens + (now - ts) * rate), tonumber(state[3]) or 0
+        end
+        local function save(key, rate, tokens, blocked)
+            redis.call('HSET', key, 'tokens', tostring(tokens), 'ts', tostring(now))
+            redis.call('EXPIRE', key, math.ceil(math.max(math.max(1, rate) / rate, blocked - now)) + 1)
+        end
+        local global_rate, chat_rate = tonumber(ARGV[1]), tonumber(ARGV[2])
+        local chat, chat_blocked = load(KEYS[2], chat_rate)
+        if now < chat_blocked then
+            return {tostring(chat_blocked - now), '0'}
+        end
+        if chat < 1 then
+            return {tostring((1 - chat) / chat_rate), '0'}
+        end
+        local global = load(KEYS[1], global_rate)
+        if global < 1 then
+            return {'0', tostring((1 - global) / global_rate)}
+        end
+        save(KEYS[1], global_rate, global - 1, 0)
+        save(KEYS[2], chat_rate, chat - 1, chat_blocked)
+        return {'0', '0'}
+    """
+
+    BLOCK = """
+        local t = redis.call('TIME')
+        local until_ = tonumber(t[1]) + tonumber(t[2]) / 1000000 + tonumber(ARGV[1])
+        local blocked = tonumber(redis.call('HGET', KEYS[1], 'blocked')) or 0
+        if until_ > blocked then
+            redis.call('HSET', KEYS[1], 'blocked', tostring(until_))
+            if redis.call('TTL', KEYS[1]) < tonumber(ARGV[1]) + 1 then
+                redis.call('EXPIRE', KEYS[1], math.ceil(tonumber(ARGV[1])) + 1)
+            end
+        end
+    """
+
+    def __init__(self, url: str):
+        # Imported here so the 'redis' package is only required in redis mode.
+        from redis.asyncio import Redis
+
+        self._redis = Redis.from_url(url, decode_responses=True)
+        self._acquire = self._redis.register_script(self.ACQUIRE)
+        self._block = self._redis.register_script(self.BLOCK)
+
+    async def acquire(self, chat_id) -> Tuple[float, float]:
+        chat_delay, global_delay = await self._acquire(
+            keys=['outbound:global', f"outbound:chat:{chat_id}"],
+            args=[OUTBOUND_GLOBAL_RATE, _chat_rate(chat_id, 1.0)],
+        )
+        return float(chat_delay), float(global_delay)
+
+    async def block(self, chat_id, seconds: float):
+        await self._block(keys=[f"outbound:chat:{chat_id}"], args=[seconds])
+
+
+def create_limits():
+    if OUTBOUND_BACKEND == 'memory':
+        return MemoryLimits(1 / workers)
+    if OUTBOUND_BACKEND == 'redis':
+        return RedisLimits(REDIS_URL)
+    raise RuntimeError(f"Unknown OUTBOUND_BACKEND: {OUTBOUND_BACKEND!r}")
+
+
+class _Job:
+    def __init__(self, priority: int, chat_id, call, args, kwargs, retry: bool):
+        self.priority = priority
+        self.chat_id = chat_id
+        self.call = call
+        self.args = args
+        self.kwargs = kwargs
+        self.retry = retry
+        self.attempts = 0
+        # Requeued jobs keep their sequence number, so per-chat order survives delays.
+        self.seq = next(_seq)
+        self.enqueued = time.monotonic()
+        self.future = asyncio.get_running_loop().create_future()
+
+
+# Processes sending on behalf of the bot; see the header comment.
+workers = 1
+
+_queue: Optional[asyncio.PriorityQueue] = None
+_dispatcher: Optional[asyncio.Task] = None
+_limits = None
+_seq = itertools.count()
+_delayed = 0
+_in_flight = set()
+
+_stats = {
+    'sent': {name: 0 for name in PRIORITY_NAMES.values()},
+    'failed': {name: 0 for name in PRIORITY_NAMES.values()},
+    'retry_after': 0,
+    'retries': 0,
+    'dispatched': 0,
+    'wait_total': 0.0,
+    'wait_max': 0.0,
+}
+
+
+def _put(job: _Job):
+    _queue.put_nowait((job.priority, job.seq, job))
+
+
+def _put_later(job: _Job, delay: float):
+    global _delayed
+    _delayed += 1
+
+    def put():
+        global _delayed
+        _delayed -= 1
+        _put(job)
+
+    asyncio.get_running_loop().call_later(delay, put)
+
+
+async def send(priority: int, chat_id, call, /, *args, retry: bool = True, **kwargs):
+    """
+    Queues `call(*args, **kwargs)`, a Bot API coroutine function addressed to
+    `chat_id`, and returns its result once it was sent.
+
+    With retry=False a RetryAfter is raised to the caller instead of being
+    retried, for callers that prefer to resend fresher content themselves.
+    The leading parameters are positional-only so that `call` can still take
+    `chat_id` as a keyword argument.
+    """
+    job = _Job(priority, chat_id, call, args, kwargs, retry)
+    _put(job)
+    return await job.future
+
+
+def _resolve(job: _Job, result=None, error: Optional[Exception] = None):
+    # The caller may have gone away (cancelled) while the call was in flight.
+    if job.future.done():
+        return
+    if error is not None:
+        job.future.set_exception(error)
+    else:
+        job.future.set_result(result)
+
+
+async def _run(job: _Job):
+    name = PRIORITY_NAMES[job.priority]
+    job.attempts += 1
+    try:
+        result = await job.call(*job.args, **job.kwargs)
+    except RetryAfter as e:
+        _stats['retry_after'] += 1
+        await _limits.block(job.chat_id, e.timeout)
+        if job.retry:
+            logging.warning(f"Flood control for chat {job.chat_id}, retrying in {e.timeout}s")
+            _put_later(job, e.timeout)
+        else:
+            _stats['failed'][name] += 1
+            _resolve(job, error=e)
+    except (NetworkError, RestartingTelegram, asyncio.TimeoutError) as e:
+        if job.retry and job.attempts <= OUTBOUND_MAX_RETRIES:
+            _stats['retries'] += 1
+            _put_later(job, min(30, 2 ** job.attempts) * random.uniform(0.5, 1.5))
+        else:
+            _stats['failed'][name] += 1
+            _resolve(job, error=e)
+    except Exception as e:
+        _stats['failed'][name] += 1
+        _resolve(job, error=e)
+    else:
+        _stats['sent'][name] += 1
+        _resolve(job, result=result)
+
+
+async def _dispatch_forever():
+    while True:
+        _, _, job = await _queue.get()
+        if job.future.cancelled():
+            continue
+
+        chat_delay, global_delay = await _limits.acquire(job.chat_id)
+        while global_delay > 0:
+            await asyncio.sleep(global_delay)
+            chat_delay, global_delay = await _limits.acquire(job.chat_id)
+        if chat_delay > 0:
+            # Don't hold up other chats; requeue once this chat has capacity again.
+            _put_later(job, chat_delay)
+            continue
+
+        now = time.monotonic()
+        if job.attempts == 0:
+            waited = now - job.enqueued
+            _stats['dispatched'] += 1
+            _stats['wait_total'] += waited
+            _stats['wait_max'] = max(_stats['wait_max'], waited)
+
+        task = asyncio.create_task(_run(job))
+        _in_flight.add(task)
+        task.add_done_callback(_in_flight.discard)
+
+
+def start_outbound():
+    global _queue, _dispatcher, _limits
+    _limits = create_limits()
+    _queue = asyncio.PriorityQueue()
+    _dispatcher = asyncio.create_task(_dispatch_forever())
+
+
+async def stop_outbound(timeout: float = 10):
+    """Lets queued calls go out for up to `timeout` seconds, then stops the scheduler."""
+    deadline = time.monotonic() + timeout
+    while (_queue.qsize() or _delayed or _in_flight) and time.monotonic() < deadline:
+        await asyncio.sleep(0.1)
+    if _dispatcher:
+        _dispatcher.cancel()
+
+
+def stats() -> dict:
+    """Queue depth, wait times and per-class send counters."""
+    dispatched = _stats['dispatched']
+    return {
+        'queue_depth': (_queue.qsize() if _queue else 0) + _delayed,
+        'in_flight': len(_in_flight),
+        'sent': dict(_stats['sent']),
+        'failed': dict(_stats['failed']),
+        'retry_after': _stats['retry_after'],
+        'retries': _stats['retries'],
+        'wait_avg': _stats['wait_total'] / dispatched if dispatched else 0.0,
+        'wait_max': _stats['wait_max'],
+    }
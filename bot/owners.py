@@ -0,0 +1,89 @@
+import asyncio
+import logging
+import queue
+from typing import Callable, Dict, List, Optional
+
+# One owner per confession and per author across webhook workers.
+# Keyboard edits are debounced per confession and notifications throttled
+# per author, both in memory, so all of a confession's edits and all of an
+# author's notifications must go through the same process. The owner of a
+# key is worker `key % workers`; work for another worker is handed to it
+# over its handoff queue (set up by webhook.py) and run by its handler
+# there. Authors are routed the same way as their own updates, so their
+# notifications and replies share a worker (and its per-chat bucket).
+# With one process (python main.py) everything runs locally.
+
+workers = 1
+index = 0
+_handoffs: Optional[List] = None
+_handlers: Dict[str, Callable] = {}
+_serving: Optional[asyncio.Task] = None
+
+stats = {'local': 0, 'handed_off': 0, 'received': 0}
+
+
+def register(kind: str, handler: Callable):
+    """Sets the function that runs `kind` work in its owner; it must be synchronous."""
+    _handlers[kind] = handler
+
+
+def owner(key: int) -> int:
+    return key % workers
+
+
+def dispatch(kind: str, key: int, *args):
+    """Runs `kind` work for `key` here if this process owns it, else hands it to the owner."""
+    target = owner(key)
+    if _handoffs is None or target == index:
+        stats['local'] += 1
+        _handlers[kind](*args)
+        return
+    stats['handed_off'] += 1
+    _handoffs[target].put_nowait((kind, args))
+
+
+def _apply(item):
+    kind, args = item
+    stats['received'] += 1
+    try:
+        _handlers[kind](*args)
+    except Exception as e:
+        logging.error(f"Could not apply {kind} handed over to worker {index}: {e}")
+
+
+async def _serve(handoff):
+    loop = asyncio.get_running_loop()
+    while True:
+        item = await loop.run_in_executor(None, handoff.get)
+        if item is None:
+            return
+        _apply(item)
+
+
+def start_owners(worker_index: int, handoffs: List):
+    """Joins the workers sharing `handoffs`, one queue per worker."""
+    global workers, index, _handoffs, _serving
+    workers, index, _handoffs = len(handoffs), worker_index, handoffs
+    _serving = asyncio.create_task(_serve(handoffs[worker_index]))
+
+
+async def stop_owners():
+    """
+    Stops taking work from other workers and runs what they already handed
+    over. From here on this worker handles its own work itself: the owner may
+    be gone already, and a duplicate edit is better than a lost one.
+    """
+    global _handoffs
+    if _handoffs is None:
+        return
+    handoff = _handoffs[index]
+    _handoffs = None
+    handoff.put(None)
+    await _serving
+    while True:
+        try:
+            item = handoff.get_nowait()
+        except queue.Empty:
+            return
+        if item is not None:
+            _apply(item)
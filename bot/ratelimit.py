@@ -0,0 +1,174 @@
+import math
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+from aiogram import types
+from aiogram.dispatcher.handler import CancelHandler, current_handler
+from aiogram.dispatcher.middlewares import BaseMiddleware
+from config import RATE_LIMITS, RATE_LIMIT_BACKEND, RATE_LIMIT_MAX_KEYS, REDIS_URL
+from outbound import send, USER_REPLY
+
+# Per-user token buckets for the bot's actions (confess, react, comment, view).
+# Handlers opt in with @rate_limit('<action>'); RateLimitMiddleware checks the
+# bucket after filters matched and drops the update before the handler, and
+# therefore Postgres, ever sees it. A limit of "1/300" allows one action
+# every 300 seconds, "30/60" bursts of 30 refilled over a minute.
+# With @rate_limit('<action>', consume=False) the middleware only checks that
+# a token is available; the handler flow takes it with RateLimiter.hit once
+# the action actually happened (e.g. the confession was posted).
+# A throttled message is answered once, through the outbound queue; further
+# messages are dropped silently until the token it waited for is back, so a
+# flood costs one reply and not one per message.
+
+
+class MemoryBackend:
+    """In-process buckets, bounded to `max_keys` least recently used users."""
+
+    def __init__(self, max_keys: int):
+        self.max_keys = max_keys
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+
+    async def take(self, key: str, capacity: int, rate: float, consume: bool = True) -> float:
+        now = time.monotonic()
+        tokens, updated = self._buckets.pop(key, (capacity, now))
+        tokens = min(capacity, tokens + (now - updated) * rate)
+        wait = 0.0
+        if tokens < 1:
+            wait = (1 - tokens) / rate
+        elif consume:
+            tokens -= 1
+        self._buckets[key] = (tokens, now)
+        if len(self._buckets) > self.max_keys:
+            self._buckets.popitem(last=False)
+        return wait
+
+
+class RedisBackend:
+    """Buckets shared by all workers, updated atomically by a Lua script."""
+
+    SCRIPT = """
+        local capacity = tonumber(ARGV[1])
+        local rate = tonumber(ARGV[2])
+        local consume = ARGV[3] == '1'
+        local t = redis.call('TIME')
+        local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+        local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+        local tokens = tonumber(state[1]) or capacity
+        local ts = tonumber(state[2]) or now
+        tokens = math.min(capacity, tokens + (now - ts) * rate)
+        local wait = 0
+        if tokens < 1 then
+            wait = (1 - tokens) / rate
+        elseif consume then
+            tokens = tokens - 1
+        end
+        if not consume then
+            return tostring(wait)
+        end
+        redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+        redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 1)
+        return tostring(wait)
+    """
+
+    def __init__(self, url: str):
+        # Imported here so the 'redis' package is only required in redis mode.
+        from redis.asyncio import Redis
+
+        self._redis = Redis.from_url(url, decode_responses=True)
+        self._script = self._redis.register_script(self.SCRIPT)
+
+    async def take(self, key: str, capacity: int, rate: float, consume: bool = True) -> float:
+        return float(await self._script(keys=[f"ratelimit:{key}"], args=[capacity, rate, int(consume)]))
+
+
+class RateLimiter:
+    def __init__(self, backend, limits: Dict[str, Tuple[int, float]]):
+        self.backend = backend
+        self.limits = limits
+
+    async def hit(self, action: str, user_id: int) -> float:
+        """Consumes one token; returns 0 if allowed, else seconds until the next one."""
+        capacity, period = self.limits[action]
+        return await self.backend.take(f"{action}:{user_id}", capacity, capacity / period)
+
+    async def check(self, action: str, user_id: int) -> float:
+        """Like hit, but leaves the token in the bucket."""
+        capacity, period = self.limits[action]
+        return await self.backend.take(f"{action}:{user_id}", capacity, capacity / period, consume=False)
+
+
+def create_limiter() -> RateLimiter:
+    if RATE_LIMIT_BACKEND == 'memory':
+        backend = MemoryBackend(RATE_LIMIT_MAX_KEYS)
+    elif RATE_LIMIT_BACKEND == 'redis':
+        backend = RedisBackend(REDIS_URL)
+    else:
+        raise RuntimeError(f"Unknown RATE_LIMIT_BACKEND: {RATE_LIMIT_BACKEND!r}")
+    return RateLimiter(backend, RATE_LIMITS)
+
+
+def rate_limit(action: str, consume: bool = True):
+    """
+    Marks a handler as limited by the bucket of `action`. With consume=False
+    the token is only checked for, and must be taken by the handler flow.
+    """
+    def decorator(func):
+        func.rate_limit_action = action
+        func.rate_limit_consume = consume
+        return func
+    return decorator
+
+
+def _rejection(action: str, wait: float) -> str:
+    if action == 'confess':
+        minutes, seconds = divmod(math.ceil(wait), 60)
+        return f"Please wait {minutes}m {seconds}s before confessing again."
+    return f"You're doing that too fast. Please try again in {math.ceil(wait)}s."
+
+
+class RateLimitMiddleware(BaseMiddleware):
+    def __init__(self, limiter: RateLimiter, max_keys: int = RATE_LIMIT_MAX_KEYS):
+        super().__init__()
+        self.limiter = limiter
+        self.max_keys = max_keys
+        # "<action>:<user id>" -> monotonic time until which rejections are not replied to
+        self._quiet: "OrderedDict[str, float]" = OrderedDict()
+
+    async def _limited(self, user_id: int) -> Optional[Tuple[str, float]]:
+        """Returns (action, seconds to wait) if the handler's bucket is empty, else None."""
+        handler = current_handler.get()
+        action = getattr(handler, 'rate_limit_action', None)
+        if action is None:
+            return None
+        if getattr(handler, 'rate_limit_consume', True):
+            wait = await self.limiter.hit(action, user_id)
+        else:
+            wait = await self.limiter.check(action, user_id)
+        return (action, wait) if wait > 0 else None
+
+    def _should_reply(self, action: str, user_id: int, wait: float) -> bool:
+        key = f"{action}:{user_id}"
+        now = time.monotonic()
+        quiet_until = self._quiet.pop(key, 0.0)
+        if now < quiet_until:
+            self._quiet[key] = quiet_until
+            return False
+        self._quiet[key] = now + wait
+        if len(self._quiet) > self.max_keys:
+            self._quiet.popitem(last=False)
+        return True
+
+    async def on_process_message(self, message: types.Message, data: dict):
+        limited = await self._limited(message.from_user.id)
+        if limited:
+            action, wait = limited
+            if self._should_reply(action, message.from_user.id, wait):
+                await send(USER_REPLY, message.chat.id, message.reply, _rejection(action, wait))
+            raise CancelHandler()
+
+    async def on_process_callback_query(self, cb: types.CallbackQuery, data: dict):
+        limited = await self._limited(cb.from_user.id)
+        if limited:
+            # Every callback query needs an answer; it sends no message (see outbound.py).
+            await cb.answer(_rejection(*limited))
+            raise CancelHandler()
@@ -0,0 +1,215 @@
+import asyncio
+import itertools
+import json
+import logging
+import os
+import re
+from collections import OrderedDict
+from typing import Awaitable, Callable, List, Optional, Tuple
+from config import REACTION_FLUSH_INTERVAL, REACTION_BATCH_SIZE, REACTION_DEDUPE_SIZE, REACTION_SPOOL_FILE
+from db import fetch, query
+
+# Buffered reaction ingestion.
+# A tap is checked against an in-memory set of recent reactions and answered
+# right away; new reactions are queued and written in batches every
+# REACTION_FLUSH_INTERVAL seconds, or as soon as REACTION_BATCH_SIZE are
+# waiting. A batch is one INSERT ... ON CONFLICT DO NOTHING that also bumps
+# the counters of the confessions it touched, so replaying a batch is
+# harmless. The new counters are handed to the callback given to
+# start_reactions (keyboard edits, notifications, leaderboard).
+#
+# On shutdown the queue is flushed; reactions that still cannot be written
+# are saved to a spool file (REACTION_SPOOL_FILE) and replayed on the next start. A crash
+# loses at most the reactions of the last flush interval. Webhook workers spool
+# to REACTION_SPOOL_FILE.<index>; whichever entry point starts next first gathers
+# every spool file into the one it replays (gather_spools), so nothing is left
+# behind when WEBHOOK_WORKERS is lowered or the bot goes back to main.py.
+
+Key = Tuple[int, int, str]  # (confession id, user id, reaction type)
+
+# Inserts a batch, skipping duplicates and unknown confessions, and applies
+# the per-confession deltas. `actors` are the users whose reactions were new.
+# Concurrent flushes (webhook workers) touch overlapping confessions, so the
+# rows are locked up front in id order and the batch is sorted by flush();
+# without a fixed order two batches can each hold a row the other waits for.
+# The same goes for the author_stats rows the rollup trigger (005) updates
+# once per confession: they are locked next, in author_id order. The scalar
+# subquery runs once and reads all of `authors`, so every lock is taken
+# before the first insert.
+FLUSH_REACTIONS = query('flush_reactions', """
+    WITH locked AS (
+        SELECT id, author_id, created_at FROM confessions
+        WHERE id = ANY($1::int[])
+        ORDER BY id
+        FOR UPDATE
+    ), authors AS (
+        SELECT author_id FROM author_stats
+        WHERE author_id IN (SELECT author_id FROM locked)
+        ORDER BY author_id
+        FOR UPDATE
+    ), ins AS (
+        INSERT INTO reactions(confession_id, user_id, reaction_type, confession_created_at)
+        SELECT v.confession_id, v.user_id, v.reaction_type, c.created_at
+        FROM unnest($1::int[], $2::bigint[], $3::text[]) AS v(confession_id, user_id, reaction_type)
+        JOIN locked c ON c.id = v.confession_id
+        WHERE (SELECT count(*) FROM authors) >= 0
+        ON CONFLICT (confession_id, user_id, reaction_type, confession_created_at) DO NOTHING
+        RETURNING confession_id, user_id, reaction_type
+    ), delta AS (
+        SELECT confession_id,
+               count(*) FILTER (WHERE reaction_type = 'relatable') AS relatable,
+               count(*) FILTER (WHERE reaction_type = 'support') AS support,
+               array_agg(DISTINCT user_id) AS actors
+        FROM ins
+        GROUP BY confession_id
+    )
+    UPDATE confessions c
+    SET relatable_count = c.relatable_count + d.relatable,
+        support_count = c.support_count + d.support
+    FROM delta d
+    WHERE c.id = d.confession_id
+    RETURNING c.id, c.relatable_count, c.support_count, c.comments_count,
+              c.channel_chat_id, c.channel_message_id, c.author_id, c.created_at,
+              c.last_notified_count, d.actors, d.relatable + d.support AS inserted
+""")
+
+_pending: "OrderedDict[Key, None]" = OrderedDict()
+_seen: "OrderedDict[Key, None]" = OrderedDict()
+_on_flushed: Optional[Callable[[object], Awaitable]] = None
+_loop: Optional[asyncio.Task] = None
+_wakeup: Optional[asyncio.Event] = None
+_flush_lock: Optional[asyncio.Lock] = None
+_spooled = False
+# Webhook workers each use their own file (see webhook.py).
+spool_file = REACTION_SPOOL_FILE
+
+stats = {'accepted': 0, 'duplicates': 0, 'flushes': 0, 'written': 0, 'skipped': 0, 'failed_flushes': 0}
+
+
+def add(conf_id: int, user_id: int, reaction_type: str) -> bool:
+    """Queues a reaction; returns False if this user already reacted this way."""
+    key = (conf_id, user_id, reaction_type)
+    if key in _seen:
+        _seen.move_to_end(key)
+        stats['duplicates'] += 1
+        return False
+    _remember(key)
+    _pending[key] = None
+    stats['accepted'] += 1
+    if len(_pending) >= REACTION_BATCH_SIZE and _wakeup:
+        _wakeup.set()
+    return True
+
+
+def _remember(key: Key):
+    _seen[key] = None
+    if len(_seen) > REACTION_DEDUPE_SIZE:
+        _seen.popitem(last=False)
+
+
+async def flush():
+    """Writes every queued reaction; on failure they stay queued."""
+    global _spooled
+    async with _flush_lock:
+        while _pending:
+            batch: List[Key] = list(itertools.islice(_pending, REACTION_BATCH_SIZE))
+            for key in batch:
+                del _pending[key]
+            try:
+                rows = await fetch(FLUSH_REACTIONS, *map(list, zip(*sorted(batch))))
+            except BaseException:
+                # Also on cancellation: put the batch back in front, in its original order.
+                for key in reversed(batch):
+                    _pending[key] = None
+                    _pending.move_to_end(key, last=False)
+                stats['failed_flushes'] += 1
+                raise
+            inserted = sum(r['inserted'] for r in rows)
+            stats['flushes'] += 1
+            stats['written'] += inserted
+            stats['skipped'] += len(batch) - inserted
+            for row in rows:
+                try:
+                    await _on_flushed(row)
+                except Exception as e:
+                    logging.error(f"Could not apply reaction update for confession {row['id']}: {e}")
+        if _spooled:
+            os.remove(spool_file)
+            _spooled = False
+
+
+async def _flush_forever():
+    while True:
+        try:
+            await asyncio.wait_for(_wakeup.wait(), REACTION_FLUSH_INTERVAL)
+        except asyncio.TimeoutError:
+            pass
+        _wakeup.clear()
+        try:
+            await flush()
+        except Exception as e:
+            logging.error(f"Could not write {len(_pending)} reactions, retrying: {e}")
+
+
+def _load_spool():
+    global _spooled
+    if not os.path.exists(spool_file):
+        return
+    with open(spool_file, encoding='utf-8') as f:
+        for line in f:
+            key = tuple(json.loads(line))
+            _pending[key] = None
+            _remember(key)
+    _spooled = True
+    logging.info(f"Replaying {len(_pending)} reactions from {spool_file}")
+
+
+def gather_spools(into: str):
+    """Moves the reactions of every other spool file into `into`.
+
+    Must run before any process replays a spool: webhook.py calls it before
+    starting the workers, main.py before polling. Replaying a reaction twice
+    is harmless, so a crash halfway through only causes duplicates.
+    """
+    directory, base = os.path.split(REACTION_SPOOL_FILE)
+    name = re.compile(re.escape(base) + r'(\.\d+)?')
+    spools = (os.path.join(directory, entry) for entry in os.listdir(directory or '.') if name.fullmatch(entry))
+    others = sorted(path for path in spools if path != into)
+    if not others:
+        return
+    with open(into, 'a', encoding='utf-8') as out:
+        for path in others:
+            with open(path, encoding='utf-8') as f:
+                out.writelines(f)
+        out.flush()
+        os.fsync(out.fileno())
+    for path in others:
+        os.remove(path)
+    logging.info(f"Gathered the spooled reactions of {', '.join(others)} into {into}")
+
+
+def start_reactions(on_flushed: Callable[[object], Awaitable]):
+    """Starts the flush loop. `on_flushed` receives each updated confession row."""
+    global _on_flushed, _loop, _wakeup, _flush_lock
+    _on_flushed = on_flushed
+    _wakeup = asyncio.Event()
+    _flush_lock = asyncio.Lock()
+    _load_spool()
+    # Spooled reactions are written by the first flush; the file is removed once they are in.
+    _wakeup.set()
+    _loop = asyncio.create_task(_flush_forever())
+
+
+async def stop_reactions():
+    """Stops the loop and writes what is queued, spooling it to disk if that fails."""
+    if not _loop:
+        return
+    _loop.cancel()
+    await asyncio.gather(_loop, return_exceptions=True)
+    try:
+        await flush()
+    except Exception as e:
+        with open(spool_file, 'w', encoding='utf-8') as f:
+            for key in _pending:
+                f.write(json.dumps(key) + '\n')
+        logging.error(f"Could not write {len(_pending)} reactions on shutdown, saved them to {spool_file}: {e}")
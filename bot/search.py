@@ -0,0 +1,85 @@
+import html
+from typing import List, Optional, Tuple
+from cache import AsyncCache
+from db import fetch, query
+
+# Full-text confession search (/search).
+# Confessions carry a tsvector (search_vector, 006) indexed with GIN, so a
+# search is an index lookup instead of a scan over every text. Every match
+# is ranked and the best MAX_RESULTS kept. A category filter is a second
+# bitmap (008) ANDed with the GIN one, which is why it has its own query:
+# `($2 IS NULL OR category = $2)` cannot use an index in a generic plan.
+# Results are cached per (terms, category) for CACHE_TTL seconds and paged
+# from the cache, so flipping through pages or repeating a popular search
+# costs no query.
+#
+# Paging state lives in the callback data (terms, category, page), so any
+# worker can serve the next page. Callback data is limited to 64 bytes,
+# which is why search terms are capped at TERMS_BYTES.
+
+PAGE_ROWS = 10
+MAX_RESULTS = 50
+CACHE_SIZE = 256
+CACHE_TTL = 60
+SNIPPET_LENGTH = 70
+TERMS_BYTES = 40
+
+SEARCH_CONFESSIONS = query('search_confessions', """
+    SELECT id, text, channel_message_id
+    FROM confessions
+    WHERE search_vector @@ websearch_to_tsquery('english', $1)
+    ORDER BY ts_rank_cd(search_vector, websearch_to_tsquery('english', $1)) DESC, id DESC
+    LIMIT $2
+""")
+
+SEARCH_CONFESSIONS_IN_CATEGORY = query('search_confessions_in_category', """
+    SELECT id, text, channel_message_id
+    FROM confessions
+    WHERE search_vector @@ websearch_to_tsquery('english', $1)
+      AND category = $2
+    ORDER BY ts_rank_cd(search_vector, websearch_to_tsquery('english', $1)) DESC, id DESC
+    LIMIT $3
+""")
+
+
+def normalize(terms: str) -> str:
+    """Lowercases and collapses whitespace, then cuts whole words to TERMS_BYTES."""
+    kept = []
+    size = 0
+    for word in terms.lower().split():
+        cost = len(word.encode('utf-8')) + (1 if kept else 0)
+        if size + cost > TERMS_BYTES:
+            break
+        kept.append(word)
+        size += cost
+    return ' '.join(kept)
+
+
+async def _load(key: Tuple[str, Optional[str]]) -> List[tuple]:
+    terms, category = key
+    if category is None:
+        rows = await fetch(SEARCH_CONFESSIONS, terms, MAX_RESULTS)
+    else:
+        rows = await fetch(SEARCH_CONFESSIONS_IN_CATEGORY, terms, category, MAX_RESULTS)
+    return [(r['id'], r['text'], r['channel_message_id']) for r in rows]
+
+
+_results = AsyncCache('search', _load, maxsize=CACHE_SIZE, ttl=CACHE_TTL)
+
+
+async def get_page(terms: str, category: Optional[str], page: int, channel: str):
+    """
+    Returns (html, has_prev, has_next) for a page of results, or None if
+    nothing matches. `terms` must already be normalized.
+    """
+    results = await _results.get((terms, category))
+    rows = results[page * PAGE_ROWS:(page + 1) * PAGE_ROWS]
+    if not rows:
+        return None
+    scope = f" in {html.escape(category)}" if category else ""
+    lines = [f"🔎 Results for \"{html.escape(terms)}\"{scope}:\n"]
+    for conf_id, text, message_id in rows:
+        snippet = (text[:SNIPPET_LENGTH] + '...') if len(text) > SNIPPET_LENGTH else text
+        link = f"https://t.me/{channel.strip('@')}/{message_id}"
+        lines.append(f"• #{conf_id}: \"{html.escape(snippet)}\" - <a href=\"{link}\">View</a>")
+    return "\n".join(lines), page > 0, len(results) > (page + 1) * PAGE_ROWS
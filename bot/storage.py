@@ -0,0 +1,48 @@
+import json
+from aiogram.contrib.fsm_storage.memory import MemoryStorage
+from aiogram.contrib.fsm_storage.redis import RedisStorage2, STATE_DATA_KEY
+from aiogram.dispatcher.storage import BaseStorage
+from config import FSM_STORAGE, FSM_TTL, REDIS_URL
+
+
+class SharedRedisStorage(RedisStorage2):
+    """
+    Redis FSM storage that is safe to share between several bot processes.
+
+    Connects from a URL and makes `update_data` atomic: the read-merge-write
+    runs in a WATCH/MULTI transaction, so two workers updating the same
+    conversation can't silently drop each other's keys.
+    """
+
+    def __init__(self, url: str, prefix: str = 'fsm', state_ttl=None, data_ttl=None):
+        # Imported here so the 'redis' package is only required in redis mode.
+        from redis.asyncio import Redis
+
+        super().__init__(prefix=prefix, state_ttl=state_ttl, data_ttl=data_ttl)
+        self._redis = Redis.from_url(url, decode_responses=True)
+
+    async def update_data(self, *, chat=None, user=None, data=None, **kwargs):
+        chat, user = self.check_address(chat=chat, user=user)
+        key = self.generate_key(chat, user, STATE_DATA_KEY)
+        patch = dict(data or {}, **kwargs)
+
+        async def merge(pipe):
+            raw = await pipe.get(key)
+            merged = json.loads(raw) if raw else {}
+            merged.update(patch)
+            pipe.multi()
+            if merged:
+                pipe.set(key, json.dumps(merged), ex=self._data_ttl)
+            else:
+                pipe.delete(key)
+
+        await self._redis.transaction(merge, key)
+
+
+def create_storage() -> BaseStorage:
+    """Builds the FSM storage selected by FSM_STORAGE ('memory' or 'redis')."""
+    if FSM_STORAGE == 'memory':
+        return MemoryStorage()
+    if FSM_STORAGE == 'redis':
+        return SharedRedisStorage(REDIS_URL, state_ttl=FSM_TTL or None, data_ttl=FSM_TTL or None)
+    raise RuntimeError(f"Unknown FSM_STORAGE: {FSM_STORAGE!r}")
@@ -1,20 +1,29 @@
-import re
+import hashlib
+import hmac
 from cryptography.fernet import Fernet
 from config import FERNET_KEY
+from moderation import moderate
 
 fernet = Fernet(FERNET_KEY.encode()) if FERNET_KEY else None
-
-URL_PHONE_RE = re.compile(r"(https?://|www\.|\+?\d{6,}|\w+@\w+\.)")
+# Fernet tokens differ on every call, so they cannot serve as a stable id in
+# exports; pseudonyms are an HMAC keyed from the same secret instead.
+_pseudonym_key = hashlib.sha256(b"author-pseudonym:" + FERNET_KEY.encode()).digest() if FERNET_KEY else None
 
 def sanitize_text(text: str) -> str:
-    clean = URL_PHONE_RE.sub('[redacted]', text)
-    return clean.strip()
+    """Redacts links, contact details and blocklisted words. See moderation.py."""
+    return moderate(text).text
 
 def encrypt_userid(uid: int) -> str:
     if not fernet:
         raise RuntimeError("FERNET_KEY not set")
     return fernet.encrypt(str(uid).encode()).decode()
 
+def pseudonymize_userid(uid: int) -> str:
+    """Stable, non-reversible id for a user: the same user always gets the same pseudonym."""
+    if not _pseudonym_key:
+        raise RuntimeError("FERNET_KEY not set")
+    return hmac.new(_pseudonym_key, str(uid).encode(), hashlib.sha256).hexdigest()[:32]
+
 def decrypt_userid(token: str) -> int:
     if not fernet:
         raise RuntimeError("FERNET_KEY not set")
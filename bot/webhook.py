@@ -0,0 +1,202 @@
+"""
+Webhook ingestion mode.
+
+Usage (from the bot directory):
+    python webhook.py
+
+The front process runs an aiohttp endpoint that checks Telegram's secret
+token header and hands each update to one of WEBHOOK_WORKERS worker
+processes. Updates are routed by user id, so every step of a user's
+conversation is handled by the same worker, in order. Work that is kept
+per confession or per author (keyboard edits, notifications) is handed to
+the one worker owning it (see owners.py). Each worker has a
+bounded queue; when it is full the endpoint answers 503 and Telegram
+redelivers the update later. On shutdown the endpoint stops accepting
+updates and every worker drains its queue before exiting. Reactions that
+could not be written are spooled per worker and replayed by worker 0 on the
+next start.
+
+`python main.py` (long polling) remains available for development.
+"""
+import asyncio
+import hmac
+import logging
+import multiprocessing
+import queue
+import signal
+from aiohttp import web
+from aiogram import Bot, Dispatcher, types
+from aiogram.bot.api import TelegramAPIServer, TELEGRAM_PRODUCTION
+from config import (
+    BOT_TOKEN, TELEGRAM_API_URL, WEBHOOK_HOST, WEBHOOK_PATH, WEBHOOK_SECRET,
+    WEBAPP_HOST, WEBAPP_PORT, WEBHOOK_WORKERS, WEBHOOK_QUEUE_SIZE, WEBHOOK_WORKER_CONCURRENCY,
+    REACTION_SPOOL_FILE,
+)
+
+# Update fields that carry the acting user, in lookup order.
+ROUTED_FIELDS = (
+    'message', 'edited_message', 'callback_query', 'inline_query', 'chosen_inline_result',
+    'shipping_query', 'pre_checkout_query', 'poll_answer', 'my_chat_member', 'chat_member',
+    'chat_join_request', 'channel_post', 'edited_channel_post',
+)
+
+SHUTDOWN_TIMEOUT = 30
+
+
+def route_key(update: dict) -> int:
+    """Returns the id used to pick a worker: the acting user, else the chat."""
+    for field in ROUTED_FIELDS:
+        obj = update.get(field)
+        if obj:
+            actor = obj.get('from') or obj.get('user') or obj.get('chat')
+            if actor:
+                return actor['id']
+    return update.get('update_id', 0)
+
+
+# -------------------- Front Process --------------------
+async def handle_update(request: web.Request) -> web.Response:
+    token = request.headers.get('X-Telegram-Bot-Api-Secret-Token', '')
+    if WEBHOOK_SECRET and not hmac.compare_digest(token, WEBHOOK_SECRET):
+        return web.Response(status=401)
+
+    update = await request.json()
+    queues = request.app['queues']
+    try:
+        queues[route_key(update) % len(queues)].put_nowait(update)
+    except queue.Full:
+        # Backpressure: Telegram retries the delivery later.
+        return web.Response(status=503)
+    return web.Response()
+
+
+async def on_startup(app: web.Application):
+    if not WEBHOOK_HOST:
+        logging.warning("WEBHOOK_HOST is not set; not registering the webhook with Telegram.")
+        return
+    bot = Bot(token=BOT_TOKEN, server=TelegramAPIServer.from_base(TELEGRAM_API_URL) if TELEGRAM_API_URL else TELEGRAM_PRODUCTION)
+    try:
+        # Pending updates are kept, so nothing queued during a restart is lost.
+        await bot.set_webhook(WEBHOOK_HOST.rstrip('/') + WEBHOOK_PATH, secret_token=WEBHOOK_SECRET)
+    finally:
+        await (await bot.get_session()).close()
+
+
+async def on_cleanup(app: web.Application):
+    """Runs after the server stopped accepting requests: drains and stops the workers."""
+    loop = asyncio.get_running_loop()
+    for q in app['queues']:
+        await loop.run_in_executor(None, q.put, None)
+    for worker in app['workers']:
+        await loop.run_in_executor(None, worker.join, SHUTDOWN_TIMEOUT)
+        if worker.is_alive():
+            logging.error(f"{worker.name} did not drain within {SHUTDOWN_TIMEOUT}s, terminating it.")
+            worker.terminate()
+
+
+def run_webhook():
+    import reactions
+
+    if not WEBHOOK_SECRET:
+        logging.warning("WEBHOOK_SECRET is not set; the webhook endpoint accepts unauthenticated requests.")
+
+    # Spools of every worker index (and of main.py) are replayed by worker 0,
+    # including those of indexes that no longer run.
+    reactions.gather_spools(f"{REACTION_SPOOL_FILE}.0")
+
+    ctx = multiprocessing.get_context('spawn')
+    queues = [ctx.Queue(maxsize=WEBHOOK_QUEUE_SIZE) for _ in range(WEBHOOK_WORKERS)]
+    # Unbounded: handoffs are produced by the workers themselves, and one
+    # blocking on another's full queue could deadlock them both.
+    handoffs = [ctx.Queue() for _ in range(WEBHOOK_WORKERS)]
+    workers = [
+        ctx.Process(target=worker_main, args=(index, q, handoffs), name=f"bot-worker-{index}")
+        for index, q in enumerate(queues)
+    ]
+    for worker in workers:
+        worker.start()
+
+    app = web.Application()
+    app['queues'] = queues
+    app['workers'] = workers
+    app.router.add_post(WEBHOOK_PATH, handle_update)
+    app.on_startup.append(on_startup)
+    app.on_cleanup.append(on_cleanup)
+    web.run_app(app, host=WEBAPP_HOST, port=WEBAPP_PORT)
+
+
+# -------------------- Worker Processes --------------------
+def worker_main(index: int, updates, handoffs):
+    # Only the front process reacts to signals; workers stop when their queue
+    # yields the shutdown sentinel, after everything before it was handled.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(_worker_loop(index, updates, handoffs))
+
+
+async def _worker_loop(index: int, updates, handoffs):
+    import main  # registers the handlers on main.dp
+    import metrics
+    import outbound
+    import owners
+    import reactions
+
+    metrics.instance = index
+    outbound.workers = WEBHOOK_WORKERS
+    reactions.spool_file = f"{REACTION_SPOOL_FILE}.{index}"
+    dp = main.dp
+    Bot.set_current(dp.bot)
+    Dispatcher.set_current(dp)
+    await main.on_startup(dp)
+    owners.start_owners(index, handoffs)
+
+    loop = asyncio.get_running_loop()
+    slots = asyncio.Semaphore(WEBHOOK_WORKER_CONCURRENCY)
+    # Updates taken off the queue but not finished yet. Once it is full the
+    # process queue fills up and the endpoint answers 503.
+    backlog = asyncio.Semaphore(WEBHOOK_QUEUE_SIZE)
+    locks = {}  # route key -> [lock, number of updates holding or waiting for it]
+    tasks = set()
+
+    async def process(key, update):
+        entry = locks[key]
+        try:
+            # Lock waiters are served in FIFO order, which keeps a user's updates
+            # ordered. The slot is only taken by the lock holder, so one busy
+            # user queues behind their own lock without using up the slots.
+            async with entry[0], slots:
+                await dp.process_update(types.Update(**update))
+        except Exception as e:
+            logging.exception(f"Worker {index} failed to process update {update.get('update_id')}: {e}")
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del locks[key]
+            backlog.release()
+
+    logging.info(f"Worker {index} ready.")
+    while True:
+        update = await loop.run_in_executor(None, updates.get)
+        if update is None:
+            break
+        await backlog.acquire()
+        key = route_key(update)
+        entry = locks.setdefault(key, [asyncio.Lock(), 0])
+        entry[1] += 1
+        task = asyncio.create_task(process(key, update))
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+
+    await asyncio.gather(*tasks)
+    await owners.stop_owners()
+    await main.on_shutdown(dp)
+    await dp.storage.close()
+    await dp.storage.wait_closed()
+    await (await dp.bot.get_session()).close()
+    logging.info(f"Worker {index} drained and stopped.")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    run_webhook()
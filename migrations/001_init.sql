@@ -1,13 +1,5 @@
-
--- Drop existing tables in reverse order of dependency to avoid errors.
--- The CASCADE option will automatically remove dependent objects.
-DROP TABLE IF EXISTS comments CASCADE;
-DROP TABLE IF EXISTS reactions CASCADE;
-DROP TABLE IF EXISTS users CASCADE;
-DROP TABLE IF EXISTS confessions CASCADE;
-; -- To clean up old table if it exists
-
--- Recreate tables with the new schema
+-- Baseline schema. Later changes live in the following numbered files and
+-- are applied in order by bot/migrate.py; never edit an applied migration.
 
 CREATE TABLE IF NOT EXISTS confessions (
     id SERIAL PRIMARY KEY,
@@ -0,0 +1,26 @@
+-- Adds denormalized reaction/comment counters to confessions and backfills
+-- them from existing rows. Safe to run more than once.
+
+ALTER TABLE confessions
+    ADD COLUMN IF NOT EXISTS relatable_count INTEGER NOT NULL DEFAULT 0,
+    ADD COLUMN IF NOT EXISTS support_count INTEGER NOT NULL DEFAULT 0,
+    ADD COLUMN IF NOT EXISTS comments_count INTEGER NOT NULL DEFAULT 0;
+
+UPDATE confessions c
+SET relatable_count = COALESCE(r.relatable, 0),
+    support_count = COALESCE(r.support, 0),
+    comments_count = COALESCE(cm.total, 0)
+FROM confessions base
+LEFT JOIN (
+    SELECT confession_id,
+           COUNT(*) FILTER (WHERE reaction_type = 'relatable') AS relatable,
+           COUNT(*) FILTER (WHERE reaction_type = 'support') AS support
+    FROM reactions
+    GROUP BY confession_id
+) r ON r.confession_id = base.id
+LEFT JOIN (
+    SELECT confession_id, COUNT(*) AS total
+    FROM comments
+    GROUP BY confession_id
+) cm ON cm.confession_id = base.id
+WHERE c.id = base.id;
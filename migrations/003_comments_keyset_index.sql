@@ -0,0 +1,4 @@
+-- Supports keyset pagination of comments: WHERE confession_id = $1 AND id > $2 ORDER BY id.
+-- migrate: no-transaction
+-- Built without blocking writes, which requires running outside a transaction.
+CREATE INDEX CONCURRENTLY IF NOT EXISTS comments_confession_id_id_idx ON comments (confession_id, id);
@@ -0,0 +1,23 @@
+-- migrate: no-transaction
+-- Indexes for the hot handler queries, built without blocking writes.
+-- If a build fails it leaves an INVALID index behind: drop it and rerun.
+--
+-- No index covers the counter columns on purpose: every reaction updates
+-- them, and indexing them would turn those into non-HOT updates.
+
+-- cmd_confess cooldown: WHERE author_id = $1 ORDER BY created_at DESC LIMIT 1,
+-- and /my_confessions day/week filters.
+CREATE INDEX CONCURRENTLY IF NOT EXISTS confessions_author_id_created_at_idx
+    ON confessions (author_id, created_at DESC);
+
+-- /my_confessions: WHERE author_id = $1 ORDER BY id DESC.
+CREATE INDEX CONCURRENTLY IF NOT EXISTS confessions_author_id_id_idx
+    ON confessions (author_id, id DESC);
+
+-- Leaderboard reconciliation: WHERE created_at >= NOW() - interval.
+CREATE INDEX CONCURRENTLY IF NOT EXISTS confessions_created_at_idx
+    ON confessions (created_at);
+
+-- Counter repair and reaction lookups by confession are served by the
+-- UNIQUE (confession_id, user_id, reaction_type) index on reactions, and
+-- comments by comments_confession_id_id_idx (003).
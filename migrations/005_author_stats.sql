@@ -0,0 +1,103 @@
+-- Per-author rollup read by /my_confessions: number of confessions, total
+-- reactions and the best confession. Kept up to date by triggers on
+-- confessions, so every writer (handlers, reaction batches, counter repair)
+-- maintains it and the summary is a single primary-key read.
+
+CREATE TABLE IF NOT EXISTS author_stats (
+    author_id BIGINT PRIMARY KEY,
+    confessions_count INTEGER NOT NULL DEFAULT 0,
+    reactions_count INTEGER NOT NULL DEFAULT 0,
+    best_confession_id INTEGER,
+    best_score INTEGER NOT NULL DEFAULT 0
+);
+
+CREATE OR REPLACE FUNCTION author_stats_on_insert() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO author_stats AS s (author_id, confessions_count, reactions_count, best_confession_id, best_score)
+    VALUES (NEW.author_id, 1, NEW.relatable_count + NEW.support_count, NEW.id, NEW.relatable_count + NEW.support_count)
+    ON CONFLICT (author_id) DO UPDATE
+    SET confessions_count = s.confessions_count + 1,
+        reactions_count = s.reactions_count + EXCLUDED.reactions_count,
+        best_confession_id = CASE WHEN s.best_confession_id IS NULL OR EXCLUDED.best_score > s.best_score
+                                  THEN EXCLUDED.best_confession_id ELSE s.best_confession_id END,
+        best_score = GREATEST(s.best_score, EXCLUDED.best_score);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION author_stats_on_update() RETURNS trigger AS $$
+DECLARE
+    new_score INTEGER := NEW.relatable_count + NEW.support_count;
+    old_score INTEGER := OLD.relatable_count + OLD.support_count;
+BEGIN
+    IF new_score = old_score THEN
+        RETURN NULL;
+    END IF;
+    UPDATE author_stats
+    SET reactions_count = reactions_count + (new_score - old_score),
+        best_confession_id = CASE WHEN new_score > best_score THEN NEW.id ELSE best_confession_id END,
+        best_score = GREATEST(best_score, new_score)
+    WHERE author_id = NEW.author_id;
+
+    -- Scores only drop when a counter repair corrects drift; then the best
+    -- confession may have changed and is looked up again.
+    IF new_score < old_score THEN
+        UPDATE author_stats s
+        SET best_confession_id = b.id, best_score = b.score
+        FROM (
+            SELECT id, relatable_count + support_count AS score
+            FROM confessions
+            WHERE author_id = NEW.author_id
+            ORDER BY relatable_count + support_count DESC, id DESC
+            LIMIT 1
+        ) b
+        WHERE s.author_id = NEW.author_id AND s.best_confession_id = NEW.id;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION author_stats_on_delete() RETURNS trigger AS $$
+BEGIN
+    UPDATE author_stats
+    SET confessions_count = confessions_count - 1,
+        reactions_count = reactions_count - (OLD.relatable_count + OLD.support_count)
+    WHERE author_id = OLD.author_id;
+    UPDATE author_stats s
+    SET best_confession_id = b.id, best_score = COALESCE(b.score, 0)
+    FROM (SELECT NULL::int AS id, NULL::int AS score) fallback
+    LEFT JOIN LATERAL (
+        SELECT id, relatable_count + support_count AS score
+        FROM confessions
+        WHERE author_id = OLD.author_id
+        ORDER BY relatable_count + support_count DESC, id DESC
+        LIMIT 1
+    ) b ON true
+    WHERE s.author_id = OLD.author_id AND s.best_confession_id = OLD.id;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS author_stats_insert ON confessions;
+CREATE TRIGGER author_stats_insert AFTER INSERT ON confessions
+    FOR EACH ROW EXECUTE FUNCTION author_stats_on_insert();
+
+DROP TRIGGER IF EXISTS author_stats_update ON confessions;
+CREATE TRIGGER author_stats_update AFTER UPDATE OF relatable_count, support_count ON confessions
+    FOR EACH ROW EXECUTE FUNCTION author_stats_on_update();
+
+DROP TRIGGER IF EXISTS author_stats_delete ON confessions;
+CREATE TRIGGER author_stats_delete AFTER DELETE ON confessions
+    FOR EACH ROW EXECUTE FUNCTION author_stats_on_delete();
+
+-- Backfill. The triggers exist from here on and this runs in the same
+-- transaction, so no write can slip between the two.
+INSERT INTO author_stats (author_id, confessions_count, reactions_count, best_confession_id, best_score)
+SELECT author_id,
+       count(*),
+       sum(relatable_count + support_count),
+       (array_agg(id ORDER BY relatable_count + support_count DESC, id DESC))[1],
+       max(relatable_count + support_count)
+FROM confessions
+GROUP BY author_id
+ON CONFLICT (author_id) DO NOTHING;
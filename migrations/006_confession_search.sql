@@ -0,0 +1,33 @@
+-- migrate: no-transaction
+-- Full-text search over confessions (/search).
+-- New confessions get their search_vector on insert (INSERT_CONFESSION in
+-- main.py); existing rows are backfilled here in small committed batches so
+-- reaction and comment writes are never blocked for long, then the GIN
+-- index is built without blocking writes. If the index build fails it
+-- leaves an INVALID index behind: drop it and rerun.
+--
+-- The text search configuration ('english') must match the one used by
+-- INSERT_CONFESSION and SEARCH_CONFESSIONS (search.py).
+
+-- Nullable with no default: adding it does not rewrite the table.
+ALTER TABLE confessions ADD COLUMN IF NOT EXISTS search_vector tsvector;
+
+-- Rows inserted by bot processes still on the previous release have no
+-- vector either; the loop runs until it has caught up with the newest id.
+DO $$
+DECLARE
+    last_id INTEGER := 0;
+    batch CONSTANT INTEGER := 5000;
+BEGIN
+    WHILE last_id < (SELECT COALESCE(max(id), 0) FROM confessions) LOOP
+        UPDATE confessions
+        SET search_vector = to_tsvector('english', text)
+        WHERE id > last_id AND id <= last_id + batch AND search_vector IS NULL;
+        last_id := last_id + batch;
+        COMMIT;
+    END LOOP;
+END;
+$$;
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS confessions_search_vector_idx
+    ON confessions USING GIN (search_vector);
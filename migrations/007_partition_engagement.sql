@@ -0,0 +1,148 @@
+-- Monthly range partitioning of reactions and comments.
+--
+-- Both tables are partitioned by the month of the confession they belong to
+-- (confession_created_at, copied from confessions.created_at on insert), not
+-- by the time of the reaction or comment itself. All engagement of a
+-- confession therefore lives in one partition: the unique key on reactions
+-- stays global, a lookup by confession touches a single partition, and a
+-- month of old confessions can be archived as a whole (bot/archive.py).
+--
+-- Partitions are named <table>_yYYYYmMM, with bounds in UTC, and are created
+-- ahead of time by ensure_engagement_partitions(), which the bot calls on
+-- startup. Rows for a month without a partition (one not created yet, or one
+-- archived) go to <table>_default and are moved into the month's partition
+-- when it is created or restored.
+--
+-- This migration copies the existing rows into the new tables while holding
+-- exclusive locks on them; writes wait until it commits (queued reactions
+-- are retried by the bot), so run it when traffic is low.
+
+-- Months moved to compressed files by bot/archive.py. A month listed here
+-- has no partition in the database; its rows are in `file`.
+CREATE TABLE IF NOT EXISTS archived_partitions (
+    table_name TEXT PRIMARY KEY,
+    parent TEXT NOT NULL,
+    month DATE NOT NULL,
+    file TEXT NOT NULL,
+    row_count BIGINT NOT NULL,
+    sha256 TEXT NOT NULL,
+    archived_at TIMESTAMP WITH TIME ZONE DEFAULT now()
+);
+
+CREATE OR REPLACE FUNCTION engagement_partition_name(parent TEXT, month DATE) RETURNS TEXT AS $$
+    SELECT format('%s_y%sm%s', parent, to_char(month, 'YYYY'), to_char(month, 'MM'));
+$$ LANGUAGE sql IMMUTABLE;
+
+-- Creates (unless it exists) and attaches the partition of `parent` for the
+-- month containing `month`, first moving that month's rows out of the
+-- default partition. A table of that name that exists but is detached, e.g.
+-- one being restored from an archive, is attached as it is.
+CREATE OR REPLACE FUNCTION attach_engagement_partition(parent TEXT, month DATE) RETURNS TEXT AS $$
+DECLARE
+    start_at TIMESTAMP WITH TIME ZONE := date_trunc('month', month)::timestamp AT TIME ZONE 'UTC';
+    end_at TIMESTAMP WITH TIME ZONE := (date_trunc('month', month) + interval '1 month')::timestamp AT TIME ZONE 'UTC';
+    name TEXT := engagement_partition_name(parent, date_trunc('month', month)::date);
+BEGIN
+    IF EXISTS (SELECT 1 FROM pg_inherits WHERE inhrelid = to_regclass(name)) THEN
+        RETURN name;
+    END IF;
+    IF to_regclass(name) IS NULL THEN
+        EXECUTE format('CREATE TABLE %I (LIKE %I INCLUDING ALL)', name, parent);
+    END IF;
+    EXECUTE format(
+        'WITH moved AS (DELETE FROM %I WHERE confession_created_at >= $1 AND confession_created_at < $2 RETURNING *)
+         INSERT INTO %I SELECT * FROM moved ON CONFLICT DO NOTHING',
+        parent || '_default', name
+    ) USING start_at, end_at;
+    EXECUTE format('ALTER TABLE %I ATTACH PARTITION %I FOR VALUES FROM (%L) TO (%L)', parent, name, start_at, end_at);
+    RETURN name;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Makes sure the current month and the next `months_ahead` have partitions.
+-- Archived months are left alone.
+CREATE OR REPLACE FUNCTION ensure_engagement_partitions(months_ahead INTEGER) RETURNS void AS $$
+DECLARE
+    parent_table TEXT;
+    first_day DATE;
+BEGIN
+    FOREACH parent_table IN ARRAY ARRAY['reactions', 'comments'] LOOP
+        FOR first_day IN
+            SELECT generate_series(date_trunc('month', now() AT TIME ZONE 'UTC'),
+                                   date_trunc('month', now() AT TIME ZONE 'UTC') + months_ahead * interval '1 month',
+                                   interval '1 month')::date
+        LOOP
+            IF NOT EXISTS (SELECT 1 FROM archived_partitions a
+                           WHERE a.table_name = engagement_partition_name(parent_table, first_day)) THEN
+                PERFORM attach_engagement_partition(parent_table, first_day);
+            END IF;
+        END LOOP;
+    END LOOP;
+END;
+$$ LANGUAGE plpgsql;
+
+-- The partition key of the new tables; the column default already fills it.
+ALTER TABLE confessions ALTER COLUMN created_at SET NOT NULL;
+
+-- Move the old tables aside, index names included, so the new ones can take
+-- over every name.
+ALTER TABLE reactions RENAME TO reactions_unpartitioned;
+ALTER INDEX reactions_pkey RENAME TO reactions_unpartitioned_pkey;
+ALTER INDEX reactions_confession_id_user_id_reaction_type_key RENAME TO reactions_unpartitioned_key;
+ALTER TABLE comments RENAME TO comments_unpartitioned;
+ALTER INDEX comments_pkey RENAME TO comments_unpartitioned_pkey;
+ALTER INDEX IF EXISTS comments_confession_id_id_idx RENAME TO comments_unpartitioned_confession_id_id_idx;
+
+CREATE TABLE reactions (
+    id INTEGER NOT NULL DEFAULT nextval('reactions_id_seq'),
+    confession_id INTEGER NOT NULL REFERENCES confessions(id) ON DELETE CASCADE,
+    user_id BIGINT NOT NULL,
+    reaction_type VARCHAR(32) NOT NULL,
+    reacted_at TIMESTAMP WITH TIME ZONE DEFAULT now(),
+    confession_created_at TIMESTAMP WITH TIME ZONE NOT NULL,
+    PRIMARY KEY (id, confession_created_at),
+    UNIQUE (confession_id, user_id, reaction_type, confession_created_at)
+) PARTITION BY RANGE (confession_created_at);
+CREATE TABLE reactions_default PARTITION OF reactions DEFAULT;
+
+CREATE TABLE comments (
+    id INTEGER NOT NULL DEFAULT nextval('comments_id_seq'),
+    confession_id INTEGER NOT NULL REFERENCES confessions(id) ON DELETE CASCADE,
+    commenter_user_id BIGINT NOT NULL,
+    text TEXT NOT NULL,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT now(),
+    confession_created_at TIMESTAMP WITH TIME ZONE NOT NULL,
+    PRIMARY KEY (id, confession_created_at)
+) PARTITION BY RANGE (confession_created_at);
+CREATE TABLE comments_default PARTITION OF comments DEFAULT;
+-- Keyset pagination of comments (comment_pages.py), one index per partition.
+CREATE INDEX comments_confession_id_id_idx ON comments (confession_id, id);
+
+-- One partition for every month that has confessions, plus the months ahead.
+SELECT attach_engagement_partition(p.parent, m.month::date)
+FROM unnest(ARRAY['reactions', 'comments']) AS p(parent),
+     generate_series(
+         date_trunc('month', (SELECT min(created_at) FROM confessions) AT TIME ZONE 'UTC'),
+         date_trunc('month', now() AT TIME ZONE 'UTC'),
+         interval '1 month'
+     ) AS m(month);
+SELECT ensure_engagement_partitions(2);
+
+INSERT INTO reactions (id, confession_id, user_id, reaction_type, reacted_at, confession_created_at)
+SELECT r.id, r.confession_id, r.user_id, r.reaction_type, r.reacted_at, c.created_at
+FROM reactions_unpartitioned r
+JOIN confessions c ON c.id = r.confession_id;
+
+INSERT INTO comments (id, confession_id, commenter_user_id, text, created_at, confession_created_at)
+SELECT cm.id, cm.confession_id, cm.commenter_user_id, cm.text, cm.created_at, c.created_at
+FROM comments_unpartitioned cm
+JOIN confessions c ON c.id = cm.confession_id;
+
+-- The id sequences now belong to the new tables and survive the drop.
+ALTER SEQUENCE reactions_id_seq OWNED BY reactions.id;
+ALTER SEQUENCE comments_id_seq OWNED BY comments.id;
+DROP TABLE reactions_unpartitioned;
+DROP TABLE comments_unpartitioned;
+
+ANALYZE reactions;
+ANALYZE comments;
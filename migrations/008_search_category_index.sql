@@ -0,0 +1,10 @@
+-- migrate: no-transaction
+-- /search with a category filter (SEARCH_CONFESSIONS_IN_CATEGORY, search.py).
+-- The GIN index (006) finds the matching confessions; this one finds those
+-- of the category, and Postgres ANDs the two bitmaps before reading any
+-- row, so a common word in one category no longer fetches and discards
+-- the matches of every other category. Built without blocking writes; if
+-- the build fails it leaves an INVALID index behind: drop it and rerun.
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS confessions_category_idx
+    ON confessions (category);
@@ -0,0 +1,8 @@
+import os
+import sys
+
+BOT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'bot')
+sys.path.insert(0, BOT_DIR)
+
+# config.py is read on import; main.py refuses to start without a token.
+os.environ.setdefault('BOT_TOKEN', '123456:test-token')
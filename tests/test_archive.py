@@ -0,0 +1,88 @@
+"""
+Archiving and restoring a month of reactions, on a throwaway database.
+
+Skipped unless TEST_DATABASE_URL names a Postgres server it may create a
+database on (see test_query_plans.py).
+"""
+import asyncio
+import os
+from datetime import date
+from urllib.parse import urlsplit, urlunsplit
+
+import pytest
+
+asyncpg = pytest.importorskip('asyncpg')
+TEST_DATABASE_URL = os.getenv('TEST_DATABASE_URL')
+pytestmark = pytest.mark.skipif(not TEST_DATABASE_URL, reason="TEST_DATABASE_URL is not set")
+
+MONTH = date(2024, 1, 1)
+
+
+def _with_database(url: str, name: str) -> str:
+    return urlunsplit(urlsplit(url)._replace(path='/' + name))
+
+
+@pytest.fixture
+def database():
+    import migrate
+
+    name = f"confessions_archive_{os.getpid()}"
+
+    async def run(statement):
+        admin = await asyncpg.connect(TEST_DATABASE_URL)
+        try:
+            await admin.execute(statement)
+        finally:
+            await admin.close()
+
+    async def create():
+        await run(f'CREATE DATABASE "{name}"')
+        conn = await asyncpg.connect(_with_database(TEST_DATABASE_URL, name))
+        try:
+            await migrate.run_migrations(conn)
+        finally:
+            await conn.close()
+
+    asyncio.run(create())
+    try:
+        yield _with_database(TEST_DATABASE_URL, name)
+    finally:
+        asyncio.run(run(f'DROP DATABASE IF EXISTS "{name}" WITH (FORCE)'))
+
+
+def test_restore_drops_duplicate_reactions_and_recounts(database, tmp_path):
+    import archive
+    import reactions
+
+    async def flush(conn, *batch):
+        await conn.fetch(reactions.FLUSH_REACTIONS.sql, *map(list, zip(*sorted(batch))))
+
+    async def counters(conn):
+        rows = await conn.fetch("SELECT id, relatable_count, support_count FROM confessions ORDER BY id")
+        return [tuple(r) for r in rows]
+
+    async def scenario():
+        conn = await asyncpg.connect(database)
+        try:
+            await conn.execute("""
+                INSERT INTO confessions(author_id, author_user_id, channel_chat_id, channel_message_id, category, text, created_at)
+                SELECT 1, 'x', -1, g, 'Work', 'text', '2024-01-15 12:00+00'
+                FROM generate_series(1, 3) g
+            """)
+            await conn.execute("SELECT attach_engagement_partition('reactions', $1)", MONTH)
+            await flush(conn, (1, 10, 'relatable'), (1, 11, 'support'), (2, 10, 'relatable'))
+            assert await counters(conn) == [(1, 1, 1), (2, 1, 0), (3, 0, 0)]
+
+            assert await archive.archive_partition(conn, 'reactions', MONTH, str(tmp_path))
+            # While archived, a repeated reaction is not caught by the unique key.
+            await flush(conn, (1, 10, 'relatable'), (2, 12, 'support'), (3, 10, 'relatable'))
+            assert await counters(conn) == [(1, 2, 1), (2, 1, 1), (3, 1, 0)]
+
+            assert await archive.restore_partition(conn, 'reactions', MONTH, str(tmp_path))
+            assert await counters(conn) == [(1, 1, 1), (2, 1, 1), (3, 1, 0)]
+            assert await conn.fetchval("SELECT count(*) FROM reactions") == 5
+            assert await conn.fetchval("SELECT count(*) FROM reactions_default") == 0
+        finally:
+            await conn.close()
+
+    asyncio.run(scenario())
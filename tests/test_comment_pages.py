@@ -0,0 +1,69 @@
+import asyncio
+
+import pytest
+
+import comment_pages
+from comment_pages import MESSAGE_LIMIT, NEXT, PREV
+
+
+def utf16_length(text: str) -> int:
+    return len(text.encode('utf-16-le')) // 2
+
+
+@pytest.fixture
+def comments(monkeypatch):
+    """Serves the given comments, in id order, in place of the database."""
+    rows = []
+
+    async def fetch(sql, conf_id, anchor, limit):
+        if sql is comment_pages.COMMENTS_AFTER:
+            matching = [r for r in rows if r['id'] > anchor]
+        else:
+            matching = [r for r in reversed(rows) if r['id'] < anchor]
+        return matching[:limit]
+
+    monkeypatch.setattr(comment_pages, 'fetch', fetch)
+    return rows
+
+
+def render(direction=NEXT, anchor=0):
+    return asyncio.run(comment_pages._render((1, direction, anchor)))
+
+
+def test_page_holds_every_comment_that_fits(comments):
+    comments += [{'id': i, 'text': f"comment {i}"} for i in range(1, 6)]
+    text, first_id, last_id, has_prev, has_next = render()
+    assert (first_id, last_id, has_prev, has_next) == (1, 5, False, False)
+    assert text.count('💬') == 5
+
+
+def test_emoji_comment_is_truncated_to_the_limit(comments):
+    # 3000 emoji are 3000 characters but 6000 UTF-16 code units.
+    comments.append({'id': 1, 'text': '😀' * 3000})
+    text = render()[0]
+    assert utf16_length(text) <= MESSAGE_LIMIT
+    assert text.endswith('😀…')
+    text.encode('utf-8')  # no half surrogate pair left behind
+
+
+def test_emoji_comments_are_paged_by_utf16_length(comments):
+    # Each entry is ~1000 code units but only ~500 characters.
+    comments += [{'id': i, 'text': '🔥' * 500} for i in range(1, 11)]
+    pages = []
+    page = render()
+    while page:
+        text, first_id, last_id, has_prev, has_next = page
+        assert utf16_length(text) <= MESSAGE_LIMIT
+        pages.append((first_id, last_id))
+        page = render(NEXT, last_id) if has_next else None
+    assert pages == [(1, 4), (5, 8), (9, 10)]
+
+    text, first_id, last_id, _, _ = render(PREV, 9)
+    assert (first_id, last_id) == (5, 8)
+    assert utf16_length(text) <= MESSAGE_LIMIT
+
+
+def test_truncate_never_splits_a_surrogate_pair():
+    assert comment_pages._truncate('a😀b', 2) == 'a'
+    assert comment_pages._truncate('a😀b', 3) == 'a😀'
+    assert comment_pages._length('a😀b') == 4
@@ -0,0 +1,88 @@
+"""
+Row locks taken by a reaction flush, on a throwaway database.
+
+Skipped unless TEST_DATABASE_URL names a Postgres server it may create a
+database on (see test_query_plans.py).
+"""
+import asyncio
+import os
+from urllib.parse import urlsplit, urlunsplit
+
+import pytest
+
+asyncpg = pytest.importorskip('asyncpg')
+TEST_DATABASE_URL = os.getenv('TEST_DATABASE_URL')
+pytestmark = pytest.mark.skipif(not TEST_DATABASE_URL, reason="TEST_DATABASE_URL is not set")
+
+
+def _with_database(url: str, name: str) -> str:
+    return urlunsplit(urlsplit(url)._replace(path='/' + name))
+
+
+@pytest.fixture
+def database():
+    import migrate
+
+    name = f"confessions_flush_{os.getpid()}"
+
+    async def run(statement):
+        admin = await asyncpg.connect(TEST_DATABASE_URL)
+        try:
+            await admin.execute(statement)
+        finally:
+            await admin.close()
+
+    async def create():
+        await run(f'CREATE DATABASE "{name}"')
+        conn = await asyncpg.connect(_with_database(TEST_DATABASE_URL, name))
+        try:
+            await migrate.run_migrations(conn)
+        finally:
+            await conn.close()
+
+    asyncio.run(create())
+    try:
+        yield _with_database(TEST_DATABASE_URL, name)
+    finally:
+        asyncio.run(run(f'DROP DATABASE IF EXISTS "{name}" WITH (FORCE)'))
+
+
+def test_flush_locks_the_author_stats_of_every_confession_in_the_batch(database):
+    import reactions
+
+    async def flush(conn, *batch):
+        return await conn.fetch(reactions.FLUSH_REACTIONS.sql, *map(list, zip(*sorted(batch))))
+
+    async def locked(conn, author_id) -> bool:
+        try:
+            await conn.execute("SELECT 1 FROM author_stats WHERE author_id = $1 FOR UPDATE NOWAIT", author_id)
+        except asyncpg.LockNotAvailableError:
+            return True
+        return False
+
+    async def scenario():
+        first = await asyncpg.connect(database)
+        second = await asyncpg.connect(database)
+        try:
+            # Confession 1 belongs to author 2 and confession 2 to author 1,
+            # so id order and author order disagree.
+            await first.execute("""
+                INSERT INTO confessions(author_id, author_user_id, channel_chat_id, channel_message_id, category, text)
+                VALUES (2, 'x', -1, 1, 'Work', 'text'), (1, 'x', -1, 2, 'Work', 'text'), (3, 'x', -1, 3, 'Work', 'text')
+            """)
+            await flush(first, (2, 10, 'support'))
+
+            async with first.transaction():
+                # Only confession 1 gains a reaction; the trigger leaves author 1 alone.
+                rows = await flush(first, (1, 10, 'relatable'), (2, 10, 'support'))
+                assert [(r['id'], r['inserted']) for r in rows] == [(1, 1)]
+                assert await locked(second, 1)
+                assert await locked(second, 2)
+                assert not await locked(second, 3)
+            assert not await locked(second, 1)
+            assert await first.fetchval("SELECT reactions_count FROM author_stats WHERE author_id = 2") == 1
+        finally:
+            await first.close()
+            await second.close()
+
+    asyncio.run(scenario())
@@ -0,0 +1,79 @@
+import os
+
+import migrate
+from migrate import NO_TRANSACTION_MARKER, discover, split_statements
+
+
+def test_split_statements_on_top_level_semicolons():
+    sql = """
+        CREATE TABLE a (id INT);
+        CREATE INDEX CONCURRENTLY a_id_idx
+            ON a (id);
+        SELECT 1
+    """
+    assert split_statements(sql) == [
+        "CREATE TABLE a (id INT);",
+        "CREATE INDEX CONCURRENTLY a_id_idx\n            ON a (id);",
+        "SELECT 1",
+    ]
+
+
+def test_split_statements_skips_comment_lines_and_the_marker():
+    sql = f"""{NO_TRANSACTION_MARKER}
+-- A comment; with a semicolon.
+CREATE INDEX CONCURRENTLY b_idx ON b (x);
+  -- indented comment;
+;
+"""
+    assert split_statements(sql) == ["CREATE INDEX CONCURRENTLY b_idx ON b (x);"]
+
+
+def test_split_statements_keeps_dollar_quoted_bodies_whole():
+    sql = """
+ALTER TABLE t ADD COLUMN v tsvector;
+DO $$
+DECLARE
+    n INTEGER := 0;
+BEGIN
+    -- a comment inside the body stays in it;
+    UPDATE t SET v = NULL WHERE id > n;
+    COMMIT;
+END;
+$$;
+CREATE FUNCTION f() RETURNS int AS $$
+    SELECT 1;
+$$ LANGUAGE sql;
+CREATE INDEX CONCURRENTLY t_v_idx ON t USING GIN (v);
+"""
+    statements = split_statements(sql)
+    assert len(statements) == 4
+    assert statements[1].startswith("DO $$") and statements[1].endswith("$$;")
+    assert "-- a comment inside the body stays in it;" in statements[1]
+    assert "COMMIT;" in statements[1]
+    assert statements[2].endswith("$$ LANGUAGE sql;")
+    assert statements[3] == "CREATE INDEX CONCURRENTLY t_v_idx ON t USING GIN (v);"
+
+
+def test_split_statements_of_the_search_migration():
+    with open(os.path.join(migrate.MIGRATIONS_DIR, '006_confession_search.sql'), encoding='utf-8') as f:
+        sql = f.read()
+    assert NO_TRANSACTION_MARKER in sql
+    statements = split_statements(sql)
+    assert [s.split()[0] for s in statements] == ['ALTER', 'DO', 'CREATE']
+
+
+def test_discover_orders_by_number(tmp_path, monkeypatch):
+    for name in ('10_ten.sql', '2_two.sql', '001_one.sql', '003_three.sql.bak', 'README.md', 'x_1.sql'):
+        (tmp_path / name).write_text('SELECT 1;')
+    monkeypatch.setattr(migrate, 'MIGRATIONS_DIR', str(tmp_path))
+    assert discover() == [
+        ('001_one', str(tmp_path / '001_one.sql')),
+        ('2_two', str(tmp_path / '2_two.sql')),
+        ('10_ten', str(tmp_path / '10_ten.sql')),
+    ]
+
+
+def test_shipped_migrations_are_numbered_consecutively():
+    versions = [version for version, _ in discover()]
+    assert versions[0] == '001_init'
+    assert [int(v.split('_')[0]) for v in versions] == list(range(1, len(versions) + 1))
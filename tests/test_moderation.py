@@ -0,0 +1,101 @@
+import asyncio
+import os
+
+import pytest
+
+import moderation
+from moderation import ALLOW, REDACT, REJECT, Engine, moderate
+
+
+@pytest.mark.parametrize('text', [
+    "I was born 12.03.1995",
+    "call me 2024-10-17",
+    "my score is 100000",
+    "I hate my job.co-workers",
+    "from 1990-2000 it was fine",
+    "born 1.3.95 ok",
+    "since 1998 2003 and 2010",
+    "in 1998, 2003 and 2010",
+    "the dot com bubble",
+    "polka dot me dresses",
+    "visit example dot com",
+])
+def test_dates_numbers_and_words_are_left_alone(text):
+    verdict = Engine({}).check(text)
+    assert (verdict.action, verdict.text) == (ALLOW, text)
+
+
+@pytest.mark.parametrize('text,expected', [
+    ("call +1 (555) 123-4567 now", "call [redacted] now"),
+    ("call (555) 123 4567", "call [redacted]"),
+    ("ring 555-123-4567", "ring [redacted]"),
+    ("+44 20 7946 0958", "[redacted]"),
+    ("see example.com/x", "see [redacted]"),
+    ("see job.co", "see [redacted]"),
+    ("join t.me/foo", "join [redacted]"),
+    ("visit example [dot] com", "visit [redacted]"),
+    ("visit example dot com/deal now", "visit [redacted] now"),
+    ("www dot example dot com ok", "[redacted] ok"),
+    ("join t dot me/foo", "join [redacted]"),
+    ("call 2012 3456 78", "call [redacted]"),
+    ("hxxp://evil.example", "[redacted]"),
+    ("mail me@example.org", "mail [redacted]"),
+    ("dm @someone_here", "dm [redacted]"),
+])
+def test_contact_details_are_redacted(text, expected):
+    verdict = Engine({}).check(text)
+    assert (verdict.action, verdict.text) == (REDACT, expected)
+
+
+def test_blocklist_redacts_and_rejects_lookalikes():
+    engine = Engine({('profanity', REDACT): ['darn', 'heck off'], ('threats', REJECT): ['hurt you']})
+    assert engine.check("oh d4rn, HECK   off").text == "oh [redacted], [redacted]"
+    assert engine.check("I will hur7 y0u").action == REJECT
+    assert engine.check("darning socks").action == ALLOW
+
+
+def test_reload_builds_the_new_rules_off_the_event_loop(tmp_path, monkeypatch):
+    rules = tmp_path / 'rules.txt'
+    rules.write_text("[profanity:redact]\ndarn\n")
+    monkeypatch.setattr(moderation, 'MODERATION_RULES_FILE', str(rules))
+    monkeypatch.setattr(moderation, 'MODERATION_RELOAD_INTERVAL', 0)
+    monkeypatch.setattr(moderation, '_engine', Engine({}))
+    monkeypatch.setattr(moderation, '_loaded_mtime', None)
+    monkeypatch.setattr(moderation, '_checked_at', 0.0)
+
+    async def scenario():
+        # The first load has nothing to fall back on and is built inline.
+        assert moderate("darn heck").text == "[redacted] heck"
+
+        rules.write_text("[profanity:redact]\ndarn\nheck\n")
+        os.utime(rules, (1, 1))
+        # Still the old rules while the new ones are built in a thread.
+        assert moderate("darn heck").text == "[redacted] heck"
+        assert moderation._building is not None
+        await asyncio.wait([moderation._building])
+        await asyncio.sleep(0)
+        assert moderation._building is None
+        assert moderate("darn heck").text == "[redacted] [redacted]"
+
+    asyncio.run(scenario())
+
+
+def test_reload_keeps_the_old_rules_when_the_file_is_invalid(tmp_path, monkeypatch):
+    rules = tmp_path / 'rules.txt'
+    rules.write_text("[profanity:redact]\ndarn\n")
+    monkeypatch.setattr(moderation, 'MODERATION_RULES_FILE', str(rules))
+    monkeypatch.setattr(moderation, 'MODERATION_RELOAD_INTERVAL', 0)
+    monkeypatch.setattr(moderation, '_engine', Engine({}))
+    monkeypatch.setattr(moderation, '_loaded_mtime', None)
+    monkeypatch.setattr(moderation, '_checked_at', 0.0)
+
+    async def scenario():
+        assert moderate("darn").action == REDACT
+        rules.write_text("[profanity:shout]\ndarn\n")
+        os.utime(rules, (1, 1))
+        moderate("darn")
+        await asyncio.wait([moderation._building])
+        await asyncio.sleep(0)
+        assert moderate("darn").action == REDACT
+
+    asyncio.run(scenario())
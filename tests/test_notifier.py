@@ -0,0 +1,109 @@
+import asyncio
+
+import pytest
+
+import notifier
+from notifier import NOTIFY_DELTA, NOTIFY_DIGEST_INTERVAL, NOTIFY_MIN_INTERVAL
+
+NOW = 10_000.0
+AUTHOR = 7
+
+
+def entry(gained: int, age: float = 0.0, last_notified: int = 10, message_id: int = 100) -> dict:
+    return {'message_id': message_id, 'engagement': last_notified + gained, 'last_notified': last_notified,
+            'since': NOW - age}
+
+
+@pytest.fixture(autouse=True)
+def clean_state(monkeypatch):
+    monkeypatch.setattr(notifier, '_pending', {})
+    monkeypatch.setattr(notifier, '_last_sent', {})
+    monkeypatch.setattr(notifier, 'CHANNEL_USERNAME', '@confessions')
+
+
+def test_due_once_a_confession_gained_the_delta():
+    assert notifier._is_due(AUTHOR, {1: entry(NOTIFY_DELTA)}, NOW)
+    assert not notifier._is_due(AUTHOR, {1: entry(NOTIFY_DELTA - 1)}, NOW)
+    # Gains are counted per confession, not summed over the author's confessions.
+    assert not notifier._is_due(AUTHOR, {1: entry(NOTIFY_DELTA - 1), 2: entry(NOTIFY_DELTA - 1)}, NOW)
+
+
+def test_min_interval_holds_back_the_next_message():
+    notifier._last_sent[AUTHOR] = NOW - NOTIFY_MIN_INTERVAL + 1
+    assert not notifier._is_due(AUTHOR, {1: entry(NOTIFY_DELTA * 10)}, NOW)
+    notifier._last_sent[AUTHOR] = NOW - NOTIFY_MIN_INTERVAL
+    assert notifier._is_due(AUTHOR, {1: entry(NOTIFY_DELTA)}, NOW)
+
+
+def test_never_notified_author_is_not_throttled():
+    # A monotonic clock may be smaller than NOTIFY_MIN_INTERVAL right after boot.
+    assert notifier._is_due(AUTHOR, {1: entry(NOTIFY_DELTA, age=0)}, 1.0)
+
+
+def test_small_gains_go_out_as_a_digest():
+    assert not notifier._is_due(AUTHOR, {1: entry(1, age=NOTIFY_DIGEST_INTERVAL - 1)}, NOW)
+    assert notifier._is_due(AUTHOR, {1: entry(1, age=NOTIFY_DIGEST_INTERVAL)}, NOW)
+    # The digest is not held back by the min interval.
+    notifier._last_sent[AUTHOR] = NOW - 1
+    assert notifier._is_due(AUTHOR, {1: entry(1, age=NOTIFY_DIGEST_INTERVAL)}, NOW)
+
+
+@pytest.fixture
+def outbox(monkeypatch):
+    """Claims whatever `claimable` holds and collects the messages sent."""
+    sent, claims, claimable = [], [], set()
+
+    async def fetch(sql, ids, engagements):
+        claims.append((ids, engagements))
+        return [{'id': i} for i in ids if i in claimable]
+
+    async def send(priority, chat_id, call, /, *args, **kwargs):
+        sent.append((chat_id, args[1]))
+
+    class Bot:
+        send_message = None
+
+    monkeypatch.setattr(notifier, 'fetch', fetch)
+    monkeypatch.setattr(notifier, 'send', send)
+    monkeypatch.setattr(notifier, '_bot', Bot())
+    return sent, claims, claimable
+
+
+def test_notify_reports_only_the_claimed_confessions(outbox):
+    sent, claims, claimable = outbox
+    claimable.update({1, 3})
+    entries = {1: entry(4, message_id=11), 2: entry(5, message_id=12), 3: entry(1, message_id=13)}
+    asyncio.run(notifier._notify(AUTHOR, entries))
+
+    assert claims == [([1, 2, 3], [14, 15, 11])]
+    [(chat_id, text)] = sent
+    assert chat_id == AUTHOR
+    assert "#1: +4" in text and "https://t.me/confessions/11" in text
+    assert "#3: +1" in text
+    assert "#2" not in text
+    assert AUTHOR in notifier._last_sent
+
+
+def test_failed_claim_sends_nothing(outbox):
+    sent, claims, _ = outbox
+    # Another worker advanced last_notified_count first.
+    asyncio.run(notifier._notify(AUTHOR, {1: entry(NOTIFY_DELTA)}))
+    assert len(claims) == 1
+    assert sent == []
+    assert AUTHOR not in notifier._last_sent
+
+
+def test_flush_sends_one_message_per_due_author(outbox):
+    sent, _, claimable = outbox
+    claimable.update({1, 2, 3})
+    for conf_id in (1, 2):
+        notifier.record(AUTHOR, conf_id, conf_id, 10 + NOTIFY_DELTA, 10)
+    notifier.record(AUTHOR + 1, 3, 3, 11, 10)
+
+    asyncio.run(notifier._flush())
+    assert [chat_id for chat_id, _ in sent] == [AUTHOR]
+    assert "Your confessions are getting attention" in sent[0][1]
+    assert list(notifier._pending) == [AUTHOR + 1]
+
+    asyncio.run(notifier._flush(force=True))
+    assert [chat_id for chat_id, _ in sent] == [AUTHOR, AUTHOR + 1]
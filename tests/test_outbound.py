@@ -0,0 +1,114 @@
+import asyncio
+import time
+
+import fakeredis
+import pytest
+
+import outbound
+from outbound import MemoryLimits, RedisLimits
+
+PRIVATE, CHANNEL = 42, -1001000000000
+
+
+def _memory() -> MemoryLimits:
+    return MemoryLimits()
+
+
+def _redis() -> RedisLimits:
+    limits = RedisLimits('redis://localhost:6379/0')
+    limits._redis = fakeredis.aioredis.FakeRedis(decode_responses=True)
+    limits._acquire = limits._redis.register_script(RedisLimits.ACQUIRE)
+    limits._block = limits._redis.register_script(RedisLimits.BLOCK)
+    return limits
+
+
+@pytest.fixture(params=[_memory, _redis], ids=['memory', 'redis'])
+def limits(request):
+    return request.param
+
+
+def test_chat_bucket_delays_the_second_message(limits):
+    async def scenario():
+        buckets = limits()
+        assert await buckets.acquire(PRIVATE) == (0, 0)
+        chat_delay, global_delay = await buckets.acquire(PRIVATE)
+        assert 0.9 < chat_delay <= 1 and global_delay == 0
+        # Channels refill at 20 per minute.
+        assert await buckets.acquire(CHANNEL) == (0, 0)
+        assert 2.9 < (await buckets.acquire(CHANNEL))[0] <= 3
+
+    asyncio.run(scenario())
+
+
+def test_global_bucket_is_shared_by_all_chats(limits):
+    async def scenario():
+        buckets = limits()
+        for chat_id in range(1, 31):
+            assert await buckets.acquire(chat_id) == (0, 0)
+        chat_delay, global_delay = await buckets.acquire(31)
+        assert chat_delay == 0 and 0 < global_delay <= 1 / 30
+
+    asyncio.run(scenario())
+
+
+def test_retry_after_blocks_the_chat(limits):
+    async def scenario():
+        buckets = limits()
+        await buckets.block(PRIVATE, 5)
+        chat_delay, _ = await buckets.acquire(PRIVATE)
+        assert 4.9 < chat_delay <= 5
+        assert await buckets.acquire(PRIVATE + 1) == (0, 0)
+
+    asyncio.run(scenario())
+
+
+def test_redis_buckets_are_shared_between_workers():
+    async def scenario():
+        first = _redis()
+        second = _redis()
+        second._redis = first._redis
+        second._acquire = second._redis.register_script(RedisLimits.ACQUIRE)
+        assert await first.acquire(CHANNEL) == (0, 0)
+        assert (await second.acquire(CHANNEL))[0] > 2.9
+
+    asyncio.run(scenario())
+
+
+def test_memory_workers_split_the_global_and_group_rates(monkeypatch):
+    monkeypatch.setattr(outbound, 'workers', 4)
+
+    async def scenario():
+        buckets = outbound.create_limits()
+        assert buckets._global.rate == pytest.approx(30 / 4)
+        await buckets.acquire(CHANNEL)
+        assert (await buckets.acquire(CHANNEL))[0] == pytest.approx(12, abs=0.1)
+        # A user's messages all come from one worker: full rate.
+        await buckets.acquire(PRIVATE)
+        assert (await buckets.acquire(PRIVATE))[0] == pytest.approx(1, abs=0.1)
+
+    asyncio.run(scenario())
+
+
+def test_create_limits_unknown_backend(monkeypatch):
+    monkeypatch.setattr(outbound, 'OUTBOUND_BACKEND', 'memcached')
+    with pytest.raises(RuntimeError, match="Unknown OUTBOUND_BACKEND: 'memcached'"):
+        outbound.create_limits()
+
+
+def test_send_waits_for_the_chat_bucket():
+    async def scenario():
+        sent = []
+
+        async def call(text):
+            sent.append((text, time.monotonic()))
+            return text
+
+        outbound.start_outbound()
+        try:
+            results = await asyncio.gather(*(outbound.send(outbound.USER_REPLY, PRIVATE, call, n) for n in range(2)))
+        finally:
+            await outbound.stop_outbound()
+        assert results == [0, 1]
+        assert sent[1][1] - sent[0][1] >= 0.9
+
+    asyncio.run(scenario())
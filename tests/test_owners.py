@@ -0,0 +1,64 @@
+import asyncio
+import queue
+
+import pytest
+
+import markup_updater
+import owners
+
+
+@pytest.fixture
+def handlers(monkeypatch):
+    """Records the work run in this process, per kind."""
+    monkeypatch.setattr(owners, '_handlers', {})
+    monkeypatch.setattr(owners, '_handoffs', None)
+    monkeypatch.setattr(owners, 'workers', 1)
+    monkeypatch.setattr(owners, 'index', 0)
+    ran = []
+    owners.register('keyboard', lambda *args: ran.append(('keyboard',) + args))
+    owners.register('notify', lambda *args: ran.append(('notify',) + args))
+    return ran
+
+
+def test_single_process_runs_everything_locally(handlers):
+    owners.dispatch('keyboard', 7, 7, 'x')
+    owners.dispatch('notify', 8, 8)
+    assert handlers == [('keyboard', 7, 'x'), ('notify', 8)]
+
+
+def test_work_is_handed_to_its_owner_and_run_there(handlers):
+    async def scenario():
+        handoffs = [queue.Queue() for _ in range(4)]
+        owners.start_owners(1, handoffs)
+        owners.dispatch('keyboard', 5, 5, 'mine')       # 5 % 4 == 1
+        owners.dispatch('keyboard', 6, 6, 'theirs')     # 6 % 4 == 2
+        assert handlers == [('keyboard', 5, 'mine')]
+        assert handoffs[2].get_nowait() == ('keyboard', (6, 'theirs'))
+
+        # Another worker handing over a notification for an author we own.
+        handoffs[1].put(('notify', (9, 'ping')))
+        while len(handlers) < 2:
+            await asyncio.sleep(0.01)
+        assert handlers[-1] == ('notify', 9, 'ping')
+
+        # Handed over but not served yet: still run on shutdown, and
+        # everything after that runs locally.
+        handoffs[1].put(('keyboard', (13, 'late')))
+        await owners.stop_owners()
+        owners.dispatch('keyboard', 6, 6, 'after')
+        assert handlers[2:] == [('keyboard', 13, 'late'), ('keyboard', 6, 'after')]
+
+    asyncio.run(scenario())
+
+
+def test_older_counts_do_not_replace_newer_ones(monkeypatch):
+    monkeypatch.setattr(markup_updater, '_latest', markup_updater.OrderedDict())
+    monkeypatch.setattr(markup_updater, '_pending', {})
+    monkeypatch.setattr(markup_updater, '_tasks', {1: None})  # a flush is already scheduled
+
+    markup_updater.schedule_markup_edit(1, -100, 10, 'five', (3, 2, 0))
+    markup_updater.schedule_markup_edit(1, -100, 10, 'four', (2, 2, 0))
+    markup_updater.schedule_markup_edit(1, -100, 10, 'five again', (3, 2, 0))
+    assert markup_updater._pending[1] == (-100, 10, 'five')
+    markup_updater.schedule_markup_edit(1, -100, 10, 'six', (3, 2, 1))
+    assert markup_updater._pending[1] == (-100, 10, 'six')
@@ -0,0 +1,219 @@
+"""
+Plans of the bot's named queries on a large database.
+
+Creates a throwaway database, migrates it, seeds two years of traffic and
+runs EXPLAIN (ANALYZE) on every query registered with db.query(), asserting
+that none of them scans a whole table and that each stays within its
+latency budget. Writes run in a transaction that is rolled back.
+
+Needs a Postgres URL allowed to CREATE DATABASE, e.g.
+    TEST_DATABASE_URL=postgresql://postgres@localhost/postgres python -m pytest tests/test_query_plans.py
+and is skipped without one. Seeding takes a few tens of seconds.
+"""
+import asyncio
+import datetime
+import json
+import os
+from urllib.parse import urlsplit, urlunsplit
+
+import pytest
+
+asyncpg = pytest.importorskip('asyncpg')
+TEST_DATABASE_URL = os.getenv('TEST_DATABASE_URL')
+pytestmark = pytest.mark.skipif(not TEST_DATABASE_URL, reason="TEST_DATABASE_URL is not set")
+
+CONFESSIONS = 200_000
+AUTHORS = 20_000
+DAYS = 730
+REACTIONS_PER_CONFESSION = 3
+COMMENTS_PER_CONFESSION = 3
+HOT_COMMENTS = 5_000
+LATENCY_BUDGET_MS = 50
+# Rows an executed plan node may read and then discard; an index scan that
+# filters out more than this is using the wrong index.
+MAX_ROWS_FILTERED = 1000
+# Tables whose size grows with traffic; a sequential scan of any of them (or
+# of one of their partitions) fails the test.
+LARGE_TABLES = ('confessions', 'reactions', 'comments', 'author_stats')
+INDEX_SCANS = ('Index Scan', 'Index Only Scan', 'Bitmap Index Scan')
+
+# Registered queries that are not run by handlers and are allowed to scan.
+EXEMPT = {
+    # Once at startup and per reconciliation: ranks every confession, and no
+    # index covers the counters on purpose (see migration 004).
+    'leaderboard_best',
+    # Calls a maintenance function; its statements are not planned here.
+    'ensure_partitions',
+}
+
+WORDS = [
+    'exam', 'stress', 'work', 'boss', 'family', 'crush', 'friend', 'secret', 'money', 'sleep',
+    'coffee', 'school', 'love', 'lonely', 'happy', 'party', 'travel', 'dog', 'cat', 'music',
+]
+
+# Words and categories are drawn independently (with a fixed seed): values
+# derived from the row number by modulo are correlated with each other and
+# mislead the planner in ways real traffic would not.
+SEED = f"""
+    SELECT setseed(0.42);
+    INSERT INTO confessions(author_id, author_user_id, channel_chat_id, channel_message_id,
+                            category, text, created_at, relatable_count, support_count)
+    SELECT 1 + (g * 7919) % {AUTHORS}, 'seed', -1001000000000, g,
+           (ARRAY['Love','Work','School','Family','Friends','Random'])[1 + floor(random() * 6)::int],
+           'seed ' || (ARRAY{WORDS!r})[1 + floor(random() * {len(WORDS)})::int] || ' '
+                   || (ARRAY{WORDS!r})[1 + floor(random() * {len(WORDS)})::int] || ' confession number ' || g,
+           now() - ({DAYS} * ({CONFESSIONS} - g)::float / {CONFESSIONS}) * interval '1 day',
+           g % 50, g % 30
+    FROM generate_series(1, {CONFESSIONS}) g;
+    UPDATE confessions SET search_vector = to_tsvector('english', text);
+
+    SELECT attach_engagement_partition(p.parent, m.month::date)
+    FROM unnest(ARRAY['reactions', 'comments']) AS p(parent),
+         generate_series(date_trunc('month', now() - interval '{DAYS} days'),
+                         date_trunc('month', now()), interval '1 month') AS m(month);
+
+    INSERT INTO reactions(confession_id, user_id, reaction_type, confession_created_at)
+    SELECT c.id, 1000000 + c.id * 10 + r, (ARRAY['relatable','support'])[1 + r % 2], c.created_at
+    FROM confessions c, generate_series(1, {REACTIONS_PER_CONFESSION}) r;
+
+    INSERT INTO comments(confession_id, commenter_user_id, text, confession_created_at)
+    SELECT c.id, 2000000 + c.id * 10 + n, 'seed comment on ' || c.id, c.created_at
+    FROM confessions c, generate_series(1, {COMMENTS_PER_CONFESSION}) n;
+
+    INSERT INTO comments(confession_id, commenter_user_id, text, confession_created_at)
+    SELECT c.id, 3000000 + g, 'hot comment ' || g, c.created_at
+    FROM confessions c, generate_series(1, {HOT_COMMENTS}) g
+    WHERE c.id = {CONFESSIONS};
+
+    ANALYZE;
+"""
+
+HOT = CONFESSIONS            # newest confession, the one with a long thread
+OLD = CONFESSIONS // 10      # a confession from more than a year ago
+AUTHOR = 1 + (HOT * 7919) % AUTHORS
+SINCE_ALL = datetime.datetime.min.replace(tzinfo=datetime.timezone.utc)
+
+
+def _cases():
+    """(query name, arguments) pairs; several per query where the plan depends on them."""
+    week_ago = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(days=7)
+    ids = list(range(HOT - 99, HOT + 1))
+    return [
+        ('confession_by_id', (HOT,)),
+        ('insert_confession', (AUTHOR, 'enc', -1001000000000, 1, 'Work', 'exam stress at work')),
+        ('add_comment', (HOT, 42, 'a new comment')),
+        ('add_comment', (OLD, 42, 'a comment on an old confession')),
+        ('comments_after', (HOT, 0, 21)),
+        ('comments_after', (HOT, 10 ** 9 // 2, 21)),
+        ('comments_before', (HOT, 10 ** 9, 21)),
+        ('comments_after', (OLD, 0, 21)),
+        ('author_summary', (AUTHOR,)),
+        ('my_confessions_first', (AUTHOR, SINCE_ALL, 11)),
+        ('my_confessions_first', (AUTHOR, week_ago, 11)),
+        ('my_confessions_older', (AUTHOR, SINCE_ALL, HOT, 11)),
+        ('my_confessions_newer', (AUTHOR, SINCE_ALL, OLD, 11)),
+        ('search_confessions', ('exam stress', 50)),
+        ('search_confessions', ('nonexistentword', 50)),
+        ('search_confessions_in_category', ('exam', 'Work', 50)),
+        ('search_confessions_in_category', ('exam stress', 'Family', 50)),
+        ('leaderboard_texts', (ids,)),
+        ('leaderboard_recent', (datetime.timedelta(days=7),)),
+        ('claim_notifications', (ids, [10 ** 6] * len(ids))),
+        ('flush_reactions', (ids + [OLD], [5] * (len(ids) + 1), ['relatable'] * (len(ids) + 1))),
+    ]
+
+
+def _with_database(url: str, name: str) -> str:
+    return urlunsplit(urlsplit(url)._replace(path='/' + name))
+
+
+@pytest.fixture(scope='module')
+def database():
+    import migrate
+
+    name = f"confessions_plans_{os.getpid()}"
+
+    async def create():
+        admin = await asyncpg.connect(TEST_DATABASE_URL)
+        try:
+            await admin.execute(f'CREATE DATABASE "{name}"')
+        finally:
+            await admin.close()
+        conn = await asyncpg.connect(_with_database(TEST_DATABASE_URL, name))
+        try:
+            await migrate.run_migrations(conn)
+            await conn.execute(SEED)
+        finally:
+            await conn.close()
+
+    async def drop():
+        admin = await asyncpg.connect(TEST_DATABASE_URL)
+        try:
+            await admin.execute(f'DROP DATABASE IF EXISTS "{name}" WITH (FORCE)')
+        finally:
+            await admin.close()
+
+    asyncio.run(create())
+    try:
+        yield _with_database(TEST_DATABASE_URL, name)
+    finally:
+        asyncio.run(drop())
+
+
+@pytest.fixture(scope='module')
+def queries():
+    # Registers every named query of the bot.
+    import main  # noqa: F401
+    import db
+    return dict(db._queries)
+
+
+def _nodes(plan: dict):
+    yield plan
+    for child in plan.get('Plans', ()):
+        yield from _nodes(child)
+
+
+def _explain(url: str, sql: str, args) -> dict:
+    async def run():
+        conn = await asyncpg.connect(url)
+        try:
+            tx = conn.transaction()
+            await tx.start()
+            try:
+                result = await conn.fetchval(f"EXPLAIN (ANALYZE, FORMAT JSON) {sql}", *args)
+            finally:
+                await tx.rollback()
+        finally:
+            await conn.close()
+        return json.loads(result)[0]
+
+    return asyncio.run(run())
+
+
+def _table(relation: str) -> str:
+    """The parent of a partition name, e.g. comments_y2024m01 -> comments."""
+    for table in LARGE_TABLES:
+        if relation == table or relation.startswith(table + '_'):
+            return table
+    return relation
+
+
+def test_every_query_has_a_plan_check(queries):
+    assert set(queries) == {name for name, _ in _cases()} | EXEMPT
+
+
+@pytest.mark.parametrize('name,args', _cases(), ids=[f"{n}-{i}" for i, (n, _) in enumerate(_cases())])
+def test_query_uses_indexes_within_budget(database, queries, name, args):
+    result = _explain(database, queries[name].sql, args)
+    plan = json.dumps(result['Plan'], indent=1)
+    # Partitions pruned at run time stay in the plan but are never executed.
+    nodes = [n for n in _nodes(result['Plan']) if n.get('Actual Loops')]
+    reads = [n for n in nodes if _table(n.get('Relation Name', '')) in LARGE_TABLES and n['Node Type'] != 'ModifyTable']
+    assert all(n['Node Type'] in INDEX_SCANS or n['Node Type'] == 'Bitmap Heap Scan' for n in reads), \
+        f"{name} reads without an index:\n{plan}"
+
+    filtered = max([n.get('Rows Removed by Filter', 0) * n['Actual Loops'] for n in nodes] + [0])
+    assert filtered <= MAX_ROWS_FILTERED, f"{name} discards {filtered} rows in one node:\n{plan}"
+    assert result['Execution Time'] <= LATENCY_BUDGET_MS, \
+        f"{name} took {result['Execution Time']:.1f} ms (budget {LATENCY_BUDGET_MS} ms)"
@@ -0,0 +1,135 @@
+import asyncio
+
+import fakeredis
+import pytest
+
+from ratelimit import MemoryBackend, RateLimiter, RedisBackend, _rejection
+
+LIMITS = {'confess': (1, 300.0), 'react': (3, 60.0)}
+
+
+def _memory() -> RateLimiter:
+    return RateLimiter(MemoryBackend(max_keys=100), LIMITS)
+
+
+def _redis() -> RateLimiter:
+    backend = RedisBackend('redis://localhost:6379/0')
+    backend._redis = fakeredis.aioredis.FakeRedis(decode_responses=True)
+    backend._script = backend._redis.register_script(RedisBackend.SCRIPT)
+    return RateLimiter(backend, LIMITS)
+
+
+@pytest.fixture(params=[_memory, _redis], ids=['memory', 'redis'])
+def limiter(request) -> RateLimiter:
+    return request.param()
+
+
+def test_hit_consumes_until_the_bucket_is_empty(limiter):
+    async def scenario():
+        assert [await limiter.hit('react', 1) for _ in range(3)] == [0, 0, 0]
+        assert 19 < await limiter.hit('react', 1) <= 20
+        # Buckets are per user and per action.
+        assert await limiter.hit('react', 2) == 0
+        assert await limiter.hit('confess', 1) == 0
+
+    asyncio.run(scenario())
+
+
+def test_check_leaves_the_token(limiter):
+    async def scenario():
+        for _ in range(5):
+            assert await limiter.check('confess', 1) == 0
+        assert await limiter.hit('confess', 1) == 0
+        assert 299 < await limiter.check('confess', 1) <= 300
+        assert 299 < await limiter.hit('confess', 1) <= 300
+
+    asyncio.run(scenario())
+
+
+def test_check_does_not_create_redis_keys():
+    async def scenario():
+        limiter = _redis()
+        await limiter.check('confess', 1)
+        assert await limiter.backend._redis.keys('*') == []
+        await limiter.hit('confess', 1)
+        assert await limiter.backend._redis.keys('*') == ['ratelimit:confess:1']
+
+    asyncio.run(scenario())
+
+
+def test_middleware_only_checks_when_the_handler_does_not_consume():
+    from aiogram.dispatcher.handler import current_handler
+    from ratelimit import RateLimitMiddleware, rate_limit
+
+    @rate_limit('confess', consume=False)
+    async def cmd_confess(m):
+        pass
+
+    @rate_limit('confess')
+    async def confess_now(m):
+        pass
+
+    async def scenario():
+        limiter = _memory()
+        middleware = RateLimitMiddleware(limiter)
+        current_handler.set(cmd_confess)
+        assert await middleware._limited(1) is None
+        assert await middleware._limited(1) is None
+        current_handler.set(confess_now)
+        assert await middleware._limited(1) is None
+        current_handler.set(cmd_confess)
+        action, wait = await middleware._limited(1)
+        assert action == 'confess' and 299 < wait <= 300
+        assert _rejection(action, wait) == "Please wait 5m 0s before confessing again."
+
+    asyncio.run(scenario())
+
+
+def test_flood_gets_one_queued_reply_per_refill(monkeypatch):
+    from types import SimpleNamespace
+
+    from aiogram.dispatcher.handler import CancelHandler, current_handler
+    import ratelimit
+    from ratelimit import RateLimitMiddleware, rate_limit
+
+    sent = []
+
+    async def send(priority, chat_id, call, /, *args, **kwargs):
+        sent.append((priority, chat_id, call, args))
+
+    @rate_limit('confess')
+    async def confess_now(m):
+        pass
+
+    async def reply(text):
+        raise AssertionError("replies must go through the outbound queue")
+
+    clock = [1000.0]
+    monkeypatch.setattr(ratelimit, 'send', send)
+    monkeypatch.setattr(ratelimit, 'time', SimpleNamespace(monotonic=lambda: clock[0]))
+    message = SimpleNamespace(from_user=SimpleNamespace(id=5), chat=SimpleNamespace(id=5), reply=reply)
+
+    async def scenario():
+        middleware = RateLimitMiddleware(RateLimiter(MemoryBackend(max_keys=100), LIMITS))
+        current_handler.set(confess_now)
+        await middleware.on_process_message(message, {})
+        assert sent == []
+        for _ in range(20):
+            with pytest.raises(CancelHandler):
+                await middleware.on_process_message(message, {})
+        assert [(p, chat_id, call) for p, chat_id, call, _ in sent] == [(ratelimit.USER_REPLY, 5, reply)]
+        assert sent[0][3][0].startswith("Please wait")
+
+        # Quiet until the bucket refilled; then the next flood gets one reply again.
+        clock[0] += 299
+        with pytest.raises(CancelHandler):
+            await middleware.on_process_message(message, {})
+        assert len(sent) == 1
+        clock[0] += 2
+        await middleware.on_process_message(message, {})
+        for _ in range(5):
+            with pytest.raises(CancelHandler):
+                await middleware.on_process_message(message, {})
+        assert len(sent) == 2
+
+    asyncio.run(scenario())
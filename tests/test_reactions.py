@@ -0,0 +1,53 @@
+import json
+
+import pytest
+
+import reactions
+
+
+@pytest.fixture
+def spool(tmp_path, monkeypatch):
+    base = str(tmp_path / 'reactions.spool')
+    monkeypatch.setattr(reactions, 'REACTION_SPOOL_FILE', base)
+    monkeypatch.setattr(reactions, '_pending', reactions.OrderedDict())
+    monkeypatch.setattr(reactions, '_seen', reactions.OrderedDict())
+    monkeypatch.setattr(reactions, '_spooled', False)
+
+    def write(suffix, *keys):
+        with open(base + suffix, 'w', encoding='utf-8') as f:
+            for key in keys:
+                f.write(json.dumps(key) + '\n')
+
+    return tmp_path, base, write
+
+
+def test_spools_of_every_worker_are_replayed_by_worker_0(spool, monkeypatch):
+    tmp_path, base, write = spool
+    write('', [1, 10, 'support'])       # left by main.py
+    write('.0', [2, 20, 'relatable'])
+    write('.3', [3, 30, 'support'])      # WEBHOOK_WORKERS was 4, now 2
+    write('.bak', [4, 40, 'support'])    # not a spool
+
+    reactions.gather_spools(base + '.0')
+    assert sorted(p.name for p in tmp_path.iterdir()) == ['reactions.spool.0', 'reactions.spool.bak']
+
+    monkeypatch.setattr(reactions, 'spool_file', base + '.0')
+    reactions._load_spool()
+    assert sorted(reactions._pending) == [(1, 10, 'support'), (2, 20, 'relatable'), (3, 30, 'support')]
+
+
+def test_main_picks_up_the_webhook_spools(spool, monkeypatch):
+    tmp_path, base, write = spool
+    write('.1', [5, 50, 'support'])
+
+    reactions.gather_spools(base)
+    monkeypatch.setattr(reactions, 'spool_file', base)
+    reactions._load_spool()
+    assert list(reactions._pending) == [(5, 50, 'support')]
+    assert [p.name for p in tmp_path.iterdir()] == ['reactions.spool']
+
+
+def test_nothing_to_gather(spool):
+    tmp_path, base, _ = spool
+    reactions.gather_spools(base + '.0')
+    assert list(tmp_path.iterdir()) == []
@@ -0,0 +1,108 @@
+import asyncio
+import time
+
+import fakeredis
+import pytest
+from aiogram.contrib.fsm_storage.memory import MemoryStorage
+
+import storage
+from storage import SharedRedisStorage, create_storage
+
+
+def _storage(server: fakeredis.FakeServer, **kwargs) -> SharedRedisStorage:
+    """A SharedRedisStorage whose client talks to an in-process fake server."""
+    s = SharedRedisStorage('redis://localhost:6379/0', **kwargs)
+    s._redis = fakeredis.aioredis.FakeRedis(server=server, decode_responses=True)
+    return s
+
+
+def test_state_and_data_round_trip():
+    async def scenario():
+        s = _storage(fakeredis.FakeServer())
+        assert await s.get_state(chat=1, user=2) is None
+        assert await s.get_data(chat=1, user=2) == {}
+
+        await s.set_state(chat=1, user=2, state='Confess:text')
+        await s.set_data(chat=1, user=2, data={'category': 'Work'})
+        assert await s.get_state(chat=1, user=2) == 'Confess:text'
+        assert await s.get_data(chat=1, user=2) == {'category': 'Work'}
+        # Other conversations are untouched.
+        assert await s.get_state(chat=1, user=3) is None
+
+        await s.update_data(chat=1, user=2, data={'confession_id': 7}, page=2)
+        assert await s.get_data(chat=1, user=2) == {'category': 'Work', 'confession_id': 7, 'page': 2}
+
+        await s.reset_state(chat=1, user=2, with_data=True)
+        assert await s.get_state(chat=1, user=2) is None
+        assert await s.get_data(chat=1, user=2) == {}
+
+    asyncio.run(scenario())
+
+
+def test_state_is_shared_between_instances():
+    async def scenario():
+        server = fakeredis.FakeServer()
+        first, second = _storage(server), _storage(server)
+        await first.set_state(chat=1, user=1, state='Comment:text')
+        assert await second.get_state(chat=1, user=1) == 'Comment:text'
+
+    asyncio.run(scenario())
+
+
+def test_concurrent_update_data_keeps_every_key():
+    async def scenario():
+        server = fakeredis.FakeServer()
+        workers = [_storage(server), _storage(server)]
+        await asyncio.gather(*(
+            workers[i % 2].update_data(chat=1, user=1, data={f'key{i}': i})
+            for i in range(20)
+        ))
+        assert await workers[0].get_data(chat=1, user=1) == {f'key{i}': i for i in range(20)}
+
+    asyncio.run(scenario())
+
+
+def test_update_data_to_empty_deletes_the_key():
+    async def scenario():
+        s = _storage(fakeredis.FakeServer())
+        await s.update_data(chat=1, user=1)
+        assert await s._redis.keys('*') == []
+
+    asyncio.run(scenario())
+
+
+def test_ttl_is_applied_and_expires():
+    async def scenario():
+        s = _storage(fakeredis.FakeServer(), state_ttl=60, data_ttl=60)
+        await s.set_state(chat=1, user=1, state='Confess:text')
+        await s.update_data(chat=1, user=1, data={'category': 'Work'})
+        for key in await s._redis.keys('*'):
+            assert 0 < await s._redis.ttl(key) <= 60
+
+        s = _storage(fakeredis.FakeServer(), state_ttl=1, data_ttl=1)
+        await s.set_state(chat=1, user=1, state='Confess:text')
+        await s.update_data(chat=1, user=1, data={'category': 'Work'})
+        time.sleep(1.1)
+        assert await s.get_state(chat=1, user=1) is None
+        assert await s.get_data(chat=1, user=1) == {}
+
+    asyncio.run(scenario())
+
+
+def test_create_storage_memory(monkeypatch):
+    monkeypatch.setattr(storage, 'FSM_STORAGE', 'memory')
+    assert isinstance(create_storage(), MemoryStorage)
+
+
+def test_create_storage_redis(monkeypatch):
+    monkeypatch.setattr(storage, 'FSM_STORAGE', 'redis')
+    monkeypatch.setattr(storage, 'FSM_TTL', 120)
+    s = create_storage()
+    assert isinstance(s, SharedRedisStorage)
+    assert (s._state_ttl, s._data_ttl) == (120, 120)
+
+
+def test_create_storage_unknown_backend(monkeypatch):
+    monkeypatch.setattr(storage, 'FSM_STORAGE', 'memcached')
+    with pytest.raises(RuntimeError, match="Unknown FSM_STORAGE: 'memcached'"):
+        create_storage()